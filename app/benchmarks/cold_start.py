@@ -0,0 +1,161 @@
+"""
+Cold start benchmark of the Lambda handler.
+
+Every run starts a fresh Python process that imports lambda_handler (as Lambda does on a cold start)
+and sends it a first /predict request through Mangum, with an API Gateway (HTTP API) event.
+It reports the import time, the first request latency (model load included) and the latency of a second,
+warm, request, and exits with an error if the slowest run goes over the budgets, or if serving the first request
+imported any of the training-only modules: the model is loaded through XGBoost's library (see latam.booster),
+never through the xgboost package, which imports pandas, SciPy and scikit-learn.
+
+    cd app && python benchmarks/cold_start.py --runs 5 --import-budget-ms 1000 --first-request-budget-ms 500
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAYER_DIR = os.path.join(APP_DIR, 'latam-layer')
+
+IMPORT_BUDGET_MS = 1000
+# Mostly loading XGBoost's library and deserializing the model. The baseline, which imported the xgboost package
+# (and pandas, SciPy and scikit-learn with it) on the first request, took 1.4-1.7 s.
+FIRST_REQUEST_BUDGET_MS = 500
+
+# Modules only the training pipeline needs. Importing the handler and serving the first request must not import them.
+TRAINING_MODULES = ['pandas', 'scipy', 'sklearn', 'xgboost']
+
+SAMPLE_FLIGHT = {
+    "Fecha-I": "2017-01-01 23:30:00",
+    "Vlo-I": "226",
+    "Ori-I": "SCEL",
+    "Des-I": "KMIA",
+    "Emp-I": "AAL",
+    "DIA": 1,
+    "MES": 1,
+    "AÑO": 2017,
+    "TIPOVUELO": "I",
+    "OPERA": "American Airlines",
+    "SIGLAORI": "Santiago",
+    "SIGLADES": "Miami",
+}
+
+
+def http_api_event(method: str, path: str, body: dict = None) -> dict:
+    return {
+        "version": "2.0",
+        "routeKey": "$default",
+        "rawPath": path,
+        "rawQueryString": "",
+        "headers": {"content-type": "application/json", "host": "localhost"},
+        "requestContext": {
+            "accountId": "local",
+            "apiId": "local",
+            "domainName": "localhost",
+            "domainPrefix": "localhost",
+            "http": {"method": method, "path": path, "protocol": "HTTP/1.1", "sourceIp": "127.0.0.1", "userAgent": "cold-start"},
+            "requestId": "cold-start",
+            "routeKey": "$default",
+            "stage": "$default",
+            "time": "01/Jan/2017:00:00:00 +0000",
+            "timeEpoch": 0,
+        },
+        "body": json.dumps(body) if body is not None else "",
+        "isBase64Encoded": False,
+    }
+
+
+def measure() -> dict:
+    """
+    Runs in the fresh process, must be called before anything else is imported.
+    """
+    start = time.perf_counter()
+    from lambda_handler import handler
+    import_time = time.perf_counter() - start
+
+    event = http_api_event("POST", "/predict", SAMPLE_FLIGHT)
+    start = time.perf_counter()
+    response = handler(event, None)
+    first_request_time = time.perf_counter() - start
+    training_modules = [module for module in TRAINING_MODULES if module in sys.modules]
+
+    start = time.perf_counter()
+    handler(event, None)
+    warm_request_time = time.perf_counter() - start
+
+    return {
+        "import_ms": import_time * 1000,
+        "first_request_ms": first_request_time * 1000,
+        "warm_request_ms": warm_request_time * 1000,
+        "status_code": response["statusCode"],
+        "training_modules": training_modules,
+    }
+
+
+def run_once() -> dict:
+    # The layer is importable as in Lambda, where it's mounted under /opt.
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([APP_DIR, LAYER_DIR]))
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child'],
+        cwd=APP_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Cold start benchmark of the Lambda handler.")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--import-budget-ms', type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument('--first-request-budget-ms', type=float, default=FIRST_REQUEST_BUDGET_MS)
+    parser.add_argument('--output', help="JSON file to write the results to.")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure()))
+        return 0
+
+    runs = [run_once() for _ in range(args.runs)]
+    for run in runs:
+        print(
+            f"import {run['import_ms']:8.1f} ms   first request {run['first_request_ms']:8.1f} ms   "
+            f"warm request {run['warm_request_ms']:6.1f} ms   status {run['status_code']}"
+        )
+
+    failures = []
+    worst_import = max(run['import_ms'] for run in runs)
+    worst_first_request = max(run['first_request_ms'] for run in runs)
+    if worst_import > args.import_budget_ms:
+        failures.append(f"import took {worst_import:.1f} ms, budget is {args.import_budget_ms:.0f} ms")
+    if worst_first_request > args.first_request_budget_ms:
+        failures.append(f"first request took {worst_first_request:.1f} ms, budget is {args.first_request_budget_ms:.0f} ms")
+    if any(run['status_code'] != 200 for run in runs):
+        failures.append("first request failed")
+    training_modules = sorted({module for run in runs for module in run['training_modules']})
+    if training_modules:
+        failures.append(f"serving the first request imported training-only modules: {training_modules}")
+
+    if args.output is not None:
+        # Imported here, so that the measured processes don't import it.
+        from common import write_results
+        config = {key: value for key, value in vars(args).items() if key not in ('output', 'child')}
+        results = {
+            "import_ms": worst_import,
+            "first_request_ms": worst_first_request,
+            "runs": runs,
+            "failures": failures,
+        }
+        write_results("cold_start", config, results, args.output)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print(f"OK: cold start within budget (import {worst_import:.1f} ms, first request {worst_first_request:.1f} ms)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
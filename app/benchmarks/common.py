@@ -0,0 +1,69 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from typing import List
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAYER_DIR = os.path.join(APP_DIR, 'latam-layer')
+DATA_DIR = os.path.join(LAYER_DIR, 'latam', 'data')
+
+# The benchmarks run from the repo, with the app and the Lambda Layer importable as they are when deployed.
+for path in (APP_DIR, LAYER_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def latency_summary(latencies: List[float]) -> dict:
+    """
+    Summary of a list of latencies (in seconds), in milliseconds.
+    """
+    latencies = np.asarray(latencies) * 1000
+    if len(latencies) == 0:
+        return {}
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "mean_ms": round(float(latencies.mean()), 4),
+        "min_ms": round(float(latencies.min()), 4),
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+        "max_ms": round(float(latencies.max()), 4),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata() -> dict:
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_results(benchmark: str, config: dict, results: dict, output: str = None) -> dict:
+    """
+    Prints the results of a benchmark and writes them as JSON to `output`, to compare them between commits
+    (see compare.py).
+    """
+    report = {"benchmark": benchmark, "metadata": metadata(), "config": config, "results": results}
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if output is not None:
+        with open(output, 'w') as file:
+            file.write(text + "\n")
+    return report
@@ -0,0 +1,67 @@
+"""
+Compares the JSON results of two runs of a benchmark (e.g., from two commits) and exits with an error
+if any metric regressed more than `threshold` percent. Throughputs (`*_per_s`, `*_rps`) regress when
+they go down, every other timing when it goes up.
+
+    cd app && python benchmarks/compare.py baseline.json current.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+# Only these metrics are compared, the rest (max, mean, counts) are too noisy or not timings.
+COMPARED_METRICS = ['p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'flights_per_s', 'rows_per_s', 'import_ms', 'first_request_ms']
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    metrics = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            metrics.update(flatten(value, name))
+        elif key in COMPARED_METRICS and isinstance(value, (int, float)):
+            metrics[name] = value
+    return metrics
+
+
+def higher_is_better(metric: str) -> bool:
+    return metric.endswith('_per_s') or metric.endswith('_rps')
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compares the results of two benchmark runs.")
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=10.0, help="Regression threshold, in percent.")
+    args = parser.parse_args()
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+    if baseline["benchmark"] != current["benchmark"]:
+        raise Exception(f"Can't compare a {baseline['benchmark']} benchmark with a {current['benchmark']} one.")
+
+    baseline_metrics, current_metrics = flatten(baseline["results"]), flatten(current["results"])
+    print(f"{baseline['benchmark']}: {baseline['metadata']['commit']} -> {current['metadata']['commit']}")
+    print(f"{'metric':<40}{'baseline':>14}{'current':>14}{'change':>10}")
+
+    regressions = []
+    for metric, before in baseline_metrics.items():
+        if metric not in current_metrics:
+            continue
+        after = current_metrics[metric]
+        change = (after - before) / before * 100 if before else 0.0
+        regressed = -change > args.threshold if higher_is_better(metric) else change > args.threshold
+        if regressed:
+            regressions.append(metric)
+        print(f"{metric:<40}{before:>14.3f}{after:>14.3f}{change:>9.1f}%{'  REGRESSION' if regressed else ''}")
+
+    if regressions:
+        print(f"{len(regressions)} metrics regressed more than {args.threshold}%")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Synthetic flights for the benchmarks.
+
+Categorical values are drawn from the categories known by the target encoding, plus a share of unseen ones,
+so that requests go through the same code paths as real traffic.
+"""
+import pickle
+from datetime import datetime, timedelta
+from typing import List
+import numpy as np
+import pandas as pd
+from common import DATA_DIR
+from interfaces import Flight
+
+CATEGORICAL_ENCODER_FILE = f"{DATA_DIR}/categorical_encoder.pickle"
+
+FIRST_DATE = datetime(2017, 1, 1)
+MINUTES_IN_YEAR = 365 * 24 * 60
+
+
+class FlightGenerator:
+    """
+    Generates flights following the fields of interfaces.Flight (the body of /predict),
+    or whole raw datasets (the columns of dataset.csv) for the pre-processing pipeline.
+    """
+
+    def __init__(self, seed: int = 42, unseen_ratio: float = 0.01, encoding_file: str = CATEGORICAL_ENCODER_FILE) -> None:
+        self.rng = np.random.default_rng(seed)
+        self.unseen_ratio = unseen_ratio
+        with open(encoding_file, 'rb') as file:
+            cat_encoding_map = pickle.load(file)
+        self.categories = {column: [str(value) for value in encoder] for column, encoder in cat_encoding_map.items()}
+
+    def _category(self, column: str) -> str:
+        if self.rng.random() < self.unseen_ratio:
+            return f"UNSEEN-{self.rng.integers(1000)}"
+        values = self.categories[column]
+        return values[self.rng.integers(len(values))]
+
+    def flight(self) -> dict:
+        """
+        Body of a /predict request, validated against interfaces.Flight.
+        """
+        date = FIRST_DATE + timedelta(minutes=int(self.rng.integers(MINUTES_IN_YEAR)))
+        destination = self.rng.integers(len(self.categories["Des-I"]))
+        airline = self.rng.integers(len(self.categories["Emp-I"]))
+        flight = {
+            "Fecha-I": date.strftime('%Y-%m-%d %H:%M:%S'),
+            "Vlo-I": self._category("Vlo-I"),
+            "Ori-I": self._category("Ori-I"),
+            "Des-I": self.categories["Des-I"][destination],
+            "Emp-I": self.categories["Emp-I"][airline],
+            "DIA": date.day,
+            "MES": date.month,
+            "AÑO": date.year,
+            "TIPOVUELO": self._category("TIPOVUELO"),
+            "OPERA": self.categories["OPERA"][airline % len(self.categories["OPERA"])],
+            "SIGLAORI": self._category("SIGLAORI"),
+            "SIGLADES": self.categories["SIGLADES"][destination % len(self.categories["SIGLADES"])],
+        }
+        # Fails if interfaces.Flight changed and the generator wasn't updated.
+        Flight.model_validate(flight)
+        return flight
+
+    def flights(self, n: int) -> List[dict]:
+        return [self.flight() for _ in range(n)]
+
+    def dataset(self, n: int) -> pd.DataFrame:
+        """
+        Raw dataset with the columns of dataset.csv, as read by pd.read_csv.
+        Delays follow a normal distribution with a long right tail clipped at 160 minutes.
+        """
+        dates = pd.Timestamp(FIRST_DATE) + pd.to_timedelta(self.rng.integers(0, MINUTES_IN_YEAR, n), unit='m')
+        delays = np.clip(self.rng.normal(9, 20, n).round(), -15, 160).astype(int)
+        operation_dates = dates + pd.to_timedelta(delays, unit='m')
+        flight_numbers = self.rng.choice(self.categories["Vlo-I"], n)
+        destinations = self.rng.integers(0, len(self.categories["Des-I"]), n)
+        airlines = self.rng.integers(0, len(self.categories["Emp-I"]), n)
+
+        def pick(column: str, indices: np.ndarray) -> np.ndarray:
+            values = np.array(self.categories[column], dtype=object)
+            return values[indices % len(values)]
+
+        return pd.DataFrame({
+            'Fecha-I': dates.strftime('%Y-%m-%d %H:%M:%S'),
+            'Vlo-I': flight_numbers,
+            'Ori-I': pick("Ori-I", np.zeros(n, dtype=int)),
+            'Des-I': pick("Des-I", destinations),
+            'Emp-I': pick("Emp-I", airlines),
+            'Fecha-O': operation_dates.strftime('%Y-%m-%d %H:%M:%S'),
+            'Vlo-O': flight_numbers,
+            'Ori-O': pick("Ori-I", np.zeros(n, dtype=int)),
+            'Des-O': pick("Des-I", destinations),
+            'Emp-O': pick("Emp-I", airlines),
+            'DIA': dates.day,
+            'MES': dates.month,
+            'AÑO': dates.year,
+            'DIANOM': dates.day_name(),
+            'TIPOVUELO': self.rng.choice(self.categories["TIPOVUELO"], n),
+            'OPERA': pick("OPERA", airlines),
+            'SIGLAORI': pick("SIGLAORI", np.zeros(n, dtype=int)),
+            'SIGLADES': pick("SIGLADES", destinations),
+        })
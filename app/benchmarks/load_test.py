@@ -0,0 +1,154 @@
+"""
+Load test of the prediction API.
+
+Sends synthetic flights (see flights.py) to /predict (or /predict/batch) from `concurrency` concurrent clients,
+until `requests` requests were sent or `duration` seconds went by, and reports the throughput and latency
+percentiles. The API runs either in-process (the ASGI app driven through httpx, without network)
+or as a local server: uvicorn (--workers processes loading their own model) or serve.py (prefork workers sharing it).
+
+    cd app && python benchmarks/load_test.py --mode inprocess --requests 5000 --concurrency 32
+    cd app && python benchmarks/load_test.py --mode uvicorn --duration 45 --requests 50000 --concurrency 64 --output load.json
+    cd app && python benchmarks/load_test.py --mode prefork --workers 4 --requests 50000 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+import httpx
+from common import APP_DIR, LAYER_DIR, latency_summary, write_results
+from flights import FlightGenerator
+
+# Distinct request bodies generated up front and cycled through, so that generating them isn't measured.
+DISTINCT_PAYLOADS = 1000
+SERVER_START_TIMEOUT = 60
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def inprocess_client(concurrency: int):
+    from main import app
+    # The lifespan isn't run by httpx, it's entered here as a server would.
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://inprocess") as client:
+            yield client
+
+
+@asynccontextmanager
+async def server_client(mode: str, concurrency: int, workers: int):
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([APP_DIR, LAYER_DIR]))
+    if mode == 'prefork':
+        command = [sys.executable, 'serve.py']
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'main:app', '--no-access-log']
+    server = subprocess.Popen(
+        command + ['--host', '127.0.0.1', '--port', str(port), '--workers', str(workers), '--log-level', 'warning'],
+        cwd=APP_DIR, env=env,
+    )
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30) as client:
+            deadline = time.monotonic() + SERVER_START_TIMEOUT
+            while True:
+                if server.poll() is not None:
+                    raise Exception(f"The server exited with code {server.returncode}")
+                try:
+                    if (await client.get("/status")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise Exception(f"The server didn't start in {SERVER_START_TIMEOUT}s")
+                await asyncio.sleep(0.1)
+            yield client
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def run_load(client: httpx.AsyncClient, path: str, payloads: list, requests: int, duration: float, concurrency: int) -> dict:
+    latencies, errors = [], 0
+    sent = 0
+    deadline = time.perf_counter() + duration if duration else None
+
+    async def worker():
+        nonlocal sent, errors
+        while sent < requests and (deadline is None or time.perf_counter() < deadline):
+            payload = payloads[sent % len(payloads)]
+            sent += 1
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=payload)
+                failed = response.status_code != 200
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency": latency_summary(latencies),
+    }
+
+
+async def main_async(args) -> dict:
+    generator = FlightGenerator(seed=args.seed)
+    if args.batch_size > 1:
+        path = "/predict/batch"
+        payloads = [generator.flights(args.batch_size) for _ in range(DISTINCT_PAYLOADS)]
+    else:
+        path = "/predict"
+        payloads = generator.flights(DISTINCT_PAYLOADS)
+
+    if args.mode == 'inprocess':
+        client_context = inprocess_client(args.concurrency)
+    else:
+        client_context = server_client(args.mode, args.concurrency, args.workers)
+
+    async with client_context as client:
+        if args.warmup:
+            await run_load(client, path, payloads, args.warmup, None, args.concurrency)
+        results = await run_load(client, path, payloads, args.requests, args.duration, args.concurrency)
+
+    results["flights_per_s"] = round(results["throughput_rps"] * args.batch_size, 2)
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test of the prediction API.")
+    parser.add_argument('--mode', choices=['inprocess', 'uvicorn', 'prefork'], default='inprocess')
+    parser.add_argument('--requests', type=int, default=2000, help="Requests to send (after the warmup).")
+    parser.add_argument('--duration', type=float, default=None, help="Stop after this many seconds, even if requests remain.")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--batch-size', type=int, default=1, help="Flights per request, more than 1 uses /predict/batch.")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes of the server.")
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="JSON file to write the results to.")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    config = {key: value for key, value in vars(args).items() if key != 'output'}
+    write_results("load_test", config, results, args.output)
+    return 1 if results["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Micro-benchmarks of the stages of the pipeline, over a synthetic raw dataset (see flights.py):
+SyntheticFeatures.compute, Dataset.clean, Dataset.encode (fitting and applying the target encoding)
+and Model.predict, plus the serving path (OnlineFeaturizer and FastPredictor) one flight at a time.
+
+    cd app && python benchmarks/pipeline.py --rows 50000 --repeats 5 --output pipeline.json
+"""
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+import time
+from typing import Callable
+from common import DATA_DIR, latency_summary, write_results
+from flights import FlightGenerator
+from latam.dataset import Dataset
+from latam.featurizer import OnlineFeaturizer
+from latam.booster import Booster, FastPredictor
+from latam.model import Model
+from latam.synthetic_features import SyntheticFeatures
+
+SERVING_FLIGHTS = 1000
+
+
+def summarize(timings: list, rows: int) -> dict:
+    summary = latency_summary(timings)
+    summary["rows"] = rows
+    summary["rows_per_s"] = round(rows / (summary["p50_ms"] / 1000), 2)
+    return summary
+
+
+def benchmark(function: Callable, repeats: int, setup: Callable = None, rows: int = 1) -> dict:
+    """
+    Times `function` `repeats` times. The result of `setup` (not timed) is passed to every call.
+    """
+    timings = []
+    for _ in range(repeats):
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        function(argument) if setup is not None else function()
+        timings.append(time.perf_counter() - start)
+    return summarize(timings, rows)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the stages of the pipeline.")
+    parser.add_argument('--rows', type=int, default=50_000)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="JSON file to write the results to.")
+    args = parser.parse_args()
+
+    generator = FlightGenerator(seed=args.seed)
+    raw = generator.dataset(args.rows)
+    with open(os.path.join(DATA_DIR, 'categorical_encoder.pickle'), 'rb') as file:
+        cat_encoding_map = pickle.load(file)
+    model = Model()
+    model.load(os.path.join(DATA_DIR, 'model.bin'))
+
+    def clean_dataset() -> Dataset:
+        ds = Dataset(dataset=raw.copy())
+        ds.clean()
+        return ds
+
+    cleaned = clean_dataset()
+    cleaned.encode(cat_encoding_map=cat_encoding_map)
+    X, _ = cleaned.split_target()
+    encoding_file = os.path.join(tempfile.mkdtemp(), 'categorical_encoder.pickle')
+
+    def fit_encoding(ds: Dataset) -> None:
+        if os.path.exists(encoding_file):
+            os.remove(encoding_file)
+        ds.encode(encoding_file)
+
+    results = {
+        "synthetic_features": benchmark(lambda: SyntheticFeatures(raw).compute(), args.repeats, rows=len(raw)),
+        "clean": benchmark(lambda ds: ds.clean(), args.repeats, lambda: Dataset(dataset=raw.copy()), rows=len(raw)),
+        "encode_fit": benchmark(fit_encoding, args.repeats, clean_dataset, rows=len(cleaned.dataset)),
+        "encode": benchmark(
+            lambda ds: ds.encode(cat_encoding_map=cat_encoding_map), args.repeats, clean_dataset, rows=len(cleaned.dataset),
+        ),
+        "predict": benchmark(lambda: Model.predict(model.model, X), args.repeats, rows=len(X)),
+    }
+
+    # Serving path: one flight at a time, as the API does.
+    flights = generator.flights(SERVING_FLIGHTS)
+    featurizer = OnlineFeaturizer(cat_encoding_map)
+    with open(os.path.join(DATA_DIR, 'model.bin'), 'rb') as file:
+        predictor = FastPredictor(Booster(file.read()))
+    features = featurizer.transform_many(flights)
+
+    def per_flight(function: Callable, items) -> dict:
+        timings = []
+        for item in items:
+            start = time.perf_counter()
+            function(item)
+            timings.append(time.perf_counter() - start)
+        return summarize(timings, rows=1)
+
+    results["serving_featurizer"] = per_flight(featurizer.transform, flights)
+    results["serving_predict"] = per_flight(lambda row: predictor.predict(row[None, :]), features)
+
+    config = {key: value for key, value in vars(args).items() if key != 'output'}
+    write_results("pipeline", config, results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,362 @@
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Mapping
+from datetime import datetime
+from hashlib import sha256
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+from latam.features import FEATURE_COLUMNS, UNSEEN_CATEGORY_VALUE
+
+# Binary artifact bundling what serving needs: the model (as saved by XGBoost),
+# the target encoding of every categorical column as sorted arrays, the order of the features and a hash of it.
+#
+# Layout: MAGIC, the format version (uint32), the length of the header (uint64), the header (UTF-8 JSON)
+# and the sections, each aligned to SECTION_ALIGNMENT bytes. The header describes where every section
+# starts, its dtype and shape, so that arrays are read straight from a memory map of the file, without copies.
+MAGIC = b'LATAMART'
+FORMAT_VERSION = 1
+SECTION_ALIGNMENT = 64
+ARTIFACT_SUFFIX = '.artifact'
+
+_PREAMBLE = struct.Struct('<8sIQ')
+
+
+def schema_hash(feature_columns: List[str] = FEATURE_COLUMNS) -> str:
+    """
+    Hash of the order of the features, which the model and the featurizer must agree on.
+    """
+    return sha256(json.dumps(feature_columns).encode()).hexdigest()[:16]
+
+
+def write_sections(path: str, magic: bytes, format_version: int, header: dict, sections: Dict[str, np.ndarray]) -> None:
+    """
+    Writes a file with the layout of the artifacts: the preamble, the header (to which the layout of the sections
+    is added) and the arrays of `sections`. The file is written to a temporary file and renamed, never in place.
+    """
+    layout, offset = {}, 0
+    for name, array in sections.items():
+        offset += -offset % SECTION_ALIGNMENT
+        layout[name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        offset += array.nbytes
+
+    header_bytes = json.dumps({**header, 'sections': layout}, ensure_ascii=False).encode()
+    start = _PREAMBLE.size + len(header_bytes)
+    start += -start % SECTION_ALIGNMENT
+
+    temporary = f"{path}.tmp{os.getpid()}"
+    with open(temporary, 'wb') as file:
+        file.write(_PREAMBLE.pack(magic, format_version, len(header_bytes)))
+        file.write(header_bytes)
+        for name, array in sections.items():
+            file.seek(start + layout[name]['offset'])
+            file.write(np.ascontiguousarray(array).tobytes())
+    os.replace(temporary, path)
+
+
+def read_sections(path: str, magic: bytes, format_version: int, access: int = mmap.ACCESS_READ):
+    """
+    Maps a file written by write_sections into memory. Returns its header and its arrays, views of the memory map
+    (read-only, unless `access` is mmap.ACCESS_COPY, whose writes stay private to the process).
+    """
+    with open(path, 'rb') as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=access)
+
+    file_magic, file_format_version, header_length = _PREAMBLE.unpack_from(buffer)
+    if file_magic != magic:
+        raise Exception(f"{path} is not a {magic.decode()} file")
+    if file_format_version != format_version:
+        raise Exception(f"{path} has format version {file_format_version}, only version {format_version} can be read")
+    header = json.loads(buffer[_PREAMBLE.size:_PREAMBLE.size + header_length])
+
+    start = _PREAMBLE.size + header_length
+    start += -start % SECTION_ALIGNMENT
+    sections = {}
+    for name, section in header['sections'].items():
+        dtype = np.dtype(section['dtype'])
+        count = math.prod(section['shape'])
+        array = np.frombuffer(buffer, dtype=dtype, count=count, offset=start + section['offset'])
+        sections[name] = array.reshape(section['shape'])
+    return header, sections
+
+
+def _encode_key(cat_value) -> Optional[bytes]:
+    # Categories are stored as UTF-8 bytes tagged with their type: encoding maps fitted on CSV files
+    # may hold the same flight number both as int and as str, with different encodings.
+    if isinstance(cat_value, (bool, np.bool_)):
+        return None
+    if isinstance(cat_value, str):
+        return b's' + cat_value.encode()
+    if isinstance(cat_value, (int, np.integer)):
+        return b'i' + str(int(cat_value)).encode()
+    return None
+
+
+def _decode_key(key: bytes):
+    return int(key[1:]) if key[:1] == b'i' else key[1:].decode()
+
+
+class EncodingTable(Mapping):
+    """
+    Target encoding of a categorical column as two arrays: the sorted (tagged) categories and their encodings.
+    The arrays can live in a memory map, so loading a table costs nothing. Batches of values are encoded
+    with a binary search (encode), and single lookups (e.g., by latam.features.lookup_encoding) go through
+    a dict built on first use, as fast as the plain dicts the tables replace.
+    """
+
+    def __init__(self, keys: np.ndarray, values: np.ndarray) -> None:
+        self.keys = keys
+        self.values = values
+        self._index = None
+
+    @classmethod
+    def from_dict(cls, target_encoder: dict) -> 'EncodingTable':
+        pairs = []
+        for cat_value, encoding in target_encoder.items():
+            key = _encode_key(cat_value)
+            if key is None:
+                raise Exception(f"Category {cat_value!r} can't be stored, categories must be str or int")
+            pairs.append((key, encoding))
+        pairs.sort()
+        keys = np.array([key for key, _ in pairs], dtype=f'S{max([len(key) for key, _ in pairs], default=1)}')
+        values = np.array([encoding for _, encoding in pairs], dtype=np.float64)
+        return cls(keys, values)
+
+    def to_dict(self) -> dict:
+        return {_decode_key(key): float(value) for key, value in zip(self.keys.tolist(), self.values.tolist())}
+
+    def _lookup(self) -> dict:
+        if self._index is None:
+            self._index = dict(zip(self.keys.tolist(), self.values.tolist()))
+        return self._index
+
+    def __getitem__(self, cat_value) -> float:
+        value = self._lookup().get(_encode_key(cat_value))
+        if value is None:
+            raise KeyError(cat_value)
+        return value
+
+    def __contains__(self, cat_value) -> bool:
+        return _encode_key(cat_value) in self._lookup()
+
+    def __iter__(self):
+        return (_decode_key(key) for key in self.keys.tolist())
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def encode(self, cat_values, default: float = UNSEEN_CATEGORY_VALUE) -> np.ndarray:
+        """
+        Encodings of a batch of categories, by exact match (unlike lookup_encoding, an int category
+        doesn't match its str counterpart). Unknown categories get `default`.
+        """
+        if len(self.keys) == 0:
+            return np.full(len(cat_values), default, dtype=np.float64)
+
+        # Keys longer than the stored ones can't match, they're left empty rather than truncated.
+        width = self.keys.dtype.itemsize
+        keys = [_encode_key(cat_value) or b'' for cat_value in cat_values]
+        keys = np.array([key if len(key) <= width else b'' for key in keys], dtype=self.keys.dtype)
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[positions] == keys, self.values[positions], default)
+
+
+class Artifact:
+    """
+    Model and target encodings loaded from (or to be written to) a binary artifact file.
+    `load` maps the file into memory and reads the header only: the encodings and the bytes of the model
+    are views of the memory map, loaded in microseconds and shared by every process mapping the same file.
+
+    Files must be replaced (save writes a temporary file and renames it), never rewritten in place,
+    since processes may still be reading the previous file through their memory map.
+    """
+
+    def __init__(
+            self,
+            encodings: Dict[str, EncodingTable],
+            model_bytes=None,
+            feature_columns: List[str] = FEATURE_COLUMNS,
+            version: str = None,
+            created_at: str = None,
+        ) -> None:
+        self.encodings = encodings
+        self.model_bytes = model_bytes
+        self.feature_columns = feature_columns
+        self.schema_hash = schema_hash(feature_columns)
+        self.version = version
+        self.created_at = created_at
+
+    @classmethod
+    def build(cls, cat_encoding_map: dict, model_bytes: bytes = None, feature_columns: List[str] = FEATURE_COLUMNS) -> 'Artifact':
+        """
+        Artifact of an encoding map (as fitted by Dataset.encode) and, optionally, a model
+        (the content of a file saved by XGBoost, e.g., model.bin).
+        """
+        encodings = {
+            column: target_encoder if isinstance(target_encoder, EncodingTable) else EncodingTable.from_dict(target_encoder)
+            for column, target_encoder in cat_encoding_map.items()
+        }
+        return cls(encodings, bytes(model_bytes) if model_bytes is not None else None, feature_columns)
+
+    @property
+    def cat_encoding_map(self) -> Dict[str, EncodingTable]:
+        return self.encodings
+
+    def _sections(self) -> Dict[str, np.ndarray]:
+        sections = {}
+        if self.model_bytes is not None:
+            sections['model'] = np.frombuffer(self.model_bytes, dtype=np.uint8)
+        for column, table in self.encodings.items():
+            sections[f'encodings.{column}.keys'] = table.keys
+            sections[f'encodings.{column}.values'] = table.values
+        return sections
+
+    def content_version(self) -> str:
+        """
+        Hash of the model, the encodings and the order of the features. It's the version of the artifact,
+        and of the model the registry serves from model.bin and the encoding map, whether it's loaded
+        from an artifact or from those files (the cache and the schedule table are keyed by it).
+        """
+        digest = sha256(self.schema_hash.encode())
+        for name, array in self._sections().items():
+            digest.update(name.encode())
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()[:12]
+
+    def save(self, path: str) -> None:
+        sections = {name: np.ascontiguousarray(array) for name, array in self._sections().items()}
+        self.version = self.content_version()
+        self.created_at = datetime.now().isoformat()
+        header = {
+            'format_version': FORMAT_VERSION,
+            'version': self.version,
+            'created_at': self.created_at,
+            'schema_hash': self.schema_hash,
+            'feature_columns': self.feature_columns,
+            'encoded_columns': list(self.encodings),
+        }
+        write_sections(path, MAGIC, FORMAT_VERSION, header, sections)
+
+    @classmethod
+    def load(cls, path: str, check_schema: bool = True) -> 'Artifact':
+        """
+        Maps the artifact into memory. With `check_schema`, the order of its features must match FEATURE_COLUMNS.
+        """
+        header, sections = read_sections(path, MAGIC, FORMAT_VERSION)
+        if check_schema and header['schema_hash'] != schema_hash():
+            raise Exception(
+                f"{path} was built for the features {header['feature_columns']}, the featurizer produces {FEATURE_COLUMNS}"
+            )
+
+        encodings = {
+            column: EncodingTable(sections[f'encodings.{column}.keys'], sections[f'encodings.{column}.values'])
+            for column in header['encoded_columns']
+        }
+        model = sections.get('model')
+        return cls(
+            encodings,
+            memoryview(model) if model is not None else None,
+            header['feature_columns'],
+            header['version'],
+            header['created_at'],
+        )
+
+
+def save_encodings(cat_encoding_map: dict, path: str) -> None:
+    """
+    Writes an encoding map to an artifact (when the path ends in .artifact) or, as before, to a pickle file.
+    """
+    if Path(path).suffix == ARTIFACT_SUFFIX:
+        Artifact.build(cat_encoding_map).save(path)
+    else:
+        import pickle
+        with open(path, 'wb') as file:
+            pickle.dump(cat_encoding_map, file)
+
+
+def load_encodings(path: str) -> dict:
+    """
+    Reads the encoding map of an artifact (as EncodingTables) or of a pickle file (as dicts).
+    """
+    if Path(path).suffix == ARTIFACT_SUFFIX:
+        return Artifact.load(path).encodings
+    import pickle
+    with open(path, 'rb') as file:
+        return pickle.load(file)
+
+
+def require_pyarrow(path: str) -> None:
+    # pyarrow is optional: only Parquet and Arrow files need it, and it's imported when they're read or written.
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise Exception(f"{path} can't be read or written without pyarrow: {e}")
+
+
+def export_frame(df, path: str) -> None:
+    """
+    Writes a DataFrame to Parquet (.parquet), Arrow IPC (.arrow or .feather) or CSV, depending on the extension.
+    Parquet and Arrow keep the types of the columns (e.g., categories and dates), so reading them back
+    doesn't parse text again. They need pyarrow.
+    """
+    suffix = Path(path).suffix
+    if suffix == '.parquet':
+        require_pyarrow(path)
+        df.to_parquet(path, index=False)
+    elif suffix in ('.arrow', '.feather'):
+        require_pyarrow(path)
+        df.reset_index(drop=True).to_feather(path)
+    else:
+        df.to_csv(path, index=False)
+
+
+def read_frame(path: str):
+    """
+    Reads a DataFrame written by export_frame.
+    """
+    import pandas as pd
+    suffix = Path(path).suffix
+    if suffix == '.parquet':
+        require_pyarrow(path)
+        return pd.read_parquet(path)
+    if suffix in ('.arrow', '.feather'):
+        require_pyarrow(path)
+        return pd.read_feather(path)
+    return pd.read_csv(path)
+
+
+if __name__ == "__main__":
+    # Builds the artifact from a model saved by XGBoost and an encoding map,
+    # and checks that it holds the same encodings and predictions:
+    #   python -m latam.artifact <model.bin> <categorical_encoder.pickle> <model.artifact>
+    import time
+    from latam.booster import Booster, FastPredictor
+    model_file, encoding_file, destination = sys.argv[1], sys.argv[2], sys.argv[3]
+    with open(model_file, 'rb') as file:
+        model_bytes = file.read()
+    cat_encoding_map = load_encodings(encoding_file)
+    Artifact.build(cat_encoding_map, model_bytes).save(destination)
+
+    start = time.perf_counter()
+    artifact = Artifact.load(destination)
+    load_time = time.perf_counter() - start
+
+    for column, target_encoder in cat_encoding_map.items():
+        if artifact.encodings[column].to_dict() != target_encoder:
+            print(f"Encodings of {column} differ")
+            sys.exit(1)
+    predictors = []
+    for model_data in (model_bytes, artifact.model_bytes):
+        predictors.append(FastPredictor(Booster(model_data)))
+    rng = np.random.default_rng(42)
+    X = rng.normal(0, 10, size=(100_000, predictors[0].n_features)).astype(np.float32)
+    X[rng.random(X.shape) < 0.1] = np.nan
+    if not np.array_equal(predictors[0].predict(X), predictors[1].predict(X)):
+        print(f"Predictions of the artifact differ from {model_file}")
+        sys.exit(1)
+    print(f"Built {destination} (version {artifact.version}, {os.path.getsize(destination)} bytes), "
+          f"loaded in {load_time * 1e6:.0f}us, encodings and predictions match")
@@ -0,0 +1,189 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from typing import Callable, List, Optional
+from latam.metrics import metrics, BATCH_SIZE_BUCKETS
+
+# The scheduler is configured through these environment variables.
+# LATAM_BATCHING: 0 scores every request on its own, on the event loop (as before the scheduler).
+# LATAM_BATCH_WINDOW_MS: how long a batch waits for more requests, once other requests are already waiting.
+# LATAM_BATCH_MAX_SIZE: flights scored together, at most.
+BATCHING_ENV = 'LATAM_BATCHING'
+BATCH_WINDOW_ENV = 'LATAM_BATCH_WINDOW_MS'
+BATCH_MAX_SIZE_ENV = 'LATAM_BATCH_MAX_SIZE'
+
+# With no window, a batch takes the requests that queued up while the previous one was being scored,
+# which adds no latency. A window makes batches larger when requests arrive spread out, at the cost of latency.
+DEFAULT_BATCH_WINDOW = 0.0
+DEFAULT_BATCH_MAX_SIZE = 64
+
+
+class MicroBatcher:
+    """
+    Scores the requests that arrive close together as a single batch, in a worker thread,
+    so that the event loop is free to receive (and validate) requests while the model runs,
+    and the per-call overhead of featurizing and scoring is paid once per batch.
+
+    Every request is a list of items (e.g., flights) and `score` maps a list of items to a list of results.
+    Requests queued while a batch is being scored make up the next one. A request waiting alone is scored
+    right away (bypass), the window only applies when other requests were already queued, i.e., under load:
+        - max_wait: seconds a batch waits for more requests. Longer windows give larger batches
+          (more throughput) at the cost of latency.
+        - max_batch_size: items scored together, at most. A request that doesn't fit in a batch starts the next one.
+          Larger requests are scored max_batch_size items at a time, one chunk after the other, so that
+          the requests arriving meanwhile are scored between their chunks instead of waiting for the whole request.
+
+    If a batch fails, its requests are scored one by one, so that a bad request only fails itself.
+    The stages timed while scoring a batch (see latam.metrics) are recorded in every request of the batch.
+    """
+
+    def __init__(
+            self,
+            score: Callable[[list], list],
+            max_batch_size: int = DEFAULT_BATCH_MAX_SIZE,
+            max_wait: float = DEFAULT_BATCH_WINDOW,
+        ) -> None:
+        self.score = score
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self._queue = queue.SimpleQueue()
+        # Request taken from the queue that didn't fit in the previous batch, it starts the next one.
+        self._pending = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, score: Callable[[list], list]) -> Optional['MicroBatcher']:
+        """
+        Scheduler configured by the LATAM_BATCH* environment variables, or None if it's disabled.
+        """
+        if os.environ.get(BATCHING_ENV, '1').lower() in ('0', 'false', 'no', 'off'):
+            return None
+        return cls(
+            score,
+            max_batch_size=int(os.environ.get(BATCH_MAX_SIZE_ENV, DEFAULT_BATCH_MAX_SIZE)),
+            max_wait=float(os.environ.get(BATCH_WINDOW_ENV, DEFAULT_BATCH_WINDOW * 1000)) / 1000,
+        )
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name='latam-batcher', daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def stop(self, timeout: float = None) -> None:
+        """
+        Scores the requests already queued and stops the worker thread.
+        """
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    async def submit_many(self, items: list) -> list:
+        """
+        Results of the items, once the batches they were added to are scored.
+        """
+        if len(items) <= self.max_batch_size:
+            return await self._submit(items)
+        results = []
+        for start in range(0, len(items), self.max_batch_size):
+            results.extend(await self._submit(items[start:start + self.max_batch_size]))
+        return results
+
+    async def _submit(self, items: list) -> list:
+        self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((items, loop, future, metrics.current_request()))
+        return await future
+
+    async def submit(self, item):
+        return (await self.submit_many([item]))[0]
+
+    def _collect(self, first: tuple) -> List[tuple]:
+        batch, size = [first], len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            # Requests already queued are taken right away, then the batch waits for more until the deadline.
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                # A request waiting alone is scored right away (bypass).
+                if len(batch) == 1:
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            if request is None:
+                # Stopping, the request is put back for the loop to see it after this batch.
+                self._queue.put(None)
+                break
+            if size + len(request[0]) > self.max_batch_size:
+                # Requests are never split between batches (submit_many splits them up to max_batch_size).
+                self._pending = request
+                break
+            batch.append(request)
+            size += len(request[0])
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            if self._pending is not None:
+                first, self._pending = self._pending, None
+            else:
+                first = self._queue.get()
+            if first is None:
+                return
+            self._score(self._collect(first))
+
+    def _score(self, batch: List[tuple]) -> None:
+        self.batches += 1
+        items = [item for request in batch for item in request[0]]
+        metrics.observe("scheduler_batch_size", len(items), BATCH_SIZE_BUCKETS)
+        try:
+            with metrics.batch([request[3] for request in batch]):
+                results = self.score(items)
+        except Exception as e:
+            if len(batch) > 1:
+                for request in batch:
+                    self._score([request])
+                return
+            _, loop, future, _ = batch[0]
+            _resolve(loop, _set_exception, future, e)
+            return
+
+        start = 0
+        for request_items, loop, future, _ in batch:
+            end = start + len(request_items)
+            _resolve(loop, _set_result, future, results[start:end])
+            start = end
+
+
+def _resolve(loop: asyncio.AbstractEventLoop, setter: Callable, future: asyncio.Future, value) -> None:
+    try:
+        loop.call_soon_threadsafe(setter, future, value)
+    except RuntimeError:
+        # The loop of the request was closed (e.g., the client went away and the server shut down).
+        pass
+
+
+def _set_result(future: asyncio.Future, result) -> None:
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: asyncio.Future, exception: BaseException) -> None:
+    if not future.done():
+        future.set_exception(exception)
@@ -0,0 +1,184 @@
+import ctypes
+import importlib.util
+import json
+import math
+import os
+import sys
+import threading
+import numpy as np
+
+# Importing the xgboost package imports pandas, SciPy and scikit-learn whenever they're installed (xgboost.compat),
+# about a second of a cold start. Serving only needs the shared library the package ships, which is called
+# here through XGBoost's C API, so the package itself is never imported by the API.
+LIBRARY_NAMES = {'linux': 'libxgboost.so', 'darwin': 'libxgboost.dylib', 'win32': 'xgboost.dll'}
+
+_library = None
+_library_lock = threading.Lock()
+
+
+def library_path() -> str:
+    """
+    Path of the shared library of the installed xgboost package, found without importing it.
+    """
+    spec = importlib.util.find_spec('xgboost')
+    name = LIBRARY_NAMES.get(sys.platform, LIBRARY_NAMES['linux'])
+    if spec is not None:
+        for location in spec.submodule_search_locations or []:
+            for directory in (os.path.join(location, 'lib'), os.path.join(sys.prefix, 'lib')):
+                path = os.path.join(directory, name)
+                if os.path.exists(path):
+                    return path
+    raise Exception(f"XGBoost's library {name} not found, is xgboost installed?")
+
+
+def _load_library() -> ctypes.CDLL:
+    global _library
+    if _library is None:
+        with _library_lock:
+            if _library is None:
+                library = ctypes.cdll.LoadLibrary(library_path())
+                library.XGBGetLastError.restype = ctypes.c_char_p
+                _library = library
+    return _library
+
+
+def _check(code: int) -> None:
+    if code != 0:
+        raise Exception(f"XGBoost failed: {_library.XGBGetLastError().decode()}")
+
+
+def _array_interface(X: np.ndarray) -> bytes:
+    return json.dumps(X.__array_interface__).encode()
+
+
+def _config(**values) -> bytes:
+    # NaN is written as such, which XGBoost's JSON parser accepts.
+    return json.dumps(values).encode()
+
+
+def _copy_result(shape, dims: ctypes.c_uint64, result) -> np.ndarray:
+    # The result is owned by the booster (and overwritten by the next prediction of the thread), so it's copied.
+    shape = tuple(shape[dim] for dim in range(dims.value))
+    return np.ctypeslib.as_array(result, shape=(math.prod(shape),)).copy().reshape(shape)
+
+
+class Booster:
+    """
+    XGBoost model deserialized from the bytes of model.bin (or of the artifact), and scored through the C API
+    of XGBoost's library. It gives the same predictions as xgboost.Booster, whose calls it mirrors.
+    Boosters can be called from several threads, and release the GIL while XGBoost runs.
+    """
+
+    def __init__(self, model_bytes: bytes) -> None:
+        library = _load_library()
+        self._library = library
+        self.handle = ctypes.c_void_p()
+        _check(library.XGBoosterCreate(None, ctypes.c_uint64(0), ctypes.byref(self.handle)))
+        buffer = (ctypes.c_char * len(model_bytes)).from_buffer_copy(model_bytes)
+        _check(library.XGBoosterLoadModelFromBuffer(self.handle, buffer, ctypes.c_uint64(len(model_bytes))))
+        n_features = ctypes.c_uint64()
+        _check(library.XGBoosterGetNumFeature(self.handle, ctypes.byref(n_features)))
+        self.n_features = n_features.value
+
+    def __del__(self) -> None:
+        handle = getattr(self, 'handle', None)
+        if handle is not None and handle.value is not None:
+            self._library.XGBoosterFree(handle)
+            self.handle = None
+
+    def num_features(self) -> int:
+        return self.n_features
+
+    def inplace_predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        Predictions of the rows of X, as xgboost.Booster.inplace_predict. Arrays that aren't C contiguous float32
+        are copied first (FastPredictor writes the rows into such a buffer).
+        """
+        # The array must outlive the call, XGBoost reads it through the pointer of its interface.
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        shape, dims, result = ctypes.POINTER(ctypes.c_uint64)(), ctypes.c_uint64(), ctypes.POINTER(ctypes.c_float)()
+        config = _config(type=0, training=False, iteration_begin=0, iteration_end=0, missing=math.nan, strict_shape=False, cache_id=0)
+        _check(self._library.XGBoosterPredictFromDense(
+            self.handle, _array_interface(X), config, None, ctypes.byref(shape), ctypes.byref(dims), ctypes.byref(result),
+        ))
+        return _copy_result(shape, dims, result)
+
+    def contributions(self, X: np.ndarray, approximate: bool = False) -> np.ndarray:
+        """
+        Contribution of every feature to the predictions of the rows of X, and the bias in the last column,
+        as xgboost.Booster.predict with `pred_contribs` (and `approx_contribs`).
+        """
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        matrix = ctypes.c_void_p()
+        _check(self._library.XGDMatrixCreateFromDense(
+            _array_interface(X), _config(missing=math.nan, nthread=0), ctypes.byref(matrix),
+        ))
+        try:
+            shape, dims, result = ctypes.POINTER(ctypes.c_uint64)(), ctypes.c_uint64(), ctypes.POINTER(ctypes.c_float)()
+            config = _config(type=3 if approximate else 2, training=False, iteration_begin=0, iteration_end=0, strict_shape=False)
+            _check(self._library.XGBoosterPredictFromDMatrix(
+                self.handle, matrix, config, ctypes.byref(shape), ctypes.byref(dims), ctypes.byref(result),
+            ))
+            return _copy_result(shape, dims, result)
+        finally:
+            self._library.XGDMatrixFree(matrix)
+
+    def feature_importances(self, importance_type: str = 'gain') -> np.ndarray:
+        """
+        Importance of every feature, normalized to add up to 1, as XGBRegressor.feature_importances_.
+        """
+        n_scored, names = ctypes.c_uint64(), ctypes.POINTER(ctypes.c_char_p)()
+        dims, shape, scores = ctypes.c_uint64(), ctypes.POINTER(ctypes.c_uint64)(), ctypes.POINTER(ctypes.c_float)()
+        _check(self._library.XGBoosterFeatureScore(
+            self.handle, _config(importance_type=importance_type, feature_map=''),
+            ctypes.byref(n_scored), ctypes.byref(names), ctypes.byref(dims), ctypes.byref(shape), ctypes.byref(scores),
+        ))
+        importances = np.zeros(self.n_features, dtype=np.float32)
+        for position in range(n_scored.value):
+            # Features without names are named after their position: f0, f1...
+            importances[int(names[position].decode()[1:])] = scores[position]
+        total = importances.sum()
+        return importances / total if total > 0 else importances
+
+
+class FastPredictor:
+    """
+    Low latency scoring for a handful of rows (e.g., a single flight in the API).
+    XGBRegressor.predict validates the DataFrame and builds a DMatrix on every call. Instead, the booster is called
+    through inplace_predict on a float32 array with the features already in the order the model was trained with.
+    Every thread gets its own preallocated buffer, so featurizers can write the features into it without allocating.
+    """
+
+    def __init__(self, booster: Booster, max_rows: int = 1) -> None:
+        self.booster = booster
+        self.n_features = booster.num_features()
+        self.max_rows = max_rows
+        self._local = threading.local()
+
+    def buffer(self, rows: int = 1) -> np.ndarray:
+        """
+        Returns this thread's float32 buffer of shape (rows, n_features).
+        """
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or buffer.shape[0] < rows:
+            buffer = np.empty((max(rows, self.max_rows), self.n_features), dtype=np.float32)
+            self._local.buffer = buffer
+        return buffer[:rows]
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        Scores the rows of X, whose columns must follow the order of the features of the model.
+        """
+        if X.dtype != np.float32 or not X.flags.c_contiguous:
+            rows = self.buffer(X.shape[0])
+            rows[:] = X
+            X = rows
+        return self.booster.inplace_predict(X)
+
+    def predict_frame(self, X) -> np.ndarray:
+        """
+        Same as Model.predict for a DataFrame produced by Dataset.split_target.
+        """
+        rows = self.buffer(X.shape[0])
+        rows[:] = X.to_numpy(dtype=np.float32)
+        return self.predict(rows)
@@ -0,0 +1,231 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+from latam.metrics import metrics
+
+# The cache is configured through these environment variables.
+# LATAM_CACHE_SIZE: entries kept in memory by every process, 0 disables the cache.
+# LATAM_CACHE_TTL: seconds an entry is kept.
+# LATAM_CACHE_FILE: SQLite file shared by the processes serving the API (e.g., uvicorn workers), unset by default.
+CACHE_SIZE_ENV = 'LATAM_CACHE_SIZE'
+CACHE_TTL_ENV = 'LATAM_CACHE_TTL'
+CACHE_FILE_ENV = 'LATAM_CACHE_FILE'
+
+DEFAULT_CACHE_SIZE = 10_000
+DEFAULT_CACHE_TTL = 600.0
+
+# Entries kept in the shared file, and how many writes happen between two prunes of expired or excess entries.
+DEFAULT_SHARED_CACHE_SIZE = 1_000_000
+SHARED_PRUNE_INTERVAL = 1_000
+
+
+class SQLiteCacheBackend:
+    """
+    Predictions shared by several processes through a SQLite file.
+    Entries are stored along with the version of the model (and encoders) that produced them,
+    so processes still serving a previous version never read the entries of a newer one, and vice versa.
+    Errors (e.g., the file being locked for too long) are reported as misses, they never fail a request.
+    """
+
+    def __init__(self, path: str, version: str, max_entries: int = DEFAULT_SHARED_CACHE_SIZE, ttl: float = DEFAULT_CACHE_TTL) -> None:
+        # Imported here, so that serving without a shared cache doesn't import it.
+        import sqlite3
+        self._sqlite3 = sqlite3
+        self.path = path
+        self.version = version
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.errors = 0
+        self._writes = 0
+        self._local = threading.local()
+
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "version TEXT NOT NULL, key BLOB NOT NULL, value REAL NOT NULL, expires_at REAL NOT NULL, "
+            "PRIMARY KEY (version, key)) WITHOUT ROWID"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS predictions_expires_at ON predictions (expires_at)")
+
+    def _connection(self):
+        # SQLite connections can't be shared between threads, every thread gets its own.
+        # Nor between processes: a worker forked by serve.py opens its own instead of using the parent's.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = self._sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get_many(self, keys: List[bytes]) -> dict:
+        try:
+            placeholders = ','.join('?' * len(keys))
+            rows = self._connection().execute(
+                f"SELECT key, value FROM predictions WHERE version = ? AND expires_at > ? AND key IN ({placeholders})",
+                [self.version, time.time(), *keys],
+            ).fetchall()
+        except self._sqlite3.Error:
+            self.errors += 1
+            return {}
+        return dict(rows)
+
+    def put_many(self, keys: List[bytes], values: List[float]) -> None:
+        expires_at = time.time() + self.ttl
+        try:
+            connection = self._connection()
+            connection.executemany(
+                "INSERT OR REPLACE INTO predictions (version, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                [(self.version, key, float(value), expires_at) for key, value in zip(keys, values)],
+            )
+            self._writes += len(keys)
+            if self._writes >= SHARED_PRUNE_INTERVAL:
+                self._writes = 0
+                self.prune()
+        except self._sqlite3.Error:
+            self.errors += 1
+
+    def prune(self) -> None:
+        """
+        Deletes the expired entries, then the ones expiring first over max_entries, whatever their version.
+        Entries of other versions are otherwise left alone: during a rolling swap (see serve.py), processes
+        still serving the previous version keep using theirs, which expire once they're no longer written.
+        """
+        connection = self._connection()
+        connection.execute("DELETE FROM predictions WHERE expires_at <= ?", (time.time(),))
+        excess = connection.execute("SELECT COUNT(*) FROM predictions").fetchone()[0] - self.max_entries
+        if excess > 0:
+            connection.execute(
+                "DELETE FROM predictions WHERE (version, key) IN "
+                "(SELECT version, key FROM predictions ORDER BY expires_at LIMIT ?)",
+                (excess,),
+            )
+
+    def clear(self) -> None:
+        self._connection().execute("DELETE FROM predictions")
+
+
+class PredictionCache:
+    """
+    LRU cache of the predictions of a model, keyed on the feature vector of a flight (its float32 bytes)
+    rather than on the request, so that flights sent with different JSON (e.g., other date formats) share entries.
+    Entries expire after `ttl` seconds and the least recently used ones are evicted over `max_entries`.
+
+    A cache belongs to a single version of the model and encoders (see latam.registry.LoadedModel),
+    so it's discarded along with them when they change. With a `backend` (e.g., SQLiteCacheBackend),
+    local misses are looked up there and predictions are written there as well, to be shared with other processes.
+    """
+
+    def __init__(
+            self,
+            version: str,
+            max_entries: int = DEFAULT_CACHE_SIZE,
+            ttl: float = DEFAULT_CACHE_TTL,
+            backend: SQLiteCacheBackend = None,
+        ) -> None:
+        self.version = version
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = backend
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, version: str) -> Optional['PredictionCache']:
+        """
+        Cache configured by the LATAM_CACHE_* environment variables, or None if it's disabled.
+        """
+        max_entries = int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE))
+        if max_entries <= 0:
+            return None
+        ttl = float(os.environ.get(CACHE_TTL_ENV, DEFAULT_CACHE_TTL))
+        cache_file = os.environ.get(CACHE_FILE_ENV)
+        backend = SQLiteCacheBackend(cache_file, version, ttl=ttl) if cache_file else None
+        return cls(version, max_entries, ttl, backend)
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[float]]:
+        """
+        Cached predictions of the keys, None for those that aren't cached.
+        """
+        now = time.monotonic()
+        values, missing = [], []
+        with self._lock:
+            for position, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] <= now:
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    values.append(None)
+                    missing.append(position)
+                else:
+                    self._entries.move_to_end(key)
+                    values.append(entry[0])
+            self.hits += len(keys) - len(missing)
+
+        shared_hits = 0
+        if missing and self.backend is not None:
+            shared = self.backend.get_many([keys[position] for position in missing])
+            if shared:
+                self._store(list(shared.keys()), list(shared.values()), now)
+                for position in missing:
+                    values[position] = shared.get(keys[position])
+                    shared_hits += values[position] is not None
+                with self._lock:
+                    self.shared_hits += shared_hits
+
+        misses = len(missing) - shared_hits
+        with self._lock:
+            self.misses += misses
+        metrics.increment("cache_hits_total", len(keys) - len(missing), level="local")
+        metrics.increment("cache_hits_total", shared_hits, level="shared")
+        metrics.increment("cache_misses_total", misses)
+        return values
+
+    def _store(self, keys: List[bytes], values: List[float], now: float) -> None:
+        expires_at = now + self.ttl
+        with self._lock:
+            for key, value in zip(keys, values):
+                self._entries[key] = (value, expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def put_many(self, keys: List[bytes], values: List[float]) -> None:
+        self._store(keys, values, time.monotonic())
+        if self.backend is not None:
+            self.backend.put_many(keys, values)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.shared_hits + self.misses
+        stats = {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+        if self.backend is not None:
+            stats["shared_file"] = self.backend.path
+            stats["shared_errors"] = self.backend.errors
+        return stats
@@ -1,37 +1,27 @@
 import numpy as np
-import pickle
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
-from sklearn.model_selection import train_test_split
-from collections import Counter
 import pandas as pd
-from datetime import datetime
+from latam.features import (
+    DATE_FORMAT,
+    INPUT_COLUMNS,
+    OUTPUT_COLUMNS,
+    DATE_ENCODING_COLUMNS,
+    FEATURE_COLUMNS,
+    UNSEEN_CATEGORY_VALUE,
+    MONTH_ENCODING,
+    DAY_ENCODING,
+    HOUR_ENCODING,
+    lookup_encoding,
+)
+from latam.artifact import save_encodings, load_encodings, export_frame, read_frame
+from latam.dataset_cache import DatasetCache, file_hash, pipeline_hash, encodings_hash
 from latam.synthetic_features import SyntheticFeatures
-from latam.statistics import robust_zscore, zscore
-
-DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
-
-INPUT_COLUMNS = [
-    "Fecha-I",
-    "Vlo-I",
-    "Ori-I",
-    "Des-I",
-    "Emp-I",
-    "DIA",
-    "MES",
-    "AÑO",
-    "TIPOVUELO",
-    "OPERA",
-    "SIGLAORI",
-    "SIGLADES",
-    "Temporada alta",
-    "Periodo día",
-]
-
-OUTPUT_COLUMNS = [
-    'Atraso menor', # This is the target for classification
-    'Diferencia en minutos' # This is the target for regression
-]
+from latam.statistics import anomaly_scores
+from latam.memory import MemoryTracker
+from latam.metrics import metrics
 
+# Parsers are applied to the whole column.
 COLUMNS_PARSER = {
     "Fecha-I": pd.to_datetime
 }
@@ -61,138 +51,236 @@ SUPPORTED_ANOMALY_SORES = [
 
 CATEGORICAL_ENCODER_FILE = '../data/categorical_encoder.pickle'
 
-TWO_PI = 2*np.pi
+def target_statistics(cat_values: pd.Series, target_values: pd.Series) -> pd.DataFrame:
+    """
+    Sum and count of the target for every category, computed in a single groupby pass.
+    These statistics can be added up across chunks of data before computing the encoding.
+    """
+    grouped = target_values.groupby(cat_values, observed=True, sort=False)
+    return pd.DataFrame({'sum': grouped.sum(), 'count': grouped.count()})
 
-def target_encoding(cat_values: pd.Series, target_values: pd.Series) -> pd.Series:
+def encoding_from_statistics(statistics: pd.DataFrame, smoothing: float = 0, prior: float = None) -> dict:
+    """
+    Computes the target encoding map from the target statistics of each category.
+    With `smoothing` > 0, the mean of each category is blended with the `prior` (the global mean of the target)
+    weighted by the number of samples of the category: (sum + smoothing * prior) / (count + smoothing).
+    """
+    sums = statistics['sum'].values.astype(np.float64)
+    counts = statistics['count'].values
+    if smoothing > 0:
+        if prior is None:
+            prior = sums.sum() / counts.sum()
+        means = (sums + smoothing * prior) / (counts + smoothing)
+    else:
+        means = sums / counts
+
+    return dict(zip(statistics.index, np.round(means, 3)))
+
+def target_encoding(cat_values: pd.Series, target_values: pd.Series, smoothing: float = 0) -> dict:
     """
     This method will compute the target encoding for a given categorical feature.
     Target encoding is particularly useful when dealing with high cardinality features.
     When cardinality is low, it behaves similar to counter encoding.
 
     Target Encoding may lead to overfitting but XGBoost has some nice overfitting handling, so we should be fine.
+    For rare categories, `smoothing` can be used to pull their encoding towards the global mean of the target.
     """
-    df = pd.DataFrame({'cat': cat_values, 'target': target_values})
-    target_encoding = {}
-    cat_count_map = Counter(cat_values)
-    for cat_value in cat_count_map.keys():
-        mean_target = np.round(df[df['cat'] == cat_value]['target'].mean(), 3)
-        target_encoding[cat_value] = mean_target
-    
-    return target_encoding
-    # return cat_values.apply(lambda X: target_encoding[X])
+    statistics = target_statistics(cat_values, target_values)
+    return encoding_from_statistics(statistics, smoothing, prior=target_values.mean())
 
-def split_date(date_values: datetime) -> pd.DataFrame:
+def apply_target_encoding(cat_values: pd.Series, target_encoder: dict, default: float = UNSEEN_CATEGORY_VALUE) -> np.ndarray:
     """
-        This method will split a date column into its components (year, month, day, hour).
+    Encodes a categorical column through its categorical codes: the encoder is looked up once per category
+    and the rows only index the resulting table. Unknown categories (and missing values) get `default`.
     """
-    date_columns = {
-        'year': [date_values.year],
-        'month': [date_values.month],
-        'day': [date_values.day],
-        'hour': [date_values.hour]
-    }
-    return pd.DataFrame(date_columns)
+    if not isinstance(cat_values.dtype, pd.CategoricalDtype):
+        cat_values = cat_values.astype('category')
+
+    # The default goes last, so that the -1 code of missing values also points to it.
+    table = np.array(
+        [lookup_encoding(target_encoder, cat_value, default) for cat_value in cat_values.cat.categories] + [default],
+        dtype=np.float64
+    )
+    return table[cat_values.cat.codes.values]
 
 def date_encoding(date_values: pd.Series) -> pd.DataFrame:
     """
         For date values, cyclic encoding will be used so that the model can
         levarage the cyclic nature of months, days, and hours.
+        The components (year, month, day, hour) are read straight from the datetime64 column.
     """
-    rows = date_values.apply(split_date)
-    date_df = pd.concat(list(rows))
     date_cyclic_encoding = {}
-    date_cyclic_encoding['year'] = date_df['year'] # Year is not encoded in a cyclic manner, just keep it as number
-    date_cyclic_encoding['month'] = date_df['month'].apply(lambda X: np.cos( TWO_PI * X / 12)).apply(lambda x: np.round(x, 3))
-    date_cyclic_encoding['day'] = date_df['day'].apply(lambda X: np.cos( TWO_PI * X / 31)).apply(lambda x: np.round(x, 3))
-    date_cyclic_encoding['hour'] = date_df['hour'].apply(lambda X: np.cos( TWO_PI * X / 24)).apply(lambda x: np.round(x, 3))
+    date_cyclic_encoding['year'] = date_values.dt.year.values.astype('int64') # Year is not encoded in a cyclic manner, just keep it as number
+    date_cyclic_encoding['month'] = MONTH_ENCODING[date_values.dt.month.values]
+    date_cyclic_encoding['day'] = DAY_ENCODING[date_values.dt.day.values]
+    date_cyclic_encoding['hour'] = HOUR_ENCODING[date_values.dt.hour.values]
 
-    return pd.DataFrame(date_cyclic_encoding)
+    return pd.DataFrame(date_cyclic_encoding, index=date_values.index)
 
 
 class Dataset:
     """
     This class will be responsible for data pre-processing (i.e., preparation, cleaning and formatting).
+    The stages avoid copying the data where possible: they work in place on the frames they own,
+    or on shallow copies that share the column data. With `track_memory` the memory used by every stage
+    is recorded in `memory_tracker` (see latam.memory.MemoryTracker).
+
+    Datasets read from a file can be cached on disk, clean and encoded (see latam.dataset_cache.DatasetCache,
+    used by default when LATAM_DATASET_CACHE is set). On a hit the clean dataset is loaded right away,
+    instead of the raw one, and clean doesn't do anything.
     """
 
     def __init__(
             self,
             dataset_file: pd.DataFrame = None,
-            dataset: pd.DataFrame = None
+            dataset: pd.DataFrame = None,
+            track_memory: bool = False,
+            cache: DatasetCache = None,
         ) -> None:
         self.dataset = dataset
         self.encoded_dataset = None
         self.anomalies_removed = False
+        self.is_data_clean = False
+        # Positions (in the raw dataset) of the rows kept by clean.
+        self.kept_rows = None
+        self.memory_tracker = MemoryTracker() if track_memory else None
+        self.cache = None
+        # Key of the rows of the dataset in the cache, None when they can't be cached (e.g., given as a frame).
+        self._cache_key = None
 
         if dataset_file:
-            self.dataset = pd.read_csv(dataset_file)
+            self.cache = cache if cache is not None else DatasetCache.from_env()
+            cached = None
+            if self.cache is not None:
+                with self._stage('cache_lookup'):
+                    self._cache_key = self.cache.key(file_hash(dataset_file), pipeline_hash(), 'clean')
+                    cached = self.cache.get(self._cache_key)
+            if cached is not None:
+                self.dataset, arrays = cached
+                self.kept_rows = arrays['kept_rows']
+                self.is_data_clean = True
+            else:
+                # CSV, or Parquet/Arrow files written by export (see latam.artifact.read_frame).
+                with self._stage('read_csv'):
+                    self.dataset = read_frame(dataset_file)
         elif dataset is not None:
             self.dataset = dataset
         else:
             raise Exception("Either dataset_file or dataset dataframe must be provided.")
-        
-    @staticmethod
-    def compute_synthetic_features(X:pd.DataFrame) -> None:
-        sf = SyntheticFeatures(X)
-        sf_df = sf.compute()
-        return pd.concat([sf_df, X], axis=1)
 
+    @contextmanager
+    def _stage(self, name: str):
+        # Stages are timed when metrics are enabled (see latam.metrics), and their memory tracked on demand.
+        with metrics.stage(f"dataset.{name}"):
+            with self.memory_tracker.stage(name) if self.memory_tracker is not None else nullcontext():
+                yield
+
+    def _columns_of_type(self, dtype: str):
+        """
+        Yields the (name, values) of the columns of the given dtype, without copying them like select_dtypes.
+        """
+        for column, values in self.dataset.items():
+            if pd.api.types.is_dtype_equal(values.dtype, dtype):
+                yield column, values
+        
     def clean(self) -> None:
-        X = Dataset.compute_synthetic_features(self.dataset)
-        X = Dataset.get_relevant_columns(X)
-        X = Dataset.handle_missing_values(X)
-        X = Dataset.parse(X)
+        if self.is_data_clean and self._cache_key is not None:
+            # Loaded clean from the cache.
+            return
+        with self._stage('synthetic_features'):
+            sf_df = SyntheticFeatures(self.dataset).compute()
+        with self._stage('relevant_columns'):
+            X = Dataset.get_relevant_columns(self.dataset, synthetic_features=sf_df)
+            del sf_df
+        with self._stage('missing_values'):
+            missing = Dataset.missing_rows(X)
+            kept_rows = np.flatnonzero(~missing)
+            X = Dataset.handle_missing_values(X, missing)
+        with self._stage('parse'):
+            # X shares the raw frame's arrays, parsing replaces its columns instead of modifying them.
+            X = Dataset.parse(X, inplace=True)
+        # The raw frame is only released once every stage succeeded, so a failure leaves the dataset as it was.
         self.dataset = X
+        self.kept_rows = kept_rows
         self.is_data_clean = True
+        if self._cache_key is not None:
+            with self._stage('cache_store'):
+                self.cache.put(self._cache_key, X, {'kept_rows': self.kept_rows})
 
-    def encode(self, encoding_file: str) -> None:
+    def encode(self, encoding_file: str = None, cat_encoding_map: dict = None, smoothing: float = 0) -> None:
         """
         This method will be responsible for encoding the columns into a better representation.
+        An already loaded `cat_encoding_map` (e.g., the one held by the API's model registry) can be
+        provided to avoid reading the encoding file. `smoothing` is only used when the target encoding is fitted.
+        Categories unknown to the encoding map are encoded as UNSEEN_CATEGORY_VALUE.
+        With a cache, the encoded dataset is cached along with the hash of its encoding map.
         """
         if not self.is_data_clean:
             raise Exception("Data must be cleaned before encoding.")
         
-        categoric_cols = self.get_categoric_features()
-        date_cols = self.get_date_features()
-        newDataset = self.dataset.copy()
+        # The encoded columns replace the original ones in a shallow copy, the rest of the columns are shared.
+        newDataset = self.dataset.copy(deep=False)
         # We'll need to store the encoding map so that we can use it later for the API.
-        using_saved_encoding = self.load_cat_encodings(encoding_file)
-        for cat_col in categoric_cols:
-            # This encoding replaces the categorical value with the mean of the target for that value
-            cat_col_values = categoric_cols[cat_col]
-
-            # If the encoding map is not available, compute it.
-            if using_saved_encoding:
-                target_encoder = self.cat_encoding_map[cat_col]
-            else:
-                target_encoder = target_encoding(cat_col_values, self.dataset[OUTPUT_COLUMNS[1]])
-
-            self.cat_encoding_map[cat_col] = target_encoder
-            newDataset[cat_col] = [target_encoder[cat_value] for cat_value in cat_col_values]
+        if cat_encoding_map is not None:
+            self.cat_encoding_map = cat_encoding_map
+            using_saved_encoding = True
+        else:
+            using_saved_encoding = self.load_cat_encodings(encoding_file)
+
+        if using_saved_encoding and self._cache_key is not None:
+            with self._stage('cache_lookup'):
+                cached = self.cache.get(self._encoded_cache_key())
+            if cached is not None:
+                self.encoded_dataset, _ = cached
+                return
+
+        with self._stage('target_encoding'):
+            for cat_col, cat_col_values in self._columns_of_type('category'):
+                # This encoding replaces the categorical value with the mean of the target for that value
+
+                # If the encoding map is not available, compute it.
+                if using_saved_encoding:
+                    target_encoder = self.cat_encoding_map[cat_col]
+                else:
+                    target_encoder = target_encoding(cat_col_values, self.dataset[OUTPUT_COLUMNS[1]], smoothing)
+                    self.cat_encoding_map[cat_col] = target_encoder
+
+                newDataset[cat_col] = apply_target_encoding(cat_col_values, target_encoder)
         
-        for date_col in date_cols:
-            # This encoding splits the date into its components (year, month, day, hour), so more columns are created.
-            cyclic_date_columns = date_encoding(date_cols[date_col]).reset_index(drop=True)
-            newDataset = pd.concat([cyclic_date_columns, newDataset], axis=1)
-            newDataset = newDataset.drop(columns=[date_col])
+        with self._stage('date_encoding'):
+            for date_col, date_col_values in self._columns_of_type('datetime64[ns]'):
+                # This encoding splits the date into its components (year, month, day, hour), so more columns are created.
+                # They're placed first, in the same order, and keep the index of the dataset.
+                cyclic_date_columns = date_encoding(date_col_values)
+                del newDataset[date_col]
+                for position, column in enumerate(cyclic_date_columns):
+                    newDataset.insert(position, column, cyclic_date_columns[column].values)
             
         self.encoded_dataset = newDataset
 
         if not using_saved_encoding:
             self.save_cat_encodings(encoding_file)
+        if self._cache_key is not None:
+            with self._stage('cache_store'):
+                self.cache.put(self._encoded_cache_key(), newDataset)
+
+    def _encoded_cache_key(self) -> str:
+        return self.cache.key(self._cache_key, 'encoded', encodings_hash(self.cat_encoding_map))
 
     def save_cat_encodings(self, encoding_file: str = None) -> None:
+        """
+        Saves the categorical encoding map, as an artifact if the file ends in .artifact (see latam.artifact).
+        """
         encoding_path = encoding_file if encoding_file is not None else CATEGORICAL_ENCODER_FILE
-        with open(encoding_path, 'wb') as file:
-            pickle.dump(self.cat_encoding_map, file)
+        save_encodings(self.cat_encoding_map, encoding_path)
 
     def load_cat_encodings(self, encoding_file:str = None) -> bool:
         """
-        Loads an existing categorical encoding map, if available.
+        Loads an existing categorical encoding map (pickle or artifact), if available.
         """
         encoding_path = encoding_file if encoding_file is not None else CATEGORICAL_ENCODER_FILE
         if Path(encoding_path).exists():
-            with open(encoding_path, 'rb') as file:
-                self.cat_encoding_map = pickle.load(file)
+            self.cat_encoding_map = load_encodings(encoding_path)
             print(f"Categorical encodings loaded from {encoding_path}")
             return True
         else:
@@ -207,26 +295,36 @@ class Dataset:
         if self.encoded_dataset is None:
             raise Exception("Data must be encoded first.")
         
-        df_to_use = self.encoded_dataset.copy()
-        
         target_column = OUTPUT_COLUMNS[1] if for_regression else OUTPUT_COLUMNS[0]
 
         X, Y = None, None
-        if target_column in df_to_use.columns:
-            Y = df_to_use[target_column]
-
-        X = df_to_use
-        try:
-            X.drop(columns=OUTPUT_COLUMNS, inplace=True)
-        except:
-            pass
+        if target_column in self.encoded_dataset.columns:
+            Y = self.encoded_dataset[target_column]
+
+        # Removing the targets from a shallow copy leaves the encoded dataset untouched without copying its data.
+        X = self.encoded_dataset.copy(deep=False)
+        for column in OUTPUT_COLUMNS:
+            if column in X:
+                del X[column]
         
         return X, Y
 
     def split_test_train(self, for_regression = True):
+        # scikit-learn is only needed for training, so it isn't imported by the serving path.
+        from sklearn.model_selection import train_test_split
         X, Y = self.split_target(for_regression)
         return train_test_split(X, Y, test_size=0.2, random_state=42)
 
+    def export(self, path: str, encoded: bool = True) -> None:
+        """
+        Writes the encoded dataset (or the clean one) to Parquet, Arrow or CSV, depending on the extension
+        of the path (see latam.artifact.export_frame), so that training runs don't have to parse the raw CSV again.
+        """
+        X = self.encoded_dataset if encoded else self.dataset
+        if X is None:
+            raise Exception("Data must be encoded first." if encoded else "No data to export.")
+        export_frame(X, path)
+
     def get_categoric_features(self) -> pd.DataFrame:
         if not self.is_data_clean:
             raise Exception("Data must be cleaned first.")
@@ -238,49 +336,62 @@ class Dataset:
         return self.dataset.select_dtypes(include=['datetime64[ns]'])
 
     @staticmethod
-    def compute_anomaly_scores(X:pd.DataFrame) -> None:
+    def compute_anomaly_scores(X:pd.DataFrame, criteria = SUPPORTED_ANOMALY_SORES) -> pd.DataFrame:
         """
-        This method will be responsible for removing anomalies from the dataset.
+        Returns the dataset with a column of scores for each of the requested criteria (both by default).
         A datapoint will be considered an anomaly if the chose criterion is above the treshold.
+        The scores are added to a shallow copy, the columns of X aren't copied.
         """
-        new_df = X.copy()
-        new_df['r-zscore'] = robust_zscore(new_df[OUTPUT_COLUMNS[1]])
-        new_df['zscore'] = zscore(new_df[OUTPUT_COLUMNS[1]])
+        new_df = X.copy(deep=False)
+        for criterion in criteria:
+            new_df[criterion] = anomaly_scores(new_df[OUTPUT_COLUMNS[1]], criterion)
 
         return new_df
     
-    def remove_anomalies(self, threshold = None, criterion = 'r-zscore') -> None:
+    def remove_anomalies(self, threshold = None, criterion = 'r-zscore', statistics = None) -> None:
         """
         This method will be responsible for removing anomalies from the dataset.
         A datapoint will be considered an anomaly if the chose criterion is above the treshold.
+        Only the requested criterion is computed, exactly from the dataset unless its `statistics` are given
+        (e.g., accumulated over chunks or other workers, see latam.statistics.anomaly_statistics).
         """
-        X = self.dataset.copy()
-        new_df = Dataset.compute_anomaly_scores(X)
-        
         if criterion not in SUPPORTED_ANOMALY_SORES:
             raise Exception(f"Criterion {criterion} not supported. Must be either 'r-zscore' or 'zscore'")
 
-        new_df = new_df[new_df[criterion] < threshold]
-        new_df = new_df.drop(columns=SUPPORTED_ANOMALY_SORES)
-        new_df = new_df.reset_index(drop=True)
+        X = self.dataset
+        with self._stage('remove_anomalies'):
+            scores = anomaly_scores(X[OUTPUT_COLUMNS[1]], criterion, statistics)
+            keep = (scores < threshold).values
+
+            new_df = X
+            if not keep.all():
+                # Filtering is the only copy, the index is reset in place.
+                new_df = X[keep]
+                new_df.index = pd.RangeIndex(new_df.shape[0])
 
         percetange_removed = np.round(((X.shape[0] - new_df.shape[0]) / X.shape[0]) * 100, 3)
         print(f"Reduced dataset by {percetange_removed}% after removing outliers")
 
         self.dataset = new_df
+        if self._cache_key is not None:
+            # The rows removed depend on the statistics, which are only known when they're computed from the dataset.
+            self._cache_key = self.cache.key(self._cache_key, criterion, str(threshold)) if statistics is None else None
         
     @staticmethod
-    def get_relevant_columns(X: pd.DataFrame) -> pd.DataFrame:
+    def get_relevant_columns(X: pd.DataFrame, synthetic_features: pd.DataFrame = None) -> pd.DataFrame:
         """
-            Only keep use the useful columns
+            Only keep use the useful columns.
+            Synthetic features can be given as a separate frame, to avoid concatenating them with the whole raw frame.
         """
         new_X = {}
         relevant_columns = INPUT_COLUMNS+OUTPUT_COLUMNS
         for column in relevant_columns:
-            if column in X:
+            if synthetic_features is not None and column in synthetic_features:
+                new_X[column] = synthetic_features[column].values
+            elif column in X:
                 new_X[column] = X[column].values
                 
-        return pd.DataFrame(new_X)
+        return pd.DataFrame(new_X, copy=False)
 
     @staticmethod
     def get_input_columns(X: pd.DataFrame) -> pd.DataFrame:
@@ -292,15 +403,24 @@ class Dataset:
             if column in X:
                 new_X[column] = X[column].values
 
-        return pd.DataFrame(new_X)
+        return pd.DataFrame(new_X, copy=False)
     
     @staticmethod
-    def handle_missing_values(X: pd.DataFrame) -> pd.DataFrame:
+    def missing_rows(X: pd.DataFrame) -> np.ndarray:
+        return X.isna().values.any(axis=1)
+
+    @staticmethod
+    def handle_missing_values(X: pd.DataFrame, missing: np.ndarray = None) -> pd.DataFrame:
         """
             This handles any row with missing data. By default it will drop the row. 
             More sofisticated methods can be later implemented.
+            The rows with missing data can be given when they were already found (see missing_rows).
         """
-        return X.dropna().reset_index(drop=True)
+        missing = Dataset.missing_rows(X) if missing is None else missing
+        if not missing.any() and X.index.equals(pd.RangeIndex(X.shape[0])):
+            # Nothing to drop, so the frame is returned as is instead of being copied.
+            return X
+        return X[~missing].reset_index(drop=True)
     
     @staticmethod
     def parse(
@@ -308,14 +428,19 @@ class Dataset:
     # This method could be made generic by using something like a columns_config argument
     # that would be the COLUMNS_PARSER and COLUMNS_DTYPE dicts needed for the preprocessing.
         # columns_config: Dict[str, Dict[str, any]]
+        inplace: bool = False,
     ) -> pd.DataFrame:
-        newX = X.copy()
+        """
+            Parses the columns and casts them to their dtype. With `inplace` the columns of X are replaced
+            instead of working on a copy.
+        """
+        newX = X if inplace else X.copy()
         for key, value in COLUMNS_PARSER.items():
-            if key in X:
-                newX[key] = X[key].apply(value)
+            if key in newX:
+                newX[key] = value(newX[key])
 
         for key, value in COLUMNS_DTYPE.items(): 
-            if key in X:
-                newX[key] = X[key].astype(value)
+            if key in newX:
+                newX[key] = newX[key].astype(value, copy=False)
 
         return newX
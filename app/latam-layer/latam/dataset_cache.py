@@ -0,0 +1,241 @@
+import json
+import mmap
+import os
+import sys
+import time
+from hashlib import sha256
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+from latam.artifact import write_sections, read_sections
+
+# Parsed datasets are cached on disk when this environment variable holds the cache directory (unset by default),
+# or when a DatasetCache is given to latam.dataset.Dataset.
+# LATAM_DATASET_CACHE_SIZE: bytes kept in the directory, the least recently used datasets are evicted over it.
+DATASET_CACHE_ENV = 'LATAM_DATASET_CACHE'
+DATASET_CACHE_SIZE_ENV = 'LATAM_DATASET_CACHE_SIZE'
+
+DEFAULT_DATASET_CACHE_DIR = '../data/cache'
+DEFAULT_DATASET_CACHE_SIZE = 1 << 30
+
+# Frames are written with the layout of latam.artifact: a JSON header describing the columns,
+# and the arrays of every column (the codes of categorical ones), read back through a memory map.
+MAGIC = b'LATAMFRM'
+FORMAT_VERSION = 1
+FRAME_SUFFIX = '.frame'
+
+# Modules whose code determines the parsed and encoded datasets, and the format of the cached files:
+# when any of them changes, cached datasets are stale.
+PIPELINE_MODULES = ['dataset.py', 'synthetic_features.py', 'features.py', 'statistics.py', 'dataset_cache.py', 'artifact.py']
+
+_pipeline_hash = None
+
+
+def file_hash(path: str) -> str:
+    """
+    SHA-256 of the content of a file, read in blocks.
+    """
+    digest = sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def pipeline_hash() -> str:
+    """
+    Hash of the code of the pre-processing pipeline (PIPELINE_MODULES), of the pandas version parsing the files
+    and of the format of the cached files. Computed once per process.
+    """
+    global _pipeline_hash
+    if _pipeline_hash is None:
+        digest = sha256(f"{FORMAT_VERSION}:{pd.__version__}".encode())
+        for module in PIPELINE_MODULES:
+            digest.update((Path(__file__).parent / module).read_bytes())
+        _pipeline_hash = digest.hexdigest()
+    return _pipeline_hash
+
+
+def encodings_hash(cat_encoding_map: dict) -> str:
+    """
+    Hash of the content of an encoding map, either of dicts or of latam.artifact.EncodingTables.
+    Int and str categories are told apart, as the encoders do.
+    """
+    digest = sha256()
+    for column in sorted(cat_encoding_map):
+        items = sorted((type(cat_value).__name__, str(cat_value), float(encoding)) for cat_value, encoding in cat_encoding_map[column].items())
+        digest.update(json.dumps([column, items], ensure_ascii=False).encode())
+    return digest.hexdigest()
+
+
+def _frame_sections(df: pd.DataFrame) -> Tuple[list, Dict[str, np.ndarray]]:
+    columns, sections = [], {}
+    for position, (column, values) in enumerate(df.items()):
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categories = values.cat.categories
+            columns.append({
+                'name': column,
+                'kind': 'category',
+                'categories': categories.tolist(),
+                'categories_dtype': str(categories.dtype),
+                'ordered': bool(values.dtype.ordered),
+            })
+            sections[f'{position}.codes'] = values.cat.codes.values
+        elif isinstance(values.dtype, np.dtype) and values.dtype.kind in 'biufM':
+            columns.append({'name': column, 'kind': 'array'})
+            sections[str(position)] = values.values
+        else:
+            raise Exception(f"Column {column} of dtype {values.dtype} can't be cached")
+    return columns, sections
+
+
+def _frame(columns: list, sections: Dict[str, np.ndarray]) -> pd.DataFrame:
+    data = {}
+    for position, column in enumerate(columns):
+        if column['kind'] == 'category':
+            categories = pd.Index(column['categories'], dtype=column['categories_dtype'])
+            dtype = pd.CategoricalDtype(categories, ordered=column['ordered'])
+            data[column['name']] = pd.Categorical.from_codes(sections[f'{position}.codes'], dtype=dtype)
+        else:
+            data[column['name']] = sections[str(position)]
+    return pd.DataFrame(data, copy=False)
+
+
+class DatasetCache:
+    """
+    On-disk cache of the datasets produced by the pipeline (see latam.dataset.Dataset), as typed columnar files,
+    so that repeated runs over the same file skip reading the CSV, computing the synthetic features and parsing.
+
+    Keys are built from the hash of the content of the source file and of the pipeline (see pipeline_hash),
+    so a dataset is recomputed whenever either changes, without invalidating anything by hand. Files that can't
+    be read (e.g., of another format version) are removed and count as misses. Reading a hit maps the file
+    into memory copy-on-write: the frame's columns are views of it, which the pipeline can still modify.
+
+    The files of the directory are kept under `max_bytes`: whenever a dataset is stored, the least recently
+    used ones (a hit refreshes the modification time of its file) are evicted.
+    """
+
+    def __init__(self, directory: str = DEFAULT_DATASET_CACHE_DIR, max_bytes: int = DEFAULT_DATASET_CACHE_SIZE) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> Optional['DatasetCache']:
+        """
+        Cache of the directory of LATAM_DATASET_CACHE, or None if it's unset.
+        """
+        directory = os.environ.get(DATASET_CACHE_ENV)
+        if not directory:
+            return None
+        return cls(directory, int(os.environ.get(DATASET_CACHE_SIZE_ENV, DEFAULT_DATASET_CACHE_SIZE)))
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        return sha256('\0'.join(parts).encode()).hexdigest()[:32]
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}{FRAME_SUFFIX}"
+
+    def get(self, key: str) -> Optional[Tuple[pd.DataFrame, Dict[str, np.ndarray]]]:
+        """
+        The cached frame of the key and the arrays stored along with it, or None.
+        """
+        path = self._path(key)
+        try:
+            header, sections = read_sections(path, MAGIC, FORMAT_VERSION, access=mmap.ACCESS_COPY)
+            df = _frame(header['columns'], sections)
+            arrays = {name: sections[f'arrays.{name}'] for name in header['arrays']}
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            print(f"Removing the cached dataset {path}, it can't be read: {e}")
+            path.unlink(missing_ok=True)
+            self.misses += 1
+            return None
+
+        os.utime(path)
+        self.hits += 1
+        return df, arrays
+
+    def put(self, key: str, df: pd.DataFrame, arrays: Dict[str, np.ndarray] = None) -> None:
+        """
+        Stores a frame (its index isn't kept, the pipeline's frames have a RangeIndex) and some arrays along with it.
+        Frames with columns that can't be stored (e.g., of object dtype) are skipped.
+        """
+        arrays = arrays if arrays is not None else {}
+        try:
+            columns, sections = _frame_sections(df)
+        except Exception as e:
+            print(f"The dataset won't be cached: {e}")
+            return
+        for name, array in arrays.items():
+            sections[f'arrays.{name}'] = np.asarray(array)
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        header = {'format_version': FORMAT_VERSION, 'rows': len(df), 'columns': columns, 'arrays': list(arrays)}
+        write_sections(str(self._path(key)), MAGIC, FORMAT_VERSION, header, sections)
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used files until the directory holds at most max_bytes.
+        """
+        files = []
+        for path in self.directory.glob(f'*{FRAME_SUFFIX}'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        for path in self.directory.glob(f'*{FRAME_SUFFIX}'):
+            path.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        files = list(self.directory.glob(f'*{FRAME_SUFFIX}'))
+        return {
+            "directory": str(self.directory),
+            "files": len(files),
+            "bytes": sum(path.stat().st_size for path in files),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+if __name__ == "__main__":
+    # Times a cold (parsing the CSV) and a warm (cached) pass of the pipeline over a dataset file:
+    #   python -m latam.dataset_cache <dataset.csv> <cache directory> [categorical_encoder]
+    from latam.dataset import Dataset
+
+    dataset_file, directory = sys.argv[1], sys.argv[2]
+    encoding_file = sys.argv[3] if len(sys.argv) > 3 else None
+    cache = DatasetCache(directory)
+    cache.clear()
+    frames = []
+    for run in ('cold', 'warm'):
+        start = time.perf_counter()
+        ds = Dataset(dataset_file=dataset_file, cache=cache)
+        ds.clean()
+        if encoding_file is not None:
+            ds.encode(encoding_file)
+        frames.append(ds.encoded_dataset if encoding_file is not None else ds.dataset)
+        print(f"{run}: {time.perf_counter() - start:.3f}s")
+
+    pd.testing.assert_frame_equal(frames[0], frames[1])
+    print(f"Cached and parsed datasets match, {cache.stats()}")
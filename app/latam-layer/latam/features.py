@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+from typing import List, Tuple, Dict, Optional
+import numpy as np
+
+# Definitions shared by the training pipeline (latam.dataset, latam.synthetic_features) and the serving path
+# (latam.featurizer). This module only depends on NumPy, so that serving doesn't import pandas.
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+INPUT_COLUMNS = [
+    "Fecha-I",
+    "Vlo-I",
+    "Ori-I",
+    "Des-I",
+    "Emp-I",
+    "DIA",
+    "MES",
+    "AÑO",
+    "TIPOVUELO",
+    "OPERA",
+    "SIGLAORI",
+    "SIGLADES",
+    "Temporada alta",
+    "Periodo día",
+]
+
+OUTPUT_COLUMNS = [
+    'Atraso menor', # This is the target for classification
+    'Diferencia en minutos' # This is the target for regression
+]
+
+# Columns produced by the cyclic encoding of a date, in the order they're placed in the encoded dataset.
+DATE_ENCODING_COLUMNS = ['year', 'month', 'day', 'hour']
+
+# Features of the model, in the order they're produced by Dataset.encode and split_target.
+FEATURE_COLUMNS = DATE_ENCODING_COLUMNS + [column for column in INPUT_COLUMNS if column != "Fecha-I"]
+
+HIGH_SEASONS: List[Tuple[Tuple[int, int]]] = [
+    ((12, 15), (3, 3)),
+    ((7, 15), (7, 31)),
+    ((9, 11), (9, 30)),
+]
+
+DAY_PERIODS: Dict[str, Tuple[Tuple[int, int]]] = {
+    "mañana": ((5, 0), (11, 59)),
+    "tarde": ((12, 0), (18, 59)),
+    "noche": ((19, 0), (4, 59)),
+}
+
+TWO_PI = 2*np.pi
+
+# Encoding given to categories that were not seen when fitting the target encoding.
+# XGBoost handles it as a missing value, sending it down the default branch learned for every split.
+UNSEEN_CATEGORY_VALUE = np.nan
+
+def lookup_encoding(target_encoder: dict, cat_value, default: float = UNSEEN_CATEGORY_VALUE) -> float:
+    """
+    Returns the encoding of a single category, or `default` if the category is unknown.
+    """
+    if cat_value in target_encoder:
+        return target_encoder[cat_value]
+    # Depending on how pandas inferred the CSV columns, numeric looking categories (e.g., flight numbers)
+    # may have been stored as int or as str.
+    if isinstance(cat_value, str) and cat_value.isdigit():
+        return target_encoder.get(int(cat_value), default)
+    if isinstance(cat_value, (int, np.integer)):
+        return target_encoder.get(str(cat_value), default)
+    return default
+
+def cyclic_encoding_table(period: int) -> np.ndarray:
+    """
+        Cosine encoding of every value in [0, period], rounded to 3 decimals.
+        Values are computed one at a time, so looking them up gives the same result as encoding each row.
+    """
+    return np.array([np.round(np.cos(TWO_PI * value / period), 3) for value in range(period + 1)])
+
+MONTH_ENCODING = cyclic_encoding_table(12)
+DAY_ENCODING = cyclic_encoding_table(31)
+HOUR_ENCODING = cyclic_encoding_table(24)
+
+def check_high_season(date: datetime) -> bool:
+    """
+    Single date version of SyntheticFeatures.isHighSeason, used to compute the features of one flight without pandas.
+    """
+    month_day = date.month * 100 + date.day
+    at_midnight = date.hour == 0 and date.minute == 0 and date.second == 0 and date.microsecond == 0
+    for (start_month, start_day), (end_month, end_day) in HIGH_SEASONS:
+        start = start_month * 100 + start_day
+        end = end_month * 100 + end_day
+        after_start = month_day >= start
+        before_end = month_day < end or (month_day == end and at_midnight)
+
+        # If the start month is grater than the end month, then it's a cross year period.
+        if start_month > end_month:
+            if after_start or before_end:
+                return True
+        elif after_start and before_end:
+            return True
+
+    return False
+
+def get_day_period(date: datetime) -> Optional[str]:
+    """
+    Single date version of SyntheticFeatures.flightDayPeriod, used to compute the features of one flight without pandas.
+    """
+    time_of_day = timedelta(hours=date.hour, minutes=date.minute, seconds=date.second, microseconds=date.microsecond)
+    for dayPeriodLabel, dayPeriod in DAY_PERIODS.items():
+        after_start = time_of_day >= timedelta(hours=dayPeriod[0][0], minutes=dayPeriod[0][1])
+        before_end = time_of_day <= timedelta(hours=dayPeriod[1][0], minutes=dayPeriod[1][1])
+
+        # If the start hour is grater than the end hour, then it's a cross day period.
+        if dayPeriod[0][0] > dayPeriod[1][0]:
+            if after_start or before_end:
+                return dayPeriodLabel
+        elif after_start and before_end:
+            return dayPeriodLabel
+
+    return None
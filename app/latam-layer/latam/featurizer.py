@@ -0,0 +1,89 @@
+from datetime import datetime
+from typing import List, Mapping
+import numpy as np
+from latam.features import (
+    DATE_FORMAT,
+    FEATURE_COLUMNS,
+    MONTH_ENCODING,
+    DAY_ENCODING,
+    HOUR_ENCODING,
+    UNSEEN_CATEGORY_VALUE,
+    lookup_encoding,
+    check_high_season,
+    get_day_period,
+)
+
+NUMERIC_COLUMNS = ["DIA", "MES", "AÑO"]
+
+
+class OnlineFeaturizer:
+    """
+    Maps a single flight straight to the feature vector of the model, with plain Python and the loaded encoding maps.
+    It produces the same values as going through SyntheticFeatures, Dataset.clean, Dataset.encode and split_target,
+    without building any DataFrame, which is most of the cost of serving a request.
+
+    Unlike Dataset.clean, flights whose time falls outside every day period (e.g., 11:59:30) aren't dropped:
+    their day period is encoded like an unknown category.
+    """
+
+    def __init__(self, cat_encoding_map: dict) -> None:
+        self.cat_encoding_map = cat_encoding_map
+        # The day period is a synthetic feature, computed from the date.
+        self.categoric_columns = [
+            (FEATURE_COLUMNS.index(column), column, cat_encoding_map[column])
+            for column in FEATURE_COLUMNS if column in cat_encoding_map and column != "Periodo día"
+        ]
+        self.numeric_columns = [(FEATURE_COLUMNS.index(column), column) for column in NUMERIC_COLUMNS]
+        self.high_season_position = FEATURE_COLUMNS.index("Temporada alta")
+        self.day_period_position = FEATURE_COLUMNS.index("Periodo día")
+        self.day_period_encoder = cat_encoding_map["Periodo día"]
+
+    @property
+    def n_features(self) -> int:
+        return len(FEATURE_COLUMNS)
+
+    def transform(self, flight: Mapping, out: np.ndarray = None) -> np.ndarray:
+        """
+        Writes the features of a flight (keyed by the dataset's column names) into `out`, or a new float32 array.
+        """
+        if out is None:
+            out = np.empty(len(FEATURE_COLUMNS), dtype=np.float32)
+
+        date = flight["Fecha-I"]
+        if isinstance(date, str):
+            date = datetime.strptime(date, DATE_FORMAT)
+
+        # The cyclic date encoding always comes first (see DATE_ENCODING_COLUMNS).
+        out[0] = date.year
+        out[1] = MONTH_ENCODING[date.month]
+        out[2] = DAY_ENCODING[date.day]
+        out[3] = HOUR_ENCODING[date.hour]
+
+        for position, column, target_encoder in self.categoric_columns:
+            out[position] = lookup_encoding(target_encoder, flight.get(column))
+
+        for position, column in self.numeric_columns:
+            out[position] = flight[column]
+
+        out[self.high_season_position] = check_high_season(date)
+
+        day_period = get_day_period(date)
+        if day_period is None:
+            out[self.day_period_position] = UNSEEN_CATEGORY_VALUE
+        else:
+            out[self.day_period_position] = lookup_encoding(self.day_period_encoder, day_period)
+
+        return out
+
+    def transform_many(self, flights: List[Mapping], out: np.ndarray = None) -> np.ndarray:
+        """
+        Writes the features of several flights into the rows of `out`, or a new float32 array.
+        """
+        if out is None:
+            out = np.empty((len(flights), len(FEATURE_COLUMNS)), dtype=np.float32)
+
+        for row, flight in zip(out, flights):
+            self.transform(flight, row)
+
+        return out
+
@@ -0,0 +1,223 @@
+import os
+import pickle
+import sys
+import time
+from typing import List
+import pandas as pd
+import xgboost as xgb
+from latam.artifact import save_encodings
+from latam.dataset import CATEGORICAL_ENCODER_FILE, SUPPORTED_ANOMALY_SORES
+from latam.dataset_cache import file_hash
+from latam.model import Model, PATH_TO_MODEL, DEFAULT_EXTERNAL_MEMORY_PARAMS
+from latam.statistics import anomaly_statistics, QuantileSketch, RunningMoments, ValueHistogram
+from latam.streaming import DEFAULT_CHUNKSIZE, StreamingDataset, encodings_from_statistics
+
+TRAINING_STATE_FILE = '../data/training_state.pickle'
+# Trees added to the model by every update.
+DEFAULT_INCREMENTAL_ROUNDS = 10
+# Version of the saved state (see IncrementalTrainer.save), bumped whenever its fields change.
+STATE_VERSION = 1
+STATISTICS_KINDS = {kind.__name__: kind for kind in (ValueHistogram, QuantileSketch, RunningMoments)}
+
+
+class IncrementalTrainer:
+    """
+    Keeps the sufficient statistics of the training data, so that new flight files (e.g., a daily export)
+    are folded into the target encodings and the model without going through the files seen before:
+        - the histogram of delays (latam.statistics.ValueHistogram), from which the median/MAD and mean/std
+          of the anomaly scores are computed exactly (or, with `approximate`, a quantile sketch or running moments),
+        - the sum and count of the target per category, from which the target encodings are computed,
+        - the hashes of the files already folded in, so that a file is never counted twice.
+
+    The model is boosted on the target it was trained with: the delay indicator by default, as the model served
+    by the API (its predictions are probabilities of a delay), or the delay in minutes with `for_regression`.
+    The target is kept with the statistics, so every update of a model uses the same one.
+
+    An update reads the new files only: their delays are added to the histogram, their anomalies removed
+    with the updated scores, their targets added to the statistics, and the model continues boosting
+    from the saved one (XGBoost's training continuation) for `rounds` more trees, on the new flights
+    encoded with the updated encodings. The cost of an update depends on the size of the new data only.
+
+    Two approximations come with it: flights seen before aren't scored again for anomalies when the median/MAD
+    move, and the trees of previous updates were fitted on the encodings of their time.
+
+    Usage:
+        trainer = IncrementalTrainer(threshold=4)
+        trainer.fold(["history.csv"])                     # statistics only, e.g., of the data of model.bin
+        trainer.save("training_state.pickle")
+        ...
+        trainer = IncrementalTrainer.load("training_state.pickle")
+        trainer.update(["2017-12-31.csv"], "model.bin", "categorical_encoder.pickle")
+        trainer.save("training_state.pickle")
+
+    The state is saved as a dict of its fields, along with STATE_VERSION, rather than the pickled trainer:
+    attributes can be renamed without changing the file, and a state of another version fails clearly on load.
+    """
+
+    def __init__(
+            self,
+            threshold: float = None,
+            criterion: str = 'r-zscore',
+            smoothing: float = 0,
+            chunksize: int = DEFAULT_CHUNKSIZE,
+            approximate: bool = False,
+            for_regression: bool = False,
+        ) -> None:
+        if criterion not in SUPPORTED_ANOMALY_SORES:
+            raise Exception(f"Criterion {criterion} not supported. Must be either 'r-zscore' or 'zscore'")
+
+        self.threshold = threshold
+        self.criterion = criterion
+        self.smoothing = smoothing
+        self.chunksize = chunksize
+        self.approximate = approximate
+        self.for_regression = for_regression
+        self.delay_statistics = anomaly_statistics(criterion, approximate)
+        self.cat_statistics = {}
+        self.target_sum = 0.0
+        self.target_count = 0
+        self.files = {}
+
+    def _streaming_dataset(self, dataset_file: str) -> StreamingDataset:
+        sds = StreamingDataset(dataset_file, self.chunksize, self.threshold, self.criterion, self.smoothing, self.approximate)
+        sds.delay_statistics = self.delay_statistics
+        return sds
+
+    @property
+    def cat_encoding_map(self) -> dict:
+        if self.target_count == 0:
+            raise Exception("No data was folded in yet.")
+        return encodings_from_statistics(self.cat_statistics, self.smoothing, self.target_sum / self.target_count)
+
+    def fold(self, dataset_files: List[str]) -> List[str]:
+        """
+        Adds the statistics of the files not seen before. Returns the files that were folded in.
+        """
+        new_files = []
+        for dataset_file in dataset_files:
+            digest = file_hash(dataset_file)
+            if digest in self.files:
+                print(f"Skipping {dataset_file}, already folded in as {self.files[digest]}")
+                continue
+            self.files[digest] = os.path.basename(dataset_file)
+            new_files.append(dataset_file)
+
+        # The delays of every new file are added first, so that all of them are scored with the same median/MAD.
+        if self.threshold is not None:
+            for dataset_file in new_files:
+                self._streaming_dataset(dataset_file).update_delay_statistics(self.delay_statistics)
+
+        for dataset_file in new_files:
+            target_sum, target_count = self._streaming_dataset(dataset_file).update_target_statistics(self.cat_statistics)
+            self.target_sum += target_sum
+            self.target_count += target_count
+        return new_files
+
+    def update(
+            self,
+            dataset_files: List[str],
+            model_file: str = PATH_TO_MODEL,
+            encoding_file: str = CATEGORICAL_ENCODER_FILE,
+            rounds: int = DEFAULT_INCREMENTAL_ROUNDS,
+            params: dict = None,
+        ) -> Model:
+        """
+        Folds the new files in and continues boosting the model of `model_file` on their flights.
+        The model (with its artifact, see Model.save) and the encodings are saved in place.
+        """
+        new_files = self.fold(dataset_files)
+        model = Model()
+        model.load(model_file)
+        if not new_files:
+            return model
+
+        cat_encoding_map = self.cat_encoding_map
+        chunks = []
+        for dataset_file in new_files:
+            sds = self._streaming_dataset(dataset_file)
+            sds.cat_encoding_map = cat_encoding_map
+            chunks.extend(sds.encoded_chunks(self.for_regression))
+        X = pd.concat([X for X, _ in chunks], ignore_index=True)
+        Y = pd.concat([Y for _, Y in chunks], ignore_index=True)
+
+        train_params = params if params is not None else DEFAULT_EXTERNAL_MEMORY_PARAMS
+        booster = xgb.train(train_params, xgb.DMatrix(X, label=Y), num_boost_round=rounds, xgb_model=model.model.get_booster())
+        model.model.load_model(bytearray(booster.save_raw(raw_format="ubj")))
+        model.save(model_file, cat_encoding_map)
+        save_encodings(cat_encoding_map, encoding_file)
+        print(f"Model updated with {len(X)} flights of {len(new_files)} files, {booster.num_boosted_rounds()} trees")
+        return model
+
+    def state(self) -> dict:
+        """
+        Fields of the trainer, as saved by save() and restored by from_state().
+        """
+        return {
+            'state_version': STATE_VERSION,
+            'threshold': self.threshold,
+            'criterion': self.criterion,
+            'smoothing': self.smoothing,
+            'chunksize': self.chunksize,
+            'approximate': self.approximate,
+            'for_regression': self.for_regression,
+            'delay_statistics': {'kind': type(self.delay_statistics).__name__, 'fields': dict(vars(self.delay_statistics))},
+            'cat_statistics': self.cat_statistics,
+            'target_sum': self.target_sum,
+            'target_count': self.target_count,
+            'files': self.files,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'IncrementalTrainer':
+        version = state.get('state_version') if isinstance(state, dict) else None
+        if version != STATE_VERSION:
+            raise Exception(f"Training state version {version} not supported, expected {STATE_VERSION}")
+        trainer = cls(
+            threshold=state['threshold'],
+            criterion=state['criterion'],
+            smoothing=state['smoothing'],
+            chunksize=state['chunksize'],
+            approximate=state['approximate'],
+            for_regression=state['for_regression'],
+        )
+        delay_statistics = STATISTICS_KINDS[state['delay_statistics']['kind']]()
+        vars(delay_statistics).update(state['delay_statistics']['fields'])
+        trainer.delay_statistics = delay_statistics
+        trainer.cat_statistics = state['cat_statistics']
+        trainer.target_sum = state['target_sum']
+        trainer.target_count = state['target_count']
+        trainer.files = state['files']
+        return trainer
+
+    def save(self, path: str = TRAINING_STATE_FILE) -> None:
+        with open(path, 'wb') as file:
+            pickle.dump(self.state(), file)
+
+    @classmethod
+    def load(cls, path: str = TRAINING_STATE_FILE) -> 'IncrementalTrainer':
+        with open(path, 'rb') as file:
+            state = pickle.load(file)
+        return cls.from_state(state)
+
+
+if __name__ == "__main__":
+    # Statistics of the data the current model was trained with, then updates with new files:
+    #   python -m latam.incremental init <training_state.pickle> <dataset.csv>... [--threshold N]
+    #   python -m latam.incremental update <training_state.pickle> <model.bin> <categorical_encoder.pickle> <new.csv>...
+    command, state_file, arguments = sys.argv[1], sys.argv[2], sys.argv[3:]
+    start = time.perf_counter()
+    if command == 'init':
+        threshold = None
+        if '--threshold' in arguments:
+            position = arguments.index('--threshold')
+            threshold = float(arguments[position + 1])
+            del arguments[position:position + 2]
+        trainer = IncrementalTrainer(threshold=threshold)
+        trainer.fold(arguments)
+    elif command == 'update':
+        trainer = IncrementalTrainer.load(state_file)
+        trainer.update(arguments[2:], arguments[0], arguments[1])
+    else:
+        raise Exception(f"Unknown command {command}, must be either 'init' or 'update'")
+    trainer.save(state_file)
+    print(f"{command} done in {time.perf_counter() - start:.2f}s, {trainer.target_count} flights in the statistics")
@@ -0,0 +1,60 @@
+import resource
+import sys
+import tracemalloc
+from contextlib import contextmanager
+from typing import List
+
+# ru_maxrss is reported in kilobytes on Linux, but in bytes on macOS.
+RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+def peak_rss() -> int:
+    """
+        Peak resident set size of the process, in bytes.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT
+
+
+class MemoryTracker:
+    """
+    Opt-in memory accounting for the stages of the pre-processing pipeline.
+    Python allocations (NumPy and pandas buffers included) are traced with tracemalloc, which slows things down,
+    so it's only on while a stage runs, and should only be enabled while profiling. For every stage it records:
+        - allocated_bytes: memory allocated by the stage and still held when it finished.
+        - peak_bytes: the highest memory allocated by the stage.
+        - peak_rss_bytes: the peak RSS of the whole process so far.
+    """
+
+    def __init__(self) -> None:
+        self.stages: List[dict] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        # Tracing is started for the stage and stopped once it's recorded, unless it was already on
+        # (e.g., an outer stage, or tracemalloc enabled by the caller): the rest of the process runs untraced.
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            yield
+            after, peak = tracemalloc.get_traced_memory()
+            self.stages.append({
+                'stage': name,
+                'allocated_bytes': after - before,
+                'peak_bytes': peak - before,
+                'peak_rss_bytes': peak_rss(),
+            })
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+
+    def report(self) -> str:
+        lines = [f"{'stage':<24}{'allocated (MB)':>16}{'peak (MB)':>12}{'peak RSS (MB)':>16}"]
+        for stage in self.stages:
+            lines.append(
+                f"{stage['stage']:<24}{stage['allocated_bytes'] / 1e6:>16.2f}"
+                f"{stage['peak_bytes'] / 1e6:>12.2f}{stage['peak_rss_bytes'] / 1e6:>16.2f}"
+            )
+        return "\n".join(lines)
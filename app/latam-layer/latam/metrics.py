@@ -0,0 +1,246 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+# Instrumentation is off unless enabled through these environment variables (or with metrics.enable()).
+# LATAM_METRICS=1 records the metrics served by /metrics.
+# LATAM_METRICS_LOG=1 also prints a JSON line per request, for deployments that can't be scraped (e.g., Lambda).
+METRICS_ENV = 'LATAM_METRICS'
+METRICS_LOG_ENV = 'LATAM_METRICS_LOG'
+
+# Bucket upper bounds, in seconds for durations, to tell apart stages taking microseconds from those taking seconds.
+DURATION_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+BATCH_SIZE_BUCKETS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000]
+
+PREFIX = 'latam'
+
+# Path, status, stage timings and annotations of the request being served, reported in its log line.
+_current_request: ContextVar[Optional[dict]] = ContextVar('current_request', default=None)
+
+_DISABLED = nullcontext()
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, '').lower() in ('1', 'true', 'yes', 'on')
+
+
+def _escape_label_value(value) -> str:
+    # The Prometheus text format requires backslashes, double quotes and line feeds to be escaped in label values.
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Tuple[Tuple[str, str]], extra: str = None) -> str:
+    pairs = [f'{key}="{_escape_label_value(value)}"' for key, value in labels]
+    if extra is not None:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed buckets, as exposed by Prometheus.
+    """
+
+    def __init__(self, buckets: List[float]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self, name: str, labels: Tuple[Tuple[str, str]]) -> List[str]:
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + ['+Inf'], self.counts):
+            cumulative += count
+            bound_label = f'le="{bound}"'
+            lines.append(f'{name}_bucket{_format_labels(labels, bound_label)} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {self.sum}')
+        lines.append(f'{name}_count{_format_labels(labels)} {self.count}')
+        return lines
+
+
+class Metrics:
+    """
+    Process-wide metrics of the serving and pre-processing hot paths: latency histograms per stage,
+    histograms of other values (e.g., batch sizes) and counters (e.g., model loads, cache hits).
+    Metrics are kept per label set (e.g., the stage name) and rendered in the Prometheus text format.
+
+    When disabled, every method returns right away (stage() returns a shared no-op context manager),
+    so instrumented code pays a function call and an attribute check.
+    """
+
+    def __init__(self, enabled: bool = False, log: bool = False) -> None:
+        self.enabled = enabled or log
+        self.log = log
+        self.histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self.counters: Dict[Tuple[str, Tuple], float] = {}
+        self.descriptions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def enable(self, log: bool = False) -> None:
+        self.enabled = True
+        self.log = log
+
+    def disable(self) -> None:
+        self.enabled = False
+        self.log = False
+
+    def describe(self, name: str, description: str) -> None:
+        self.descriptions[name] = description
+
+    def _histogram(self, name: str, labels: Tuple, buckets: List[float]) -> Histogram:
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram(buckets))
+        return histogram
+
+    def observe(self, name: str, value: float, buckets: List[float] = DURATION_BUCKETS, **labels) -> None:
+        if not self.enabled:
+            return
+        self._histogram(name, tuple(sorted(labels.items())), buckets).observe(value)
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def stage(self, name: str):
+        """
+        Times the block into the `stage_duration_seconds` histogram, labelled with the stage name.
+        """
+        if not self.enabled:
+            return _DISABLED
+        return self._timed_stage(name)
+
+    @contextmanager
+    def _timed_stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe('stage_duration_seconds', elapsed, stage=name)
+            request = _current_request.get()
+            if request is not None:
+                request['stages'][name] = request['stages'].get(name, 0.0) + elapsed
+
+    def current_request(self) -> Optional[dict]:
+        """
+        The request being served (see request()), to record stages run outside of its context (see batch()).
+        """
+        return _current_request.get()
+
+    @contextmanager
+    def batch(self, requests: List[Optional[dict]]):
+        """
+        Records the stages timed in the block (e.g., scoring a batch of requests in a worker thread,
+        outside of the context of the requests) in every one of `requests` (see current_request()).
+        """
+        if not self.enabled:
+            yield
+            return
+        batch = {'stages': {}}
+        token = _current_request.set(batch)
+        try:
+            yield
+        finally:
+            _current_request.reset(token)
+            for request in requests:
+                if request is not None:
+                    for name, elapsed in batch['stages'].items():
+                        request['stages'][name] = request['stages'].get(name, 0.0) + elapsed
+
+    def annotate(self, **values) -> None:
+        """
+        Adds values (e.g., the batch size) to the log line of the request being served.
+        """
+        request = _current_request.get()
+        if request is not None:
+            request.update(values)
+
+    @contextmanager
+    def request(self, path: str):
+        """
+        Tracks a request: its duration, the timings of its stages (see stage()) and, when logging is enabled,
+        prints them as a single JSON line. The block may set the `status` and `path` in the yielded dict.
+        """
+        request = {'path': path, 'status': 500, 'stages': {}}
+        token = _current_request.set(request)
+        start = time.perf_counter()
+        try:
+            yield request
+        finally:
+            elapsed = time.perf_counter() - start
+            _current_request.reset(token)
+            path, status, stages = request.pop('path'), request.pop('status'), request.pop('stages')
+            self.observe('request_duration_seconds', elapsed, path=path)
+            self.increment('requests_total', path=path, status=str(status))
+            if self.log:
+                print(json.dumps({
+                    'event': 'request',
+                    'path': path,
+                    'status': status,
+                    'duration_ms': round(elapsed * 1000, 3),
+                    'stages_ms': {stage: round(value * 1000, 3) for stage, value in stages.items()},
+                    **request,
+                }))
+
+    def render(self) -> str:
+        """
+        Metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        typed = set()
+        for (name, labels), histogram in histograms:
+            full_name = f'{PREFIX}_{name}'
+            if full_name not in typed:
+                typed.add(full_name)
+                if name in self.descriptions:
+                    lines.append(f'# HELP {full_name} {self.descriptions[name]}')
+                lines.append(f'# TYPE {full_name} histogram')
+            lines.extend(histogram.render(full_name, labels))
+
+        for (name, labels), value in counters:
+            full_name = f'{PREFIX}_{name}'
+            if full_name not in typed:
+                typed.add(full_name)
+                if name in self.descriptions:
+                    lines.append(f'# HELP {full_name} {self.descriptions[name]}')
+                lines.append(f'# TYPE {full_name} counter')
+            lines.append(f'{full_name}{_format_labels(labels)} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+
+
+metrics = Metrics(enabled=_env_flag(METRICS_ENV), log=_env_flag(METRICS_LOG_ENV))
+metrics.describe('stage_duration_seconds', 'Duration of the stages of the pipeline.')
+metrics.describe('request_duration_seconds', 'Duration of the requests, validation and serialization included.')
+metrics.describe('requests_total', 'Requests served, by path and status code.')
+metrics.describe('batch_size', 'Flights scored per request.')
+metrics.describe('scheduler_batch_size', 'Flights scored together by the request scheduler.')
+metrics.describe('model_loads_total', 'Models loaded (and reloaded) from disk.')
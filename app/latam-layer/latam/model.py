@@ -1,5 +1,10 @@
+import os
+import time
+import numpy as np
 import pandas as pd
 import xgboost as xgb
+from latam.artifact import Artifact, ARTIFACT_SUFFIX
+from latam.metrics import metrics
 
 #Hyperparameters
 DEFAULT_CLASSIFICATION_PARAMS = {
@@ -8,6 +13,14 @@ DEFAULT_CLASSIFICATION_PARAMS = {
     'learning_rate': 0.001,
 }
 
+# Same objective and number of rounds as the XGBRegressor defaults, with the histogram
+# tree method required to train from external memory.
+DEFAULT_EXTERNAL_MEMORY_PARAMS = {
+    'objective': 'reg:squarederror',
+    'tree_method': 'hist',
+}
+DEFAULT_BOOST_ROUNDS = 100
+
 PATH_TO_MODEL = '../data/model.bin'
 
 class Model:
@@ -15,12 +28,13 @@ class Model:
     as it supports both categorical and numerical variables, it handles a lot of tasks internally,
     such as cross validation, bagging, boosting, and provides feature importance metrics.
     """
-    def __init__(self) -> None:
+    def __init__(self, params: dict = None) -> None:
         self.X = None
         self.Y = None
         self.dmatrix = None
         # XGBoost library will auto-detect if the problem is classification or regression based on the target values
-        self.model = xgb.XGBRegressor()        
+        # Parameters can be tuned with latam.search.ParameterSearch (see best_params).
+        self.model = xgb.XGBRegressor(**(params or {}))
 
     def load_dataset(self,X: pd.DataFrame, Y: pd.Series) -> None:
         self.X = X
@@ -31,6 +45,17 @@ class Model:
         self.model.fit(self.X, self.Y)
         self.model_trained = True
 
+    def fit_external(self, data_iter: xgb.DataIter, params: dict = None, num_boost_round: int = DEFAULT_BOOST_ROUNDS) -> None:
+        """
+        Trains the model from an iterator over chunks of data (e.g., latam.streaming.FlightDataIter)
+        using XGBoost's external memory, so the training data never has to be fully loaded in memory.
+        """
+        train_params = params if params is not None else DEFAULT_EXTERNAL_MEMORY_PARAMS
+        self.dmatrix = xgb.DMatrix(data_iter)
+        booster = xgb.train(train_params, self.dmatrix, num_boost_round=num_boost_round)
+        self.model.load_model(bytearray(booster.save_raw(raw_format="ubj")))
+        self.model_trained = True
+
     def feature_importance(self):
         """
         XGBoost provides a way to examine the importance of each feature in the original dataset within the model.
@@ -39,26 +64,67 @@ class Model:
         if not self.model_trained:
             raise Exception('Model is not trained')
         
-        feature_names = self.X.columns
+        feature_names = self.X.columns if self.X is not None else self.model.get_booster().feature_names
         feature_importance = dict(zip(feature_names, self.model.feature_importances_))
         sorted_feature_importance = sorted(feature_importance.items(), key=lambda x: x[1], reverse=True)
         return sorted_feature_importance
 
-    def cv(self):
-        return xgb.cv(DEFAULT_CLASSIFICATION_PARAMS, self.dmatrix, num_boost_round=10, nfold=5, metrics='logloss', seed=42)
+    def cv(self, params: dict = None, num_boost_round: int = 10, nfold: int = 5, eval_metric: str = 'logloss'):
+        """
+        Single cross-validation run. To search over parameters, see latam.search.ParameterSearch.
+        """
+        cv_params = params if params is not None else DEFAULT_CLASSIFICATION_PARAMS
+        return xgb.cv(cv_params, self.dmatrix, num_boost_round=num_boost_round, nfold=nfold, metrics=eval_metric, seed=42)
     
     @staticmethod
     def predict(model: xgb.XGBRegressor, X: pd.DataFrame) -> pd.DataFrame:
-        return model.predict(X)
+        with metrics.stage("model.predict"):
+            return model.predict(X)
     
-    def save(self, path: str = None) -> None:
+    def save(self, path: str = None, cat_encoding_map: dict = None) -> None:
+        """
+        Saves the model. Given the encoding map the model was trained with,
+        both are also bundled in an artifact (see latam.artifact), which the API loads instead.
+        """
         model_path = path if path is not None else PATH_TO_MODEL
         self.model.save_model(model_path)
+        if cat_encoding_map is not None:
+            with open(model_path, 'rb') as file:
+                model_bytes = file.read()
+            Artifact.build(cat_encoding_map, model_bytes).save(os.path.splitext(model_path)[0] + ARTIFACT_SUFFIX)
 
     def load(self, path: str = None) -> None:
         model_path = path if path is not None else PATH_TO_MODEL
-        self.model.load_model(model_path)
+        with metrics.stage("model.load"):
+            self.model.load_model(model_path)
+        metrics.increment("model_loads_total")
         self.model_trained = True
         print(f"Model loaded from {model_path}")
 
 
+if __name__ == "__main__":
+    # Measures the latency of scoring a single row with Model.predict and with FastPredictor
+    # (tests/test_fast_predictor.py checks that both give the same predictions).
+    from latam.booster import Booster, FastPredictor
+    model_file = os.path.join(os.path.dirname(__file__), 'data', 'model.bin')
+    model = Model()
+    model.load(model_file)
+    with open(model_file, 'rb') as file:
+        predictor = FastPredictor(Booster(file.read()))
+
+    rng = np.random.default_rng(42)
+    X = pd.DataFrame(rng.normal(0, 10, size=(10_000, predictor.n_features)))
+    X = X.mask(rng.random(X.shape) < 0.1)  # also covers missing values
+
+    rows = X.to_numpy(dtype=np.float32)
+    for name, predict in [
+        ("Model.predict", lambda i: Model.predict(model.model, X.iloc[i:i + 1])),
+        ("FastPredictor.predict", lambda i: predictor.predict(rows[i:i + 1])),
+    ]:
+        latencies = []
+        for i in range(2_000):
+            start = time.perf_counter()
+            predict(i)
+            latencies.append(time.perf_counter() - start)
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        print(f"{name}: p50 {p50:.3f}ms, p99 {p99:.3f}ms")
@@ -0,0 +1,304 @@
+import math
+import os
+import pickle
+import threading
+import numpy as np
+import time
+from datetime import datetime
+from pathlib import Path
+from latam.artifact import Artifact
+from latam.booster import Booster, FastPredictor
+from latam.cache import PredictionCache
+from latam.features import FEATURE_COLUMNS
+from latam.featurizer import OnlineFeaturizer
+from latam.metrics import metrics
+from latam.schedule import ScheduleTable
+
+DATA_DIR = Path(__file__).parent / 'data'
+MODEL_FILE = DATA_DIR / 'model.bin'
+CATEGORICAL_ENCODER_FILE = DATA_DIR / 'categorical_encoder.pickle'
+# Both of them bundled in a memory mapped artifact (see latam.artifact), used instead when it exists.
+ARTIFACT_FILE = DATA_DIR / 'model.artifact'
+
+# How often (in seconds) the registry looks at the files on disk for changes, from a background thread.
+RELOAD_CHECK_INTERVAL = 5.0
+
+
+class LoadedModel:
+    """
+    Snapshot of everything needed at inference time: the low latency predictor of the model,
+    the target encoding maps (and the featurizer using them), the cache of their predictions and the table
+    of the scheduled flights' predictions (see latam.schedule).
+    A snapshot is never mutated once built, so a request can keep using it while a reload swaps in a new one.
+    Since the cache belongs to the snapshot, predictions of a previous model or encoders are never served.
+
+    The model is deserialized and scored through XGBoost's library (see latam.booster), never through the xgboost
+    package and the pandas/scipy/scikit-learn imports it brings: serving, explanations included, doesn't import them.
+    """
+
+    def __init__(
+            self,
+            model_bytes: bytes,
+            cat_encoding_map: dict,
+            version: str,
+            loaded_at: datetime,
+            load_time: float,
+            cache: PredictionCache = None,
+            schedule: ScheduleTable = None,
+        ) -> None:
+        self.model_bytes = model_bytes
+        self.booster = Booster(model_bytes)
+        self.predictor = FastPredictor(self.booster)
+        self.cat_encoding_map = cat_encoding_map
+        self.featurizer = OnlineFeaturizer(cat_encoding_map)
+        self.version = version
+        self.loaded_at = loaded_at
+        self.load_time = load_time
+        self.cache = cache
+        self.schedule = schedule
+        self._importance = None
+        self._importance_lock = threading.Lock()
+
+    def predict(self, features: np.ndarray, keys: list = None) -> np.ndarray:
+        """
+        Predictions for the rows of features (see OnlineFeaturizer), served from the schedule table
+        (given the flights' `keys`, see latam.schedule.schedule_key) or the cache when possible.
+        Only the rows found in neither go through the model.
+        """
+        if self.schedule is None or keys is None:
+            return self._predict(features)
+
+        scheduled = self.schedule.get_many(keys, features)
+        missing = [position for position, value in enumerate(scheduled) if value is None]
+        if len(missing) == len(keys):
+            return self._predict(features)
+
+        predictions = np.array([np.nan if value is None else value for value in scheduled], dtype=np.float32)
+        if missing:
+            predictions[missing] = self._predict(features[missing])
+        return predictions
+
+    def _predict(self, features: np.ndarray) -> np.ndarray:
+        if self.cache is None:
+            return self.predictor.predict(features)
+
+        keys = [row.tobytes() for row in features]
+        cached = self.cache.get_many(keys)
+        missing = [position for position, value in enumerate(cached) if value is None]
+        if len(missing) == len(keys):
+            predictions = self.predictor.predict(features)
+            self.cache.put_many(keys, predictions.tolist())
+            return predictions
+
+        predictions = np.array([np.nan if value is None else value for value in cached], dtype=np.float32)
+        if missing:
+            predicted = self.predictor.predict(features[missing])
+            predictions[missing] = predicted
+            self.cache.put_many([keys[position] for position in missing], predicted.tolist())
+        return predictions
+
+    def explain(self, features: np.ndarray, approximate: bool = False) -> np.ndarray:
+        """
+        Contribution of every feature (in the order of FEATURE_COLUMNS) to the predictions of the rows of features,
+        computed by XGBoost's TreeSHAP (see Booster.contributions) for the whole batch at once. The last column is the bias,
+        the expected prediction of the model: the columns of a row add up to its prediction.
+
+        Exact SHAP values cost O(trees * leaves * depth^2) per row, about a millisecond per row with the current model:
+        many times a prediction. With `approximate`, contributions are the changes of the expected
+        value along the path of every tree (Saabas' method, XGBoost's `approx_contribs`), which cost about as much as
+        a prediction but aren't SHAP values: they depend on the order of the splits.
+        Boosters can be called from several threads (e.g., the schedulers of exact and approximate explanations).
+        """
+        return self.booster.contributions(features, approximate)
+
+    @property
+    def importance(self) -> dict:
+        """
+        Global explanation of the model, computed on first use and kept with the snapshot: the expected prediction
+        (the bias of every explanation) and the importance of every feature (its share of the gain of the splits,
+        as Model.feature_importance), from the most to the least important.
+        """
+        if self._importance is None:
+            with self._importance_lock:
+                if self._importance is None:
+                    base = float(self.explain(np.zeros((1, len(FEATURE_COLUMNS)), dtype=np.float32))[0, -1])
+                    gains = self.booster.feature_importances()
+                    ranking = sorted(zip(FEATURE_COLUMNS, gains.tolist()), key=lambda item: item[1], reverse=True)
+                    self._importance = {"base": base, "features": dict(ranking)}
+        return self._importance
+
+
+class ModelRegistry:
+    """
+    Process-wide holder of the loaded model and encoders.
+    Artifacts are loaded once (at startup or on the first request) and shared by every request.
+    A background thread looks at the files every `check_interval` seconds and, when they change, reloads them
+    and swaps the new snapshot in atomically, so requests never wait for the disk or a deserialization:
+    they keep being served with the previous snapshot meanwhile. With an infinite `check_interval`,
+    files are only reloaded by explicit calls to `refresh` or `load` (see serve.py).
+
+    The artifact file, when it exists, is used instead of the model and encoding files. By default it's
+    ARTIFACT_FILE, unless other model or encoding files are given. It's only used while it's newer than both
+    the model and encoding files: once either is replaced (e.g., by retraining without rebuilding the artifact),
+    they're loaded instead, so a stale artifact is never served. An artifact given alone is always used.
+    """
+
+    def __init__(
+            self,
+            model_file: str = None,
+            encoding_file: str = None,
+            check_interval: float = RELOAD_CHECK_INTERVAL,
+            artifact_file: str = None,
+        ) -> None:
+        self.model_file = Path(model_file) if model_file is not None else MODEL_FILE
+        self.encoding_file = Path(encoding_file) if encoding_file is not None else CATEGORICAL_ENCODER_FILE
+        # Files the artifact is built from, it's ignored when any of them is newer.
+        self._artifact_sources = [self.model_file, self.encoding_file]
+        if artifact_file is None and model_file is None and encoding_file is None:
+            artifact_file = ARTIFACT_FILE
+        elif model_file is None and encoding_file is None:
+            self._artifact_sources = []
+        self.artifact_file = Path(artifact_file) if artifact_file is not None else None
+        self.check_interval = check_interval
+        self.reloads = 0
+        self._current = None
+        self._signature = None
+        self._load_lock = threading.Lock()
+        self._watcher_pid = None
+
+    def _artifact(self):
+        if self.artifact_file is None or not self.artifact_file.exists():
+            return None
+        artifact_mtime = self.artifact_file.stat().st_mtime_ns
+        for source in self._artifact_sources:
+            if source.exists() and source.stat().st_mtime_ns > artifact_mtime:
+                return None
+        return self.artifact_file
+
+    def _files_signature(self) -> tuple:
+        artifact_file = self._artifact()
+        if artifact_file is not None:
+            artifact_stat = artifact_file.stat()
+            return (str(artifact_file), artifact_stat.st_mtime_ns, artifact_stat.st_size, artifact_stat.st_ino)
+        model_stat = self.model_file.stat()
+        encoding_stat = self.encoding_file.stat()
+        return (
+            model_stat.st_mtime_ns, model_stat.st_size,
+            encoding_stat.st_mtime_ns, encoding_stat.st_size,
+        )
+
+    def _build(self) -> LoadedModel:
+        start = time.perf_counter()
+        artifact_file = self._artifact()
+        if artifact_file is None and self.artifact_file is not None and self.artifact_file.exists():
+            print(f"Ignoring {self.artifact_file}, {self.model_file} or {self.encoding_file} is newer")
+        if artifact_file is not None:
+            artifact = Artifact.load(artifact_file)
+            if artifact.model_bytes is None:
+                raise Exception(f"{artifact_file} holds encodings only, it has no model to serve")
+            loaded = LoadedModel(
+                artifact.model_bytes, artifact.encodings, artifact.version, datetime.now(), 0.0,
+                PredictionCache.from_env(artifact.version),
+                schedule=ScheduleTable.from_env(artifact.version),
+            )
+            loaded.load_time = time.perf_counter() - start
+            return loaded
+
+        model_bytes = self.model_file.read_bytes()
+        cat_encoding_map = pickle.loads(self.encoding_file.read_bytes())
+
+        # The version an artifact built from these files would have.
+        version = Artifact.build(cat_encoding_map, model_bytes).content_version()
+        loaded = LoadedModel(
+            model_bytes, cat_encoding_map, version, datetime.now(), 0.0, PredictionCache.from_env(version),
+            schedule=ScheduleTable.from_env(version),
+        )
+        loaded.load_time = time.perf_counter() - start
+        return loaded
+
+    def _load(self) -> LoadedModel:
+        # Must be called holding self._load_lock.
+        signature = self._files_signature()
+        with metrics.stage("model.load"):
+            loaded = self._build()
+        metrics.increment("model_loads_total")
+        if self._current is not None:
+            self.reloads += 1
+        self._signature = signature
+        # Replacing the reference is atomic, requests already holding the previous snapshot are unaffected.
+        self._current = loaded
+        print(f"Model {loaded.version} loaded from {self._artifact() or self.model_file} in {loaded.load_time:.3f}s")
+        return loaded
+
+    def load(self) -> LoadedModel:
+        """
+        (Re)loads the artifacts from disk and replaces the current snapshot.
+        """
+        with self._load_lock:
+            return self._load()
+
+    def refresh(self) -> bool:
+        """
+        Reloads the artifacts if the files on disk changed. Returns True if a new snapshot was swapped in.
+        If another request is already reloading, or the new files can't be loaded (e.g., they are still
+        being written), the current snapshot is kept.
+        """
+        if not self._load_lock.acquire(blocking=False):
+            return False
+        try:
+            if self._files_signature() == self._signature:
+                return False
+            self._load()
+            return True
+        except Exception as e:
+            print(f"Keeping model {self._current.version}, reload failed: {e}")
+            return False
+        finally:
+            self._load_lock.release()
+
+    def _watch(self) -> None:
+        while math.isfinite(self.check_interval):
+            time.sleep(self.check_interval)
+            if self._current is not None and math.isfinite(self.check_interval):
+                self.refresh()
+
+    def _start_watcher(self) -> None:
+        # Threads don't survive a fork: a forked process starts its own watcher on its first request.
+        if self._watcher_pid == os.getpid() or not math.isfinite(self.check_interval):
+            return
+        with self._load_lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, name='model-registry-watcher', daemon=True).start()
+
+    def get(self) -> LoadedModel:
+        """
+        Returns the current snapshot, loading it on first use (which also starts the thread watching the files).
+        Never touches the disk once loaded.
+        """
+        if self._current is None:
+            with self._load_lock:
+                if self._current is None:
+                    self._load()
+        self._start_watcher()
+
+        return self._current
+
+    def status(self) -> dict:
+        loaded = self._current
+        if loaded is None:
+            return {"loaded": False}
+
+        return {
+            "loaded": True,
+            "version": loaded.version,
+            "loaded_at": loaded.loaded_at.isoformat(),
+            "load_time_ms": round(loaded.load_time * 1000, 3),
+            "reloads": self.reloads,
+            "cache": loaded.cache.stats() if loaded.cache is not None else None,
+            "schedule": loaded.schedule.stats() if loaded.schedule is not None else None,
+        }
+
+
+registry = ModelRegistry()
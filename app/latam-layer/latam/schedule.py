@@ -0,0 +1,212 @@
+import csv
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Mapping, Optional, Tuple
+import numpy as np
+from latam.features import DATE_FORMAT
+from latam.featurizer import NUMERIC_COLUMNS
+from latam.metrics import metrics
+
+# SQLite file with the predictions of the published schedule, looked up by the API before scoring.
+# Unset by default. The file is built (and updated) with `python -m latam.schedule`.
+SCHEDULE_FILE_ENV = 'LATAM_SCHEDULE_FILE'
+
+# Flights looked up with a single query, below SQLite's limit of bound parameters.
+LOOKUP_BATCH_SIZE = 400
+
+# Model versions whose predictions are kept: the one updated last and the previous one, still served
+# by the workers of a rolling restart (see serve.py) until they load the new model.
+KEPT_VERSIONS = 2
+
+
+def schedule_key(flight: Mapping) -> Tuple[str, str]:
+    """
+    Flight number and scheduled time of a flight (keyed by the dataset's column names), as stored in the table.
+    """
+    date = flight["Fecha-I"]
+    if isinstance(date, str):
+        date = datetime.strptime(date, DATE_FORMAT)
+    return str(flight["Vlo-I"]), date.strftime(DATE_FORMAT)
+
+
+def read_schedule(path: str) -> List[dict]:
+    """
+    Flights of a schedule file, a CSV with the columns of the API's input (see latam.features.INPUT_COLUMNS).
+    Only the standard library is used, as the API gets them: strings, and integers for the numeric columns.
+    """
+    with open(path, newline='', encoding='utf-8') as file:
+        flights = list(csv.DictReader(file))
+    for flight in flights:
+        for column in NUMERIC_COLUMNS:
+            flight[column] = int(float(flight[column]))
+    return flights
+
+
+class ScheduleTable:
+    """
+    Predictions of the scheduled flights, computed ahead of time, keyed by model version, flight number
+    and scheduled time. A lookup is a search of the table's primary key (a B-tree), O(log n) per flight.
+
+    Every row also stores the features the prediction was computed from: a flight is only served from the table
+    when the request maps to the very same features (e.g., not when it asks for another origin than
+    the one published), so that the answer is always the one the model would give. Anything else is a miss,
+    and is scored by the model. Errors (e.g., the file being rebuilt) are reported as misses as well.
+
+    `update` rescores only the flights that are new or changed since the previous build with the same model,
+    and removes those no longer in the schedule. When the model changes, every flight is scored again, and
+    the predictions of older models are removed once KEPT_VERSIONS newer ones were updated.
+    """
+
+    def __init__(self, path: str, version: str) -> None:
+        # Imported here, so that serving without a schedule doesn't import it.
+        import sqlite3
+        self._sqlite3 = sqlite3
+        self.path = path
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._local = threading.local()
+
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS schedule ("
+            "version TEXT NOT NULL, flight TEXT NOT NULL, scheduled_at TEXT NOT NULL, "
+            "value REAL NOT NULL, features BLOB NOT NULL, "
+            "PRIMARY KEY (version, flight, scheduled_at)) WITHOUT ROWID"
+        )
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS versions (version TEXT PRIMARY KEY, updated_at REAL NOT NULL)"
+        )
+
+    @classmethod
+    def from_env(cls, version: str) -> Optional['ScheduleTable']:
+        """
+        Table of the LATAM_SCHEDULE_FILE environment variable, or None if it's unset or the file doesn't exist.
+        """
+        path = os.environ.get(SCHEDULE_FILE_ENV)
+        if not path or not os.path.exists(path):
+            return None
+        return cls(path, version)
+
+    def _connection(self):
+        # As in latam.cache.SQLiteCacheBackend, every thread and process opens its own connection.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = self._sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get_many(self, keys: List[Tuple[str, str]], features: np.ndarray) -> List[Optional[float]]:
+        """
+        Predictions of the flights (see schedule_key) whose features match the rows of `features`, None for the others.
+        """
+        rows = {}
+        try:
+            connection = self._connection()
+            for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+                batch = keys[start:start + LOOKUP_BATCH_SIZE]
+                placeholders = ','.join(['(?, ?)'] * len(batch))
+                parameters = [self.version]
+                for flight, scheduled_at in batch:
+                    parameters.extend((flight, scheduled_at))
+                for flight, scheduled_at, value, stored in connection.execute(
+                    "SELECT flight, scheduled_at, value, features FROM schedule "
+                    f"WHERE version = ? AND (flight, scheduled_at) IN (VALUES {placeholders})",
+                    parameters,
+                ):
+                    rows[flight, scheduled_at] = (value, stored)
+        except self._sqlite3.Error:
+            self.errors += 1
+
+        values = []
+        for key, row in zip(keys, features):
+            entry = rows.get(key)
+            values.append(entry[0] if entry is not None and entry[1] == row.tobytes() else None)
+
+        hits = sum(value is not None for value in values)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        metrics.increment("schedule_hits_total", hits)
+        metrics.increment("schedule_misses_total", len(keys) - hits)
+        return values
+
+    def update(self, flights: List[Mapping], loaded) -> Dict[str, int]:
+        """
+        Brings the table up to date with the flights of a schedule and the model of `loaded`
+        (a latam.registry.LoadedModel), featurized and scored as the API does. The update is a single transaction:
+        processes serving the API keep reading the previous table until it's committed.
+        Returns how many flights were scored, left unchanged and removed.
+        """
+        scheduled = {}
+        for flight in flights:
+            scheduled[schedule_key(flight)] = flight
+        keys = list(scheduled)
+        features = loaded.featurizer.transform_many(list(scheduled.values()), out=loaded.predictor.buffer(len(keys)))
+
+        connection = self._connection()
+        stored = {
+            (flight, scheduled_at): blob
+            for flight, scheduled_at, blob in connection.execute(
+                "SELECT flight, scheduled_at, features FROM schedule WHERE version = ?", (self.version,)
+            )
+        }
+        changed = [position for position, key in enumerate(keys) if stored.get(key) != features[position].tobytes()]
+        removed = stored.keys() - scheduled.keys()
+
+        predictions = loaded.predictor.predict(features[changed]) if changed else []
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "INSERT OR REPLACE INTO schedule (version, flight, scheduled_at, value, features) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (self.version, *keys[position], float(value), features[position].tobytes())
+                    for position, value in zip(changed, predictions)
+                ],
+            )
+            connection.executemany(
+                "DELETE FROM schedule WHERE version = ? AND flight = ? AND scheduled_at = ?",
+                [(self.version, *key) for key in removed],
+            )
+            # Workers still serving the previous model keep finding its predictions, older ones are never served again.
+            connection.execute("INSERT OR REPLACE INTO versions (version, updated_at) VALUES (?, ?)", (self.version, time.time()))
+            kept = "SELECT version FROM versions ORDER BY updated_at DESC LIMIT ?"
+            connection.execute(f"DELETE FROM schedule WHERE version NOT IN ({kept})", (KEPT_VERSIONS,))
+            connection.execute(f"DELETE FROM versions WHERE version NOT IN ({kept})", (KEPT_VERSIONS,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+        return {"scored": len(changed), "unchanged": len(keys) - len(changed), "removed": len(removed)}
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "file": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "errors": self.errors,
+        }
+
+
+if __name__ == "__main__":
+    # Scores the schedule with the model served by the API (or a given artifact) into the table, incrementally:
+    #   python -m latam.schedule <schedule.csv> <schedule.sqlite> [model.artifact]
+    from latam.registry import ModelRegistry
+
+    schedule_file, table_file = sys.argv[1], sys.argv[2]
+    artifact_file = sys.argv[3] if len(sys.argv) > 3 else None
+    start = time.perf_counter()
+    loaded = ModelRegistry(artifact_file=artifact_file).get()
+    table = ScheduleTable(table_file, loaded.version)
+    counts = table.update(read_schedule(schedule_file), loaded)
+    print(
+        f"Schedule of model {loaded.version} updated in {time.perf_counter() - start:.2f}s: "
+        f"{counts['scored']} flights scored, {counts['unchanged']} unchanged, {counts['removed']} removed"
+    )
@@ -0,0 +1,193 @@
+"""
+Offline scoring of flight files, without the API.
+
+The file (CSV or Parquet, with the columns of INPUT_COLUMNS) is read in chunks, which go through the same
+featurizer and predictor as the API (OnlineFeaturizer and FastPredictor) in a pool of processes, so a flight
+gets the same prediction from a file as from /predict. The output file (CSV or Parquet) has the rows of the input,
+in the same order, with the prediction and probability columns of the API. Rows with missing values, which
+/predict would reject, are left empty and counted as unscored. Parquet files need pyarrow.
+
+    cd app/latam-layer
+    python -m latam.scoring flights.csv predictions.parquet --workers 4 --chunksize 50000
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from pathlib import Path
+from typing import Iterator
+import numpy as np
+import pandas as pd
+from latam.artifact import load_encodings, require_pyarrow
+from latam.booster import Booster, FastPredictor
+from latam.features import INPUT_COLUMNS
+from latam.featurizer import OnlineFeaturizer
+from latam.registry import DATA_DIR, CATEGORICAL_ENCODER_FILE
+from latam.streaming import READ_DTYPE, PARSE_DATES
+
+DEFAULT_MODEL_FILE = DATA_DIR / 'model.bin'
+DEFAULT_CHUNKSIZE = 50_000
+
+# Same outputs as the API's /predict.
+PREDICTION_COLUMN = "Atraso menor"
+PROBABILITY_COLUMN = "Probabilidad atraso menor (%)"
+
+# Model and encodings of the process, loaded once by every worker (see _load).
+_scorer: dict = {}
+
+
+def read_flights(path: str, chunksize: int = DEFAULT_CHUNKSIZE) -> Iterator[pd.DataFrame]:
+    """
+    Yields the input columns of a CSV or Parquet file, `chunksize` rows at a time.
+    Categories are read as strings, as the API receives them.
+    """
+    if Path(path).suffix == '.parquet':
+        require_pyarrow(path)
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            chunk = batch.to_pandas()
+            yield chunk[[column for column in INPUT_COLUMNS if column in chunk]]
+        return
+
+    dtype = {column: value for column, value in READ_DTYPE.items() if column in INPUT_COLUMNS}
+    for chunk in pd.read_csv(path, chunksize=chunksize, dtype=dtype, parse_dates=[column for column in PARSE_DATES if column in INPUT_COLUMNS]):
+        yield chunk[[column for column in INPUT_COLUMNS if column in chunk]]
+
+
+def _load(model_file: str, encoding_file: str) -> None:
+    with open(model_file, 'rb') as file:
+        _scorer['predictor'] = FastPredictor(Booster(file.read()))
+    _scorer['featurizer'] = OnlineFeaturizer(load_encodings(encoding_file))
+
+
+def score_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """
+    The chunk with the prediction and probability of every flight it was possible to score.
+    """
+    result = chunk.reset_index(drop=True)
+    # XGBoost's predictions are float32, as the API's, which are rounded as float64 (see main.score_flights).
+    predictions = np.full(len(result), np.nan)
+
+    complete = result.notna().all(axis=1).to_numpy()
+    if complete.any():
+        flights = result[complete].to_dict(orient='records')
+        features = _scorer['featurizer'].transform_many(flights, out=_scorer['predictor'].buffer(len(flights)))
+        predictions[complete] = _scorer['predictor'].predict(features)
+
+    result[PREDICTION_COLUMN] = pd.Series(predictions > 0.5, dtype='boolean').mask(np.isnan(predictions))
+    result[PROBABILITY_COLUMN] = np.round(predictions * 100, 2)
+    return result
+
+
+class OutputWriter:
+    """
+    Appends chunks to a CSV or Parquet file (by extension), in the order they're written.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.parquet = Path(path).suffix == '.parquet'
+        self._writer = None
+        self._started = False
+
+    def write(self, chunk: pd.DataFrame) -> None:
+        if self.parquet:
+            require_pyarrow(self.path)
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table.cast(self._writer.schema))
+        else:
+            chunk.to_csv(self.path, mode='a' if self._started else 'w', header=not self._started, index=False)
+        self._started = True
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+def score_file(
+        input_file: str,
+        output_file: str,
+        model_file: str = DEFAULT_MODEL_FILE,
+        encoding_file: str = CATEGORICAL_ENCODER_FILE,
+        chunksize: int = DEFAULT_CHUNKSIZE,
+        workers: int = None,
+        progress: bool = True,
+    ) -> dict:
+    """
+    Scores every flight of `input_file` into `output_file`, and returns the number of rows and the throughput.
+
+    Chunks are scored by `workers` processes (forked before XGBoost is used, see latam.search), at most
+    two per worker are in flight, and they're written in the order they were read, so memory is bounded
+    by a few chunks whatever the size of the file.
+    """
+    workers = workers if workers is not None else os.cpu_count()
+    writer = OutputWriter(output_file)
+    rows, scored, start = 0, 0, time.perf_counter()
+
+    def written(result: pd.DataFrame) -> None:
+        nonlocal rows, scored
+        writer.write(result)
+        rows += len(result)
+        scored += int(result[PROBABILITY_COLUMN].notna().sum())
+        if progress:
+            elapsed = time.perf_counter() - start
+            print(f"{rows} rows scored in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s)", flush=True)
+
+    try:
+        if workers <= 1:
+            _load(model_file, encoding_file)
+            for chunk in read_flights(input_file, chunksize):
+                written(score_chunk(chunk))
+        else:
+            context = multiprocessing.get_context('fork')
+            with context.Pool(workers, initializer=_load, initargs=(model_file, encoding_file)) as pool:
+                pending = deque()
+                for chunk in read_flights(input_file, chunksize):
+                    if len(pending) >= 2 * workers:
+                        written(pending.popleft().get())
+                    pending.append(pool.apply_async(score_chunk, (chunk,)))
+                while pending:
+                    written(pending.popleft().get())
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "rows": rows,
+        "scored_rows": scored,
+        "unscored_rows": rows - scored,
+        "duration_s": round(elapsed, 3),
+        "rows_per_s": round(rows / elapsed, 2) if elapsed > 0 else None,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Scores a file of flights (CSV or Parquet) without the API.")
+    parser.add_argument('input', help="CSV or Parquet file with the columns of INPUT_COLUMNS.")
+    parser.add_argument('output', help="CSV or Parquet file to write the predictions to.")
+    parser.add_argument('--model', default=str(DEFAULT_MODEL_FILE))
+    parser.add_argument('--encodings', default=str(CATEGORICAL_ENCODER_FILE), help="Encoding map, pickle or artifact.")
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--quiet', action='store_true', help="Don't report the progress of every chunk.")
+    args = parser.parse_args()
+
+    summary = score_file(
+        args.input, args.output, args.model, args.encodings,
+        chunksize=args.chunksize, workers=args.workers, progress=not args.quiet,
+    )
+    print(
+        f"Scored {summary['scored_rows']} of {summary['rows']} rows in {summary['duration_s']}s "
+        f"({summary['rows_per_s']} rows/s), {summary['unscored_rows']} couldn't be scored"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,384 @@
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+from hashlib import sha256
+from typing import Dict, Iterator, List, Optional
+import numpy as np
+import xgboost as xgb
+
+# Parameters shared by every trial: histogram tree building (needed by QuantileDMatrix, and the fastest method),
+# and the same objective and metric as the model served by the API: the squared error of the delay indicator
+# (see encoded_folds), as XGBRegressor fits it.
+DEFAULT_SEARCH_PARAMS = {
+    'objective': 'reg:squarederror',
+    'eval_metric': 'rmse',
+    'tree_method': 'hist',
+}
+DEFAULT_MAX_BOOST_ROUNDS = 1000
+DEFAULT_EARLY_STOPPING_ROUNDS = 20
+DEFAULT_NFOLD = 5
+# Bins of the feature histograms. They're computed once, when the folds are built, so it can't be searched over.
+DEFAULT_MAX_BIN = 256
+
+
+class Uniform:
+    """
+    Values drawn uniformly between `low` and `high` (on a log scale with `log`, e.g., for learning rates).
+    """
+
+    def __init__(self, low: float, high: float, log: bool = False) -> None:
+        self.low = low
+        self.high = high
+        self.log = log
+
+    def sample(self, rng: np.random.Generator) -> float:
+        if self.log:
+            return float(math.exp(rng.uniform(math.log(self.low), math.log(self.high))))
+        return float(rng.uniform(self.low, self.high))
+
+
+class IntUniform:
+    """
+    Integers drawn uniformly between `low` and `high`, both included.
+    """
+
+    def __init__(self, low: int, high: int) -> None:
+        self.low = low
+        self.high = high
+
+    def sample(self, rng: np.random.Generator) -> int:
+        return int(rng.integers(self.low, self.high + 1))
+
+
+DEFAULT_SEARCH_SPACE = {
+    'max_depth': IntUniform(3, 10),
+    'learning_rate': Uniform(0.01, 0.3, log=True),
+    'subsample': Uniform(0.6, 1.0),
+    'colsample_bytree': Uniform(0.6, 1.0),
+    'min_child_weight': Uniform(1, 20, log=True),
+    'reg_lambda': Uniform(0.1, 10, log=True),
+}
+
+
+def grid_samples(space: Dict[str, list]) -> Iterator[dict]:
+    """
+    Every combination of the values of a space whose parameters are all lists.
+    """
+    for name, values in space.items():
+        if not isinstance(values, (list, tuple)):
+            raise Exception(f"Grid search needs a list of values for every parameter, {name} has {values!r}")
+    names = list(space)
+    for values in itertools.product(*[space[name] for name in names]):
+        yield dict(zip(names, values))
+
+
+def random_samples(space: dict, n_trials: int, seed: int = 42) -> Iterator[dict]:
+    """
+    `n_trials` random parameter sets: lists are sampled uniformly, distributions (e.g., Uniform) through `sample`.
+    The same seed always yields the same sets, which is what lets a search resume from its checkpoint.
+    """
+    rng = np.random.default_rng(seed)
+    for _ in range(n_trials):
+        params = {}
+        for name, values in space.items():
+            if isinstance(values, (list, tuple)):
+                value = values[rng.integers(len(values))]
+                params[name] = value.item() if isinstance(value, np.generic) else value
+            else:
+                params[name] = values.sample(rng)
+        yield params
+
+
+def trial_key(params: dict) -> str:
+    return sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def fold_assignment(n_rows: int, nfold: int = DEFAULT_NFOLD, seed: int = 42) -> np.ndarray:
+    """
+    Fold of every row, shuffled with the seed: the same rows, folds and seed always give the same assignment.
+    """
+    return np.random.default_rng(seed).permutation(n_rows) % nfold
+
+
+def encoded_folds(dataset, fold_ids: np.ndarray, smoothing: float = 0, for_regression: bool = False) -> List[tuple]:
+    """
+    Train and validation features and targets of every fold of a clean dataset (see Dataset.clean), for
+    ParameterSearch's `folds`. The target encoding of every fold is fitted on its training rows only:
+    encodings fitted on the whole dataset would hold the target of the validation rows, and the scores
+    of the search would be optimistic.
+    Both the encodings and the folds' target are the delay indicator, the target of the model served by the API,
+    or the delay in minutes with `for_regression` (see Dataset.split_target).
+    """
+    import pandas as pd
+    from latam.dataset import Dataset, target_encoding, OUTPUT_COLUMNS
+
+    target = dataset[OUTPUT_COLUMNS[1] if for_regression else OUTPUT_COLUMNS[0]]
+    folds = []
+    for fold in range(int(fold_ids.max()) + 1):
+        train, valid = fold_ids != fold, fold_ids == fold
+        cat_encoding_map = {
+            column: target_encoding(values[train], target[train], smoothing)
+            for column, values in dataset.items() if isinstance(values.dtype, pd.CategoricalDtype)
+        }
+        arrays = []
+        for rows in (train, valid):
+            part = Dataset(dataset=dataset[rows].reset_index(drop=True))
+            part.is_data_clean = True
+            part.encode(cat_encoding_map=cat_encoding_map)
+            X, Y = part.split_target(for_regression)
+            arrays.extend([np.ascontiguousarray(X, dtype=np.float32), np.asarray(Y, dtype=np.float32)])
+        folds.append(tuple(arrays))
+    return folds
+
+
+# Data of the search, set before forking the workers so that they share it copy-on-write,
+# and the fold matrices each worker builds once and reuses for all its trials.
+_shared: dict = {}
+_folds: Optional[List[tuple]] = None
+
+
+def _fold_arrays() -> Iterator[tuple]:
+    if _shared['folds'] is not None:
+        yield from _shared['folds']
+        return
+    X, Y, fold_ids = _shared['X'], _shared['Y'], _shared['fold_ids']
+    for fold in range(_shared['nfold']):
+        train, valid = fold_ids != fold, fold_ids == fold
+        yield X[train], Y[train], X[valid], Y[valid]
+
+
+def _build_folds() -> List[tuple]:
+    global _folds
+    if _folds is None:
+        _folds = []
+        for X_train, Y_train, X_valid, Y_valid in _fold_arrays():
+            dtrain = xgb.QuantileDMatrix(X_train, Y_train, max_bin=_shared['max_bin'], nthread=_shared['nthread'])
+            # The validation fold is binned with the quantiles of its training folds.
+            dvalid = xgb.QuantileDMatrix(X_valid, Y_valid, ref=dtrain, nthread=_shared['nthread'])
+            _folds.append((dtrain, dvalid))
+    return _folds
+
+
+def _run_trial(params: dict) -> dict:
+    """
+    Trains a model per fold with early stopping on the held out fold. The score is the mean of the best
+    validation scores, and the number of rounds the mean of the best iterations.
+    """
+    start = time.perf_counter()
+    train_params = {
+        **_shared['base_params'],
+        **params,
+        'max_bin': _shared['max_bin'],
+        'nthread': _shared['nthread'],
+        'seed': _shared['seed'],
+    }
+    scores, rounds = [], []
+    for dtrain, dvalid in _build_folds():
+        booster = xgb.train(
+            train_params, dtrain,
+            num_boost_round=_shared['max_boost_rounds'],
+            evals=[(dvalid, 'valid')],
+            early_stopping_rounds=_shared['early_stopping_rounds'],
+            verbose_eval=False,
+        )
+        scores.append(booster.best_score)
+        rounds.append(booster.best_iteration + 1)
+
+    return {
+        'key': trial_key(params),
+        'params': params,
+        'score': float(np.mean(scores)),
+        'score_std': float(np.std(scores)),
+        'boost_rounds': int(round(np.mean(rounds))),
+        'duration_s': round(time.perf_counter() - start, 3),
+    }
+
+
+class ParameterSearch:
+    """
+    Cross-validated search of XGBoost's hyperparameters, over a grid or random samples of a search space,
+    running the trials in a pool of processes.
+
+    The folds are binned once per process into QuantileDMatrix (hist tree method), and every trial trains
+    on them with early stopping, so the number of rounds is searched for free. The data is shared with the
+    workers by forking them. They build their own matrices: XGBoost's OpenMP runtime isn't safe to use
+    in a process forked after using it, so the parent never trains (except with a single worker, when the trials
+    run in this process and it shouldn't start a parallel search afterwards).
+
+    The folds are drawn from X and Y. When features depend on the target (e.g., target encodings), they must
+    be fitted on the training rows of every fold instead: such folds are given as `folds` (see encoded_folds).
+
+    Every finished trial is appended to `checkpoint_file` (JSON lines). A search started again with the same
+    file skips the trials already in it, so interrupted searches resume where they stopped. With `time_budget`,
+    no new trial starts after that many seconds (e.g., to fit in a nightly window), and the next run resumes.
+
+    Usage:
+        search = ParameterSearch(X, Y, checkpoint_file="search.jsonl", workers=4)
+        search.run(random_samples(DEFAULT_SEARCH_SPACE, n_trials=50))
+        model = Model(search.best_params())
+    """
+
+    def __init__(
+            self,
+            X=None,
+            Y=None,
+            base_params: dict = None,
+            nfold: int = DEFAULT_NFOLD,
+            max_boost_rounds: int = DEFAULT_MAX_BOOST_ROUNDS,
+            early_stopping_rounds: int = DEFAULT_EARLY_STOPPING_ROUNDS,
+            max_bin: int = DEFAULT_MAX_BIN,
+            workers: int = None,
+            checkpoint_file: str = None,
+            time_budget: float = None,
+            seed: int = 42,
+            folds: List[tuple] = None,
+        ) -> None:
+        if (X is None) == (folds is None):
+            raise Exception("Either X and Y or the folds must be provided.")
+        self.folds = folds
+        self.X = np.ascontiguousarray(X, dtype=np.float32) if X is not None else None
+        self.Y = np.asarray(Y, dtype=np.float32) if Y is not None else None
+        self.base_params = base_params if base_params is not None else DEFAULT_SEARCH_PARAMS
+        self.nfold = nfold if folds is None else len(folds)
+        self.max_boost_rounds = max_boost_rounds
+        self.early_stopping_rounds = early_stopping_rounds
+        self.max_bin = max_bin
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.checkpoint_file = checkpoint_file
+        self.time_budget = time_budget
+        self.seed = seed
+        self.fold_ids = fold_assignment(len(self.Y), nfold, seed) if folds is None else None
+        self.fingerprint = self._fingerprint()
+        self.results = self._read_checkpoint()
+
+    def _fingerprint(self) -> str:
+        # Results are only comparable (and resumable) for the same data, folds and training settings.
+        digest = sha256(json.dumps([
+            self.base_params, self.nfold, self.max_boost_rounds, self.early_stopping_rounds, self.max_bin, self.seed,
+        ], sort_keys=True).encode())
+        for array in (self.X, self.Y) if self.folds is None else [array for fold in self.folds for array in fold]:
+            digest.update(json.dumps(list(array.shape)).encode())
+            digest.update(array.tobytes())
+        return digest.hexdigest()[:16]
+
+    def _read_checkpoint(self) -> Dict[str, dict]:
+        results = {}
+        if self.checkpoint_file is not None and os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file) as file:
+                for line in file:
+                    # A line cut short by an interruption is ignored, and its trial is run again.
+                    try:
+                        result = json.loads(line)
+                    except ValueError:
+                        continue
+                    if result.get('search') == self.fingerprint:
+                        results[result['key']] = result
+        return results
+
+    def _record(self, result: dict) -> None:
+        result['search'] = self.fingerprint
+        self.results[result['key']] = result
+        if self.checkpoint_file is not None:
+            with open(self.checkpoint_file, 'a') as file:
+                file.write(json.dumps(result) + '\n')
+        print(f"score {result['score']:.4f} ({result['boost_rounds']} rounds, {result['duration_s']}s): {result['params']}")
+
+    def run(self, samples) -> List[dict]:
+        """
+        Runs the trials of the parameter sets in `samples` (see grid_samples and random_samples)
+        that aren't in the checkpoint yet. Returns every result, best first.
+        """
+        pending, seen = [], set()
+        for params in samples:
+            key = trial_key(params)
+            if 'max_bin' in params:
+                raise Exception("max_bin is fixed when the folds are built, it can't be searched over")
+            if key not in self.results and key not in seen:
+                seen.add(key)
+                pending.append(params)
+        print(f"{len(pending)} trials to run, {len(self.results)} already in the checkpoint")
+
+        global _folds
+        # Matrices of a previous search are dropped, the workers (or this process) build the ones of this search.
+        _folds = None
+        workers = max(1, min(self.workers, len(pending)))
+        _shared.update(
+            X=self.X, Y=self.Y, fold_ids=self.fold_ids, folds=self.folds, nfold=self.nfold, base_params=self.base_params,
+            max_boost_rounds=self.max_boost_rounds, early_stopping_rounds=self.early_stopping_rounds,
+            max_bin=self.max_bin, seed=self.seed,
+            # The cores are split between the workers.
+            nthread=max(1, (os.cpu_count() or 1) // workers),
+        )
+        deadline = time.monotonic() + self.time_budget if self.time_budget is not None else None
+
+        if workers == 1:
+            for params in pending:
+                if deadline is not None and time.monotonic() > deadline:
+                    break
+                self._record(_run_trial(params))
+        elif pending:
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                # Trials are handed out one at a time, so that none starts after the deadline.
+                running = []
+                for params in pending:
+                    while len(running) >= workers:
+                        running = self._collect(running)
+                    if deadline is not None and time.monotonic() > deadline:
+                        break
+                    running.append(pool.apply_async(_run_trial, (params,)))
+                while running:
+                    running = self._collect(running)
+
+        remaining = sum(trial_key(params) not in self.results for params in pending)
+        if remaining:
+            print(f"Time budget exhausted, {remaining} trials left for the next run")
+        return self.ranking()
+
+    def _collect(self, running: list) -> list:
+        running[0].wait(0.1)
+        still_running = []
+        for task in running:
+            if task.ready():
+                self._record(task.get())
+            else:
+                still_running.append(task)
+        return still_running
+
+    def ranking(self) -> List[dict]:
+        return sorted(self.results.values(), key=lambda result: result['score'])
+
+    def best_params(self) -> dict:
+        """
+        Parameters of the best trial for latam.model.Model (XGBRegressor), with its number of rounds.
+        """
+        if not self.results:
+            raise Exception("No trials were run yet.")
+        best = self.ranking()[0]
+        params = {**self.base_params, **best['params'], 'max_bin': self.max_bin, 'n_estimators': best['boost_rounds']}
+        params.pop('eval_metric', None)
+        return params
+
+
+if __name__ == "__main__":
+    # Random search over a dataset, with the target encodings fitted within every fold (see encoded_folds):
+    #   python -m latam.search <dataset.csv> [trials] [workers] [checkpoint.jsonl] [time budget in s]
+    from latam.dataset import Dataset
+
+    dataset_file = sys.argv[1]
+    n_trials = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    checkpoint_file = sys.argv[4] if len(sys.argv) > 4 else None
+    time_budget = float(sys.argv[5]) if len(sys.argv) > 5 else None
+
+    ds = Dataset(dataset_file=dataset_file)
+    ds.clean()
+    folds = encoded_folds(ds.dataset, fold_assignment(len(ds.dataset)))
+
+    search = ParameterSearch(folds=folds, workers=workers, checkpoint_file=checkpoint_file, time_budget=time_budget)
+    start = time.perf_counter()
+    ranking = search.run(random_samples(DEFAULT_SEARCH_SPACE, n_trials))
+    print(f"{len(ranking)} trials in {time.perf_counter() - start:.1f}s, best: {ranking[0]['score']:.4f} {search.best_params()}")
@@ -1,18 +1,223 @@
+import math
+import numpy as np
 import pandas as pd
-from scipy.stats import median_abs_deviation
 
-def robust_zscore(X: pd.Series):
+# Relative accuracy of QuantileSketch by default: the median it returns is within 0.5% of the exact one.
+DEFAULT_RELATIVE_ACCURACY = 0.005
+
+def robust_zscore(X: pd.Series, median: float = None, mad: float = None):
     """
         This method will calculate the robust zscore for a given column.
+        The median and MAD can be provided when they were computed beforehand (e.g., over all the chunks of a file).
     """
-    median = X.median()
-    mad = median_abs_deviation(X)
+    median = X.median() if median is None else median
+    if mad is None:
+        from scipy.stats import median_abs_deviation
+        mad = median_abs_deviation(X)
     return 0.6745 * (X - median) / mad
 
-def zscore(X: pd.Series):
+def zscore(X: pd.Series, mean: float = None, std: float = None):
     """
         This method will calculate the zscore for a given column.
+        The mean and standard deviation can be provided when they were computed beforehand.
     """
-    mean = X.mean()
-    std = X.std()
+    mean = X.mean() if mean is None else mean
+    std = X.std() if std is None else std
     return (X - mean) / std
+
+
+def weighted_median(values: np.ndarray, counts: np.ndarray) -> float:
+    """
+        Median of values repeated `counts` times. For an even number of samples it's the mean of the two middle ones,
+        as in np.median.
+    """
+    order = np.argsort(values)
+    values, cumulative = values[order], np.cumsum(counts[order])
+    total = cumulative[-1]
+    lower = values[np.searchsorted(cumulative, (total - 1) // 2, side='right')]
+    upper = values[np.searchsorted(cumulative, total // 2, side='right')]
+    return (lower + upper) / 2
+
+def anomaly_scores(X: pd.Series, criterion: str = 'r-zscore', statistics = None) -> pd.Series:
+    """
+        Scores of a column for a single criterion ('r-zscore' or 'zscore'). The median/MAD or mean/std
+        are taken from `statistics` when given (see anomaly_statistics), otherwise computed exactly from X.
+    """
+    if criterion == 'r-zscore':
+        if statistics is None:
+            return robust_zscore(X)
+        return robust_zscore(X, median=statistics.median(), mad=statistics.mad())
+    if criterion == 'zscore':
+        if statistics is None:
+            return zscore(X)
+        return zscore(X, mean=statistics.mean(), std=statistics.std())
+    raise Exception(f"Criterion {criterion} not supported. Must be either 'r-zscore' or 'zscore'")
+
+def anomaly_statistics(criterion: str = 'r-zscore', approximate: bool = False):
+    """
+        Empty accumulator of the statistics a criterion needs, to be updated chunk by chunk and merged across workers:
+        a ValueHistogram (exact, for columns with few distinct values such as the delay in minutes),
+        or with `approximate`, a QuantileSketch for 'r-zscore' and RunningMoments for 'zscore',
+        whose memory doesn't depend on the number of distinct values.
+    """
+    if not approximate:
+        return ValueHistogram()
+    if criterion == 'r-zscore':
+        return QuantileSketch()
+    if criterion == 'zscore':
+        return RunningMoments()
+    raise Exception(f"Criterion {criterion} not supported. Must be either 'r-zscore' or 'zscore'")
+
+
+class ValueHistogram:
+    """
+        Counts of every distinct value of a column. Histograms of different chunks of data can be merged,
+        and the statistics needed for the anomaly scores (median, MAD, mean and std) are computed from them exactly.
+        It's meant for discrete columns, such as the delay in minutes, whose number of distinct values is small.
+    """
+
+    def __init__(self) -> None:
+        self.counts = pd.Series(dtype=np.int64)
+
+    def update(self, X: pd.Series) -> None:
+        self.counts = self.counts.add(X.value_counts(), fill_value=0).astype(np.int64)
+
+    def merge(self, other: 'ValueHistogram') -> None:
+        self.counts = self.counts.add(other.counts, fill_value=0).astype(np.int64)
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    def median(self) -> float:
+        return weighted_median(self.counts.index.values.astype(np.float64), self.counts.values)
+
+    def mad(self) -> float:
+        """
+            Median absolute deviation (without scaling), like scipy.stats.median_abs_deviation.
+        """
+        deviations = np.abs(self.counts.index.values.astype(np.float64) - self.median())
+        return weighted_median(deviations, self.counts.values)
+
+    def mean(self) -> float:
+        return float(np.sum(self.counts.index.values * self.counts.values) / self.count)
+
+    def std(self) -> float:
+        """
+            Sample standard deviation (ddof=1), like pd.Series.std.
+        """
+        deviations = self.counts.index.values - self.mean()
+        return float(np.sqrt(np.sum(deviations ** 2 * self.counts.values) / (self.count - 1)))
+
+
+class RunningMoments:
+    """
+        Count, mean and sum of squared deviations of a column, updated chunk by chunk with Welford's algorithm
+        (Chan et al.'s pairwise update), which doesn't lose precision like summing values and squares does.
+        Moments of different chunks (or workers) are merged with the same update. The mean and std only differ
+        from the exact ones by floating point rounding.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def _combine(self, count: int, mean: float, m2: float) -> None:
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self._mean
+        self._mean += delta * count / total
+        self._m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def update(self, X: pd.Series) -> None:
+        values = np.asarray(X, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        mean = values.mean()
+        self._combine(len(values), mean, float(np.sum((values - mean) ** 2)))
+
+    def merge(self, other: 'RunningMoments') -> None:
+        self._combine(other.count, other._mean, other._m2)
+
+    def mean(self) -> float:
+        return float(self._mean)
+
+    def std(self) -> float:
+        """
+            Sample standard deviation (ddof=1), like pd.Series.std.
+        """
+        return float(math.sqrt(self._m2 / (self.count - 1)))
+
+
+class QuantileSketch:
+    """
+        Mergeable quantile sketch with relative accuracy guarantees (DDSketch, Masson et al. 2019), for the
+        median and MAD of the robust z-score when the column has too many distinct values for a ValueHistogram.
+        Values are counted in logarithmic buckets (one set for positive values, one for negative ones,
+        plus a count of zeros), so memory grows with log(max / min) and not with the number of rows.
+        Sketches of different chunks (or workers) are merged by adding their counts, which gives the same sketch
+        as updating a single one with all the data.
+
+        Error bounds, for a relative accuracy α (`relative_accuracy`):
+            - every value is represented within α of itself: |x' - x| <= α |x|,
+            - median: |median' - median| <= α max(|a|, |b|), where a and b are the two middle values
+              (α |median| when they have the same sign),
+            - MAD: |MAD' - MAD| <= α (MAD + 2 |median|).
+        With the default α = 0.5% and the delays of the dataset (median 9, MAD 14 minutes), the median is within
+        0.05 and the MAD within 0.16 minutes, so only rows whose robust z-score is within about 1% of the threshold
+        may be classified differently than with the exact scores (1 of 68206 rows with a threshold of 4).
+    """
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY) -> None:
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = pd.Series(dtype=np.int64)
+        self.negative = pd.Series(dtype=np.int64)
+        self.zero_count = 0
+
+    def _add(self, buckets: pd.Series, values: np.ndarray) -> pd.Series:
+        if len(values) == 0:
+            return buckets
+        keys = np.ceil(np.log(values) / self._log_gamma).astype(np.int64)
+        return buckets.add(pd.Series(keys).value_counts(), fill_value=0).astype(np.int64)
+
+    def update(self, X: pd.Series) -> None:
+        values = np.asarray(X, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.positive = self._add(self.positive, values[values > 0])
+        self.negative = self._add(self.negative, -values[values < 0])
+        self.zero_count += int(np.count_nonzero(values == 0))
+
+    def merge(self, other: 'QuantileSketch') -> None:
+        if other.relative_accuracy != self.relative_accuracy:
+            raise Exception("Only sketches with the same relative accuracy can be merged.")
+        self.positive = self.positive.add(other.positive, fill_value=0).astype(np.int64)
+        self.negative = self.negative.add(other.negative, fill_value=0).astype(np.int64)
+        self.zero_count += other.zero_count
+
+    @property
+    def count(self) -> int:
+        return int(self.positive.sum() + self.negative.sum() + self.zero_count)
+
+    def _distribution(self):
+        # Every bucket is represented by the value halfway (relatively) between its bounds, gamma^(k-1) and gamma^k.
+        def representatives(buckets: pd.Series) -> np.ndarray:
+            return 2 * self.gamma ** buckets.index.values.astype(np.float64) / (self.gamma + 1)
+        values = np.concatenate([representatives(self.positive), -representatives(self.negative), [0.0]])
+        counts = np.concatenate([self.positive.values, self.negative.values, [self.zero_count]])
+        return values, counts
+
+    def median(self) -> float:
+        return float(weighted_median(*self._distribution()))
+
+    def mad(self) -> float:
+        """
+            Median absolute deviation (without scaling), like scipy.stats.median_abs_deviation.
+        """
+        values, counts = self._distribution()
+        return float(weighted_median(np.abs(values - self.median()), counts))
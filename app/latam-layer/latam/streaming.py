@@ -0,0 +1,194 @@
+import os
+import tempfile
+from typing import Iterator, Tuple
+import pandas as pd
+import xgboost as xgb
+from latam.artifact import save_encodings
+from latam.dataset import (
+    Dataset,
+    COLUMNS_DTYPE,
+    OUTPUT_COLUMNS,
+    SUPPORTED_ANOMALY_SORES,
+    CATEGORICAL_ENCODER_FILE,
+    target_statistics,
+    encoding_from_statistics,
+)
+from latam.statistics import anomaly_scores, anomaly_statistics
+
+DEFAULT_CHUNKSIZE = 100_000
+
+# Types used to read the raw CSV. Categorical columns are read as plain strings and turned into categories
+# by Dataset.parse for every chunk, so their values don't depend on what pandas infers from each chunk.
+# Integers are read as nullable, so that rows with missing values reach Dataset.clean to be dropped.
+READ_DTYPE = {
+    key: (str if value == 'category' else 'Int64' if value == int else value)
+    for key, value in COLUMNS_DTYPE.items()
+    if value != 'datetime64[ns]'
+}
+PARSE_DATES = [key for key, value in COLUMNS_DTYPE.items() if value == 'datetime64[ns]']
+
+
+def encodings_from_statistics(cat_statistics: dict, smoothing: float = 0, prior: float = None) -> dict:
+    """
+    Target encoding maps of every categorical column, from their accumulated statistics.
+    """
+    return {
+        cat_col: encoding_from_statistics(statistics, smoothing, prior)
+        for cat_col, statistics in cat_statistics.items()
+    }
+
+
+class StreamingDataset:
+    """
+    Chunked counterpart of the Dataset class, for CSV files that are larger than RAM.
+    The file is read `chunksize` rows at a time and every chunk goes through the same pre-processing as Dataset.
+    Statistics that need the whole file (the anomaly scores' median/MAD and the target encodings)
+    are accumulated as mergeable aggregates over the chunks, so memory is bounded by the size of a chunk.
+    With `approximate`, the anomaly scores use a quantile sketch (or running moments for 'zscore') instead of
+    a histogram of the delays, see latam.statistics.anomaly_statistics.
+
+    Usage:
+        sds = StreamingDataset("dataset.csv", threshold=4)
+        sds.fit_statistics()
+        model = Model()
+        model.fit_external(FlightDataIter(sds, for_regression=False))
+    """
+
+    def __init__(
+            self,
+            dataset_file: str,
+            chunksize: int = DEFAULT_CHUNKSIZE,
+            threshold: float = None,
+            criterion: str = 'r-zscore',
+            smoothing: float = 0,
+            approximate: bool = False,
+        ) -> None:
+        if criterion not in SUPPORTED_ANOMALY_SORES:
+            raise Exception(f"Criterion {criterion} not supported. Must be either 'r-zscore' or 'zscore'")
+
+        self.dataset_file = dataset_file
+        self.chunksize = chunksize
+        self.threshold = threshold
+        self.criterion = criterion
+        self.smoothing = smoothing
+        self.approximate = approximate
+        self.delay_statistics = None
+        self.cat_statistics = None
+        self.cat_encoding_map = None
+
+    def read_chunks(self) -> Iterator[pd.DataFrame]:
+        return pd.read_csv(
+            self.dataset_file,
+            chunksize=self.chunksize,
+            dtype=READ_DTYPE,
+            parse_dates=PARSE_DATES,
+        )
+
+    def _clean_chunks(self) -> Iterator[Dataset]:
+        for chunk in self.read_chunks():
+            ds = Dataset(dataset=chunk)
+            ds.clean()
+            if ds.dataset.shape[0] > 0:
+                yield ds
+
+    def _remove_anomalies(self, ds: Dataset) -> None:
+        if self.threshold is None:
+            return
+
+        scores = anomaly_scores(ds.dataset[OUTPUT_COLUMNS[1]], self.criterion, self.delay_statistics)
+        ds.dataset = ds.dataset[scores < self.threshold].reset_index(drop=True)
+
+    def clean_chunks(self) -> Iterator[Dataset]:
+        """
+        Yields the cleaned chunks of the file, without anomalies if a threshold was given.
+        """
+        if self.threshold is not None and self.delay_statistics is None:
+            raise Exception("Statistics must be fitted first.")
+
+        for ds in self._clean_chunks():
+            self._remove_anomalies(ds)
+            if ds.dataset.shape[0] > 0:
+                yield ds
+
+    def fit_statistics(self) -> None:
+        """
+        Computes the statistics that need the whole file.
+        A first pass accumulates the statistics of the delays used by the anomaly scores (only when a threshold was given),
+        and a second one sums the target per category (after removing anomalies) to fit the target encodings.
+        """
+        if self.threshold is not None:
+            self.delay_statistics = anomaly_statistics(self.criterion, self.approximate)
+            self.update_delay_statistics(self.delay_statistics)
+
+        self.cat_statistics = {}
+        target_sum, target_count = self.update_target_statistics(self.cat_statistics)
+        self.cat_encoding_map = encodings_from_statistics(self.cat_statistics, self.smoothing, target_sum / target_count)
+
+    def update_delay_statistics(self, delay_statistics) -> None:
+        """
+        Adds the delays of the file to a histogram or sketch (e.g., the one of the files seen before, see latam.incremental).
+        """
+        for ds in self._clean_chunks():
+            delay_statistics.update(ds.dataset[OUTPUT_COLUMNS[1]])
+
+    def update_target_statistics(self, cat_statistics: dict) -> Tuple[float, int]:
+        """
+        Adds the sum and count of the target per category of the file (after removing anomalies)
+        to `cat_statistics`, in place. Returns the sum and count of the target over the file.
+        """
+        target_sum, target_count = 0.0, 0
+        for ds in self.clean_chunks():
+            target_values = ds.dataset[OUTPUT_COLUMNS[1]]
+            target_sum += target_values.sum()
+            target_count += target_values.count()
+            for cat_col, cat_col_values in ds.get_categoric_features().items():
+                statistics = target_statistics(cat_col_values, target_values)
+                if cat_col in cat_statistics:
+                    statistics = cat_statistics[cat_col].add(statistics, fill_value=0)
+                cat_statistics[cat_col] = statistics
+        return target_sum, target_count
+
+    def encoded_chunks(self, for_regression = True) -> Iterator[Tuple[pd.DataFrame, pd.Series]]:
+        """
+        Yields the (X, Y) pairs of every chunk, encoded with the fitted target encodings.
+        """
+        if self.cat_encoding_map is None:
+            raise Exception("Statistics must be fitted first.")
+
+        for ds in self.clean_chunks():
+            ds.encode(cat_encoding_map=self.cat_encoding_map)
+            yield ds.split_target(for_regression)
+
+    def save_cat_encodings(self, encoding_file: str = None) -> None:
+        encoding_path = encoding_file if encoding_file is not None else CATEGORICAL_ENCODER_FILE
+        save_encodings(self.cat_encoding_map, encoding_path)
+
+
+class FlightDataIter(xgb.DataIter):
+    """
+    Feeds the encoded chunks of a StreamingDataset to XGBoost. When used to build a DMatrix,
+    XGBoost pages the data to `cache_prefix` on disk (external memory) instead of holding it in RAM.
+    """
+
+    def __init__(self, dataset: StreamingDataset, for_regression = True, cache_prefix: str = None) -> None:
+        self.dataset = dataset
+        self.for_regression = for_regression
+        self._chunks = None
+        if cache_prefix is None:
+            cache_prefix = os.path.join(tempfile.gettempdir(), 'latam-xgb-cache')
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data) -> int:
+        if self._chunks is None:
+            self._chunks = self.dataset.encoded_chunks(self.for_regression)
+
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return 0
+
+        X, Y = chunk
+        input_data(data=X, label=Y)
+        return 1
+
+    def reset(self) -> None:
+        self._chunks = None
@@ -1,23 +1,16 @@
-from typing import List, Tuple, Dict
-from datetime import datetime
+import sys
+import numpy as np
 import pandas as pd
-
-HIGH_SEASONS: List[Tuple[Tuple[int, int]]] = [
-    ((12, 15), (3, 3)),
-    ((7, 15), (7, 31)),
-    ((9, 11), (9, 30)),
-]
-
-DAY_PERIODS: Dict[str, Tuple[Tuple[int, int]]] = {
-    "mañana": ((5, 0), (11, 59)),
-    "tarde": ((12, 0), (18, 59)),
-    "noche": ((19, 0), (4, 59)),
-}
+from latam.features import HIGH_SEASONS, DAY_PERIODS
 
 RAW_DATASET_FILE = "../data/dataset.csv"
 SYNTHETIC_FEATURES_FILE = "../data/synthetic_features.csv"
 
 class SyntheticFeatures:
+    """
+    Computes the synthetic features for a dataset. Every feature is computed column-wise
+    (datetime64 month/day/time-of-day arithmetic) instead of row by row.
+    """
 
     def __init__(self, df:pd.DataFrame):
         self.df = df
@@ -25,40 +18,48 @@ class SyntheticFeatures:
     def compute(self) -> pd.DataFrame:
         syntheticFeatures = pd.DataFrame()
 
-        if "Fecha-I" in self.df:
-            syntheticFeatures['Temporada alta'] = SyntheticFeatures.isHighSeason(self.df['Fecha-I'])
+        # Dates are parsed once and shared by every feature that needs them.
+        dates = pd.to_datetime(self.df['Fecha-I']) if "Fecha-I" in self.df else None
+
+        if dates is not None:
+            syntheticFeatures['Temporada alta'] = SyntheticFeatures.isHighSeason(dates)
 
-        if "Fecha-I" in self.df and "Fecha-O" in self.df:
-            syntheticFeatures['Diferencia en minutos'] = SyntheticFeatures.minutesDelay(self.df['Fecha-I'], self.df['Fecha-O'])
+        if dates is not None and "Fecha-O" in self.df:
+            syntheticFeatures['Diferencia en minutos'] = SyntheticFeatures.minutesDelay(dates, self.df['Fecha-O'])
 
         if "Diferencia en minutos" in syntheticFeatures:
             syntheticFeatures['Atraso menor'] = SyntheticFeatures.isMinorDelay(syntheticFeatures['Diferencia en minutos'])
         
-        if "Fecha-I" in self.df:
-            syntheticFeatures['Periodo día'] = SyntheticFeatures.flightDayPeriod(self.df['Fecha-I'])
+        if dates is not None:
+            syntheticFeatures['Periodo día'] = SyntheticFeatures.flightDayPeriod(dates)
 
         return syntheticFeatures
     
     @staticmethod
     def isHighSeason(dates: pd.Series) -> pd.Series:
-        def check(date: datetime) -> bool:
-            """Checks if the date is between the periods of high season."""
-            for highSeason in HIGH_SEASONS:
-                start = datetime(date.year, highSeason[0][0], highSeason[0][1])
-                end = datetime(date.year, highSeason[1][0], highSeason[1][1])
-
-                # check if the date is between the season months.
-                if start <= date <= end:
-                    return True
-                
-                # If the start month is grater than the end month, then it's a cross year period.
-                is_cross_year_period = highSeason[0][0] > highSeason[1][0]
-                if is_cross_year_period and (date >= start or date <= end):
-                    return True
-
-            return False
-        
-        return dates.apply(pd.to_datetime).apply(check)
+        """
+        Checks if the dates are between the periods of high season.
+        Periods are inclusive and end at midnight of their last day, e.g. (7, 31) ends at July 31st 00:00.
+        """
+        dates = pd.to_datetime(dates)
+        # Month and day are packed as MMDD so that a date within the year can be compared with a single integer.
+        month_day = dates.dt.month.values * 100 + dates.dt.day.values
+        at_midnight = (dates == dates.dt.normalize()).values
+
+        is_high_season = np.zeros(len(dates), dtype=bool)
+        for (start_month, start_day), (end_month, end_day) in HIGH_SEASONS:
+            start = start_month * 100 + start_day
+            end = end_month * 100 + end_day
+            after_start = month_day >= start
+            before_end = (month_day < end) | ((month_day == end) & at_midnight)
+
+            # If the start month is grater than the end month, then it's a cross year period.
+            if start_month > end_month:
+                is_high_season |= after_start | before_end
+            else:
+                is_high_season |= after_start & before_end
+
+        return pd.Series(is_high_season, index=dates.index, name=dates.name)
     
     @staticmethod
     def minutesDelay(x: pd.Series, y: pd.Series) -> pd.Series:
@@ -66,33 +67,59 @@ class SyntheticFeatures:
     
     @staticmethod
     def isMinorDelay(minuteDelays: pd.Series) -> pd.Series:
-        return minuteDelays.apply(lambda x: x <= 15)
+        return minuteDelays <= 15
     
     @staticmethod
     def flightDayPeriod(dates: pd.Series) -> pd.Series:
-        def getDayPeriod(date: datetime):
-            """Returns the day period of the date."""
-            for dayPeriodLabel, dayPeriod in DAY_PERIODS.items():
-                start = datetime(date.year, date.month, date.day, dayPeriod[0][0], dayPeriod[0][1])
-                end = datetime(date.year, date.month, date.day, dayPeriod[1][0], dayPeriod[1][1])
-
-                # check if the date is between the day period.
-                if start <= date <= end:
-                    return dayPeriodLabel
-                
-                # If the start hour is grater than the end hour, then it's a cross day period.
-                is_cross_day_period = dayPeriod[0][0] > dayPeriod[1][0]
-                if is_cross_day_period and (date >= start or date <= end):
-                    return dayPeriodLabel
-  
-        return dates.apply(pd.to_datetime).apply(getDayPeriod)
+        """
+        Returns the day period of the dates. Periods are inclusive and end at the first second
+        of their last minute, e.g. "mañana" ends at 11:59:00. Dates falling outside every period are None.
+        """
+        dates = pd.to_datetime(dates)
+        time_of_day = dates - dates.dt.normalize()
+
+        day_periods = np.full(len(dates), None, dtype=object)
+        unassigned = np.ones(len(dates), dtype=bool)
+        for dayPeriodLabel, dayPeriod in DAY_PERIODS.items():
+            start = pd.Timedelta(hours=dayPeriod[0][0], minutes=dayPeriod[0][1])
+            end = pd.Timedelta(hours=dayPeriod[1][0], minutes=dayPeriod[1][1])
+            after_start = (time_of_day >= start).values
+            before_end = (time_of_day <= end).values
+
+            # If the start hour is grater than the end hour, then it's a cross day period.
+            if dayPeriod[0][0] > dayPeriod[1][0]:
+                in_period = after_start | before_end
+            else:
+                in_period = after_start & before_end
+
+            in_period &= unassigned
+            day_periods[in_period] = dayPeriodLabel
+            unassigned &= ~in_period
+
+        return pd.Series(day_periods, index=dates.index, name=dates.name)
 
 
 if __name__ == "__main__":
-    # Read the data from the provided csv file.
-    csv_data = pd.read_csv(RAW_DATASET_FILE)
-    # Compute the synthetic features.
-    sf = SyntheticFeatures(csv_data)
-    sf_df = sf.compute()
-    # Stores the synthetic features in a csv file.
-    sf_df.to_csv(SYNTHETIC_FEATURES_FILE, index=False)
\ No newline at end of file
+    from latam.artifact import export_frame
+    from latam.dataset_cache import DatasetCache, file_hash, pipeline_hash
+    # The synthetic features are cached like the datasets of the pipeline (when LATAM_DATASET_CACHE is set),
+    # so the csv file is only read and computed again when it or the pipeline changes.
+    cache = DatasetCache.from_env()
+    cached = None
+    if cache is not None:
+        key = cache.key(file_hash(RAW_DATASET_FILE), pipeline_hash(), 'synthetic_features')
+        cached = cache.get(key)
+    if cached is not None:
+        sf_df, _ = cached
+    else:
+        # Read the data from the provided csv file.
+        csv_data = pd.read_csv(RAW_DATASET_FILE)
+        # Compute the synthetic features.
+        sf = SyntheticFeatures(csv_data)
+        sf_df = sf.compute()
+        if cache is not None:
+            # Text columns are stored as categories, which the cache supports, and written to csv alike.
+            cache.put(key, sf_df.astype({column: 'category' for column in sf_df.columns if sf_df[column].dtype == object}))
+    # Stores the synthetic features in a csv file, or in a Parquet/Arrow file given as argument
+    # (e.g., python -m latam.synthetic_features ../data/synthetic_features.parquet).
+    export_frame(sf_df, sys.argv[1] if len(sys.argv) > 1 else SYNTHETIC_FEATURES_FILE)
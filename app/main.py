@@ -1,11 +1,60 @@
-import pandas as pd
+import os
 import numpy as np
-from fastapi import FastAPI
+from typing import List
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import PlainTextResponse
 from datetime import datetime
 from interfaces import Flight, FIELD_MAP
 
-app = FastAPI(title="LATAM Challenge", debug=False, version="1.0.0")
+# Flights explained exactly per request, at most. Exact contributions cost about a millisecond per flight,
+# approximate ones (?approximate=true) about as much as a prediction, so these are not capped.
+MAX_EXACT_EXPLAIN_FLIGHTS = 100
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The model and encoders are loaded once per process (FastAPI startup or Lambda cold start)
+    # and then shared by every request. Mangum runs the lifespan on every invocation,
+    # so this must not reload what is already loaded.
+    from latam.registry import registry
+    registry.get()
+    yield
+
+
+class MetricsMiddleware:
+    """
+    Records the duration and status of every request (see latam.metrics), when metrics are enabled.
+    Requests are labelled with the path of their route, so that unknown paths don't create new series.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        from latam.metrics import metrics
+        if not metrics.enabled:
+            return await self.app(scope, receive, send)
+
+        with metrics.request("unmatched") as request:
+            async def send_with_status(message):
+                if message["type"] == "http.response.start":
+                    request["status"] = message["status"]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    request["path"] = route.path
+
+
+app = FastAPI(title="LATAM Challenge", debug=False, version="1.0.0", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -16,31 +65,179 @@ app.add_middleware(
 
 @app.get(path="/status", description="Service status", tags=["status"])
 async def status():
-    return f'Service is operational at: {datetime.now()}.', 
+    from latam.registry import registry
+    return {
+        "status": f'Service is operational at: {datetime.now()}.',
+        "pid": os.getpid(),
+        "model": registry.status(),
+    }
 
 
-@app.post(path="/predict", description="Predict flight delay", tags=["predict"])
-async def predict(flight: Flight):
+@app.get(path="/metrics", description="Metrics in the Prometheus text format", tags=["status"], response_class=PlainTextResponse)
+async def metrics_endpoint():
+    from latam.metrics import metrics
+    if not metrics.enabled:
+        return "# Metrics are disabled, set LATAM_METRICS=1 to enable them.\n"
+    return metrics.render()
 
+
+def featurize_flights(loaded, flights: List[Flight]):
+    """
+    Maps the flights straight to the model's features (see latam.featurizer.OnlineFeaturizer), into the
+    predictor's buffer. Also returns their keys in the table of the published schedule, when there's one.
+    """
+    from latam.metrics import metrics
+
+    features = loaded.predictor.buffer(len(flights))
+    with metrics.stage("serving.featurize"):
+        rows = [{(FIELD_MAP[key] if key in FIELD_MAP else key): value for key, value in flight} for flight in flights]
+        loaded.featurizer.transform_many(rows, out=features)
+    # Flights of the published schedule are looked up in its precomputed table, when there's one.
+    keys = None
+    if loaded.schedule is not None:
+        from latam.schedule import schedule_key
+        keys = [schedule_key(row) for row in rows]
+    return features, keys
+
+
+def predict_flights(loaded, flights: List[Flight]):
+    """
+    Predictions of the flights, scoring those that aren't precomputed (see latam.schedule) or cached
+    (see latam.cache) with one model call. Also returns their features.
+    """
+    from latam.metrics import metrics
+
+    features, keys = featurize_flights(loaded, flights)
+    with metrics.stage("serving.predict"):
+        predictions = loaded.predict(features, keys)
+    return features, predictions
+
+
+def prediction_result(prediction: float, probability: float) -> dict:
+    return {
+        "Atraso menor": True if prediction > 0.5 else False,
+        "Probabilidad atraso menor (%)": probability,
+    }
+
+
+def score_flights(flights: List[Flight]) -> List[dict]:
+    """
+    Scores the flights (see predict_flights). Results are returned in the same order as the flights.
+    """
     # The 'latam' package is locally available as a Lambda Layer
     # not as an install python package. So we need to import it
     # after the lambda handler runs.
-    from latam.model import Model
-    from latam.dataset import Dataset
+    from latam.registry import registry
 
-    parsed_flight = {
-        (FIELD_MAP[key] if key in FIELD_MAP else key): value for key, value in flight
-    }
-    flight_df = pd.DataFrame([parsed_flight])
-    ds = Dataset(dataset=flight_df)
-    ds.clean()
-    ds.encode()
-    X, _ = ds.split_target()
-    model = Model()
-    model.load()
-    prediction = Model.predict(model.model, X)
-    toReturn = {
-        "Atraso menor": True if prediction[0] > 0.5 else False,
-        "Probabilidad atraso menor (%)": np.round(prediction[0]* 100, 2),
+    _, predictions = predict_flights(registry.get(), flights)
+    probabilities = np.round(predictions.astype(np.float64) * 100, 2)
+    return [prediction_result(prediction, probability) for prediction, probability in zip(predictions, probabilities)]
+
+
+def explain_flights(flights: List[Flight], approximate: bool = False) -> List[dict]:
+    """
+    Scores the flights and explains their predictions: the contribution of every feature, in percentage points,
+    from the largest to the smallest in absolute value. They add up to the probability, starting from the base,
+    the expected probability of the model (see latam.registry.LoadedModel.explain).
+    Contributions are computed by XGBoost for all the flights at once, exactly (SHAP values) unless `approximate`.
+    """
+    from latam.registry import registry
+    from latam.features import FEATURE_COLUMNS
+    from latam.metrics import metrics
+
+    loaded = registry.get()
+    features, predictions = predict_flights(loaded, flights)
+    with metrics.stage("serving.explain"):
+        # Adding 0.0 turns the -0.0 of rounding into 0.0.
+        contributions = np.round(loaded.explain(features, approximate).astype(np.float64) * 100, 2) + 0.0
+    probabilities = np.round(predictions.astype(np.float64) * 100, 2)
+
+    results = []
+    for prediction, probability, row in zip(predictions, probabilities, contributions):
+        order = np.argsort(-np.abs(row[:-1]), kind='stable')
+        results.append({
+            **prediction_result(prediction, probability),
+            "Base (%)": row[-1],
+            "Contribuciones (%)": {FEATURE_COLUMNS[position]: row[position] for position in order},
+        })
+    return results
+
+
+def explain_flights_approximately(flights: List[Flight]) -> List[dict]:
+    return explain_flights(flights, approximate=True)
+
+
+_batchers = {}
+
+
+def get_batcher(score=score_flights):
+    """
+    The scheduler running `score` over concurrent requests together (see latam.batching.MicroBatcher),
+    or None when batching is disabled (LATAM_BATCHING=0).
+    """
+    if score not in _batchers:
+        from latam.batching import MicroBatcher
+        _batchers[score] = MicroBatcher.from_env(score)
+    return _batchers[score]
+
+
+async def schedule_flights(flights: List[Flight], score=score_flights) -> List[dict]:
+    """
+    Scores (or explains, with explain_flights) the flights of a request, through the scheduler when batching
+    is enabled, so that the event loop keeps serving other requests meanwhile.
+    """
+    from latam.metrics import metrics, BATCH_SIZE_BUCKETS
+
+    metrics.observe("batch_size", len(flights), BATCH_SIZE_BUCKETS)
+    metrics.annotate(batch_size=len(flights))
+    batcher = get_batcher(score)
+    if batcher is None:
+        return score(flights)
+    with metrics.stage("serving.scheduled"):
+        return await batcher.submit_many(flights)
+
+
+@app.post(path="/predict", description="Predict flight delay", tags=["predict"])
+async def predict(flight: Flight):
+    return (await schedule_flights([flight]))[0]
+
+
+@app.post(path="/predict/batch", description="Predict the delay of several flights at once", tags=["predict"])
+async def predict_batch(flights: List[Flight]):
+    if not flights:
+        return []
+    return await schedule_flights(flights)
+
+
+@app.post(path="/explain", description="Predict flight delay, with the contribution of every feature", tags=["explain"])
+async def explain(flight: Flight, approximate: bool = False):
+    score = explain_flights_approximately if approximate else explain_flights
+    return (await schedule_flights([flight], score))[0]
+
+
+@app.post(path="/explain/batch", description="Explain the predictions of several flights at once", tags=["explain"])
+async def explain_batch(flights: List[Flight], approximate: bool = False):
+    if not flights:
+        return []
+    if not approximate and len(flights) > MAX_EXACT_EXPLAIN_FLIGHTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_EXACT_EXPLAIN_FLIGHTS} flights are explained exactly per request, "
+                   "split the flights or use approximate=true.",
+        )
+    score = explain_flights_approximately if approximate else explain_flights
+    return await schedule_flights(flights, score)
+
+
+@app.get(path="/explain/global", description="Expected probability and importance of every feature of the model", tags=["explain"])
+def explain_global():
+    # Not async: the first call of a model deserializes it and runs XGBoost, which FastAPI runs in its thread pool
+    # instead of the event loop.
+    from latam.registry import registry
+    loaded = registry.get()
+    importance = loaded.importance
+    return {
+        "version": loaded.version,
+        "Base (%)": round(importance["base"] * 100, 2),
+        "Importancia": {feature: round(value, 4) for feature, value in importance["features"].items()},
     }
-    return toReturn
@@ -0,0 +1,249 @@
+"""
+Multi-process server for the API (POSIX only).
+
+The parent process loads the model and encoders once, warms them up and forks the workers, which share
+the parent's memory copy-on-write (the model, the encoders and every imported module) instead of loading
+their own copy, as `uvicorn --workers` does. The workers accept connections on a socket bound by the parent.
+
+    - Recycling: a worker exits gracefully after --max-requests requests (plus a random jitter,
+      so they don't all restart at once), or when it crashes, and the parent forks a new one.
+    - Hot swap: when the model files change (checked every --check-interval seconds) or on SIGHUP,
+      the parent loads the new model once and replaces the workers one at a time. The new workers share
+      the new model, and the old ones finish their in-flight requests before exiting.
+    - SIGTERM/SIGINT stop the workers gracefully.
+
+    cd app && python serve.py --workers 4 --port 8000 --max-requests 100000
+"""
+import argparse
+import asyncio
+import gc
+import os
+import random
+import signal
+import socket
+import sys
+import time
+
+# The 'latam' package is deployed as a Lambda Layer, locally it lives in latam-layer.
+LAYER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'latam-layer')
+if os.path.isdir(LAYER_DIR) and LAYER_DIR not in sys.path:
+    sys.path.append(LAYER_DIR)
+
+import uvicorn
+from interfaces import Flight
+from main import app, featurize_flights
+from latam.registry import registry, RELOAD_CHECK_INTERVAL
+
+GRACEFUL_TIMEOUT = 30.0
+# Seconds a stopping worker waits, once it stopped accepting connections, for the requests of the connections
+# it just accepted to arrive. Otherwise they would be closed as idle, without a response.
+DRAIN_DELAY = 0.5
+# Workers living less than this are considered to be failing on start, and are respawned with a delay.
+MIN_WORKER_LIFETIME = 1.0
+
+WARMUP_FLIGHT = {
+    "Fecha-I": "2017-01-01 23:30:00",
+    "Vlo-I": "226",
+    "Ori-I": "SCEL",
+    "Des-I": "KMIA",
+    "Emp-I": "AAL",
+    "DIA": 1,
+    "MES": 1,
+    "AÑO": 2017,
+    "TIPOVUELO": "I",
+    "OPERA": "American Airlines",
+    "SIGLAORI": "Santiago",
+    "SIGLADES": "Miami",
+}
+
+
+class WorkerServer(uvicorn.Server):
+    async def shutdown(self, sockets=None) -> None:
+        for server in self.servers:
+            server.close()
+        await asyncio.sleep(DRAIN_DELAY)
+        await super().shutdown(sockets)
+
+
+class PreforkServer:
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            workers: int,
+            max_requests: int = None,
+            max_requests_jitter: int = 0,
+            check_interval: float = RELOAD_CHECK_INTERVAL,
+            graceful_timeout: float = GRACEFUL_TIMEOUT,
+            log_level: str = 'info',
+        ) -> None:
+        self.host = host
+        self.port = port
+        self.n_workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.check_interval = check_interval
+        self.graceful_timeout = graceful_timeout
+        self.log_level = log_level
+        self.workers = {}
+        self.retired = set()
+        self.socket = None
+        self._stopping = False
+        self._reload_requested = False
+
+    def bind(self) -> None:
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.socket.listen(2048)
+        self.socket.set_inheritable(True)
+
+    def load(self) -> None:
+        """
+        Loads the model in the parent, so that the workers inherit it, and featurizes a flight to warm it up.
+        The warm up calls featurize_flights directly: threads (e.g., the request scheduler's) don't survive a fork.
+        The model itself isn't run: XGBoost's OpenMP threads don't survive a fork either and would hang
+        the workers, so every worker starts them on its first prediction.
+        """
+        # Only the parent looks for new model files, from its main loop (see run). A worker reloading
+        # by itself would hold its own copy, and a watcher thread in the parent would race with the forks.
+        registry.check_interval = float('inf')
+        featurize_flights(registry.get(), [Flight.model_validate(WARMUP_FLIGHT)])
+
+    def spawn(self) -> int:
+        # Objects that exist before the fork are moved out of the garbage collector's reach,
+        # otherwise collections in the workers would write to (and so copy) the pages they live in.
+        gc.collect()
+        gc.freeze()
+        pid = os.fork()
+        if pid == 0:
+            for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                signal.signal(signum, signal.SIG_DFL)
+            code = 0
+            try:
+                self.run_worker()
+            except BaseException as e:
+                print(f"Worker {os.getpid()} failed: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+
+        self.workers[pid] = time.monotonic()
+        return pid
+
+    def run_worker(self) -> None:
+        limit = None
+        if self.max_requests:
+            limit = self.max_requests + random.randint(0, self.max_requests_jitter)
+        config = uvicorn.Config(app, log_level=self.log_level, limit_max_requests=limit, timeout_graceful_shutdown=self.graceful_timeout)
+        WorkerServer(config).run(sockets=[self.socket])
+
+    def _reap(self) -> None:
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            started_at = self.workers.pop(pid, None)
+            if pid in self.retired:
+                self.retired.discard(pid)
+            elif started_at is not None and not self._stopping:
+                if time.monotonic() - started_at < MIN_WORKER_LIFETIME:
+                    time.sleep(MIN_WORKER_LIFETIME)
+                print(f"Worker {pid} exited, starting a new one")
+                self.spawn()
+
+    def rolling_restart(self) -> None:
+        """
+        Replaces the workers one at a time: a new worker is forked before an old one is asked to stop.
+        """
+        for pid in list(self.workers):
+            if pid in self.retired:
+                continue
+            self.spawn()
+            self.retired.add(pid)
+            os.kill(pid, signal.SIGTERM)
+
+    def stop(self) -> None:
+        self._stopping = True
+        for pid in self.workers:
+            os.kill(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                time.sleep(0.1)
+            else:
+                self.workers.pop(pid, None)
+
+        for pid in self.workers:
+            os.kill(pid, signal.SIGKILL)
+
+    def _handle_stop(self, signum, frame) -> None:
+        self._stopping = True
+
+    def _handle_reload(self, signum, frame) -> None:
+        self._reload_requested = True
+
+    def run(self) -> None:
+        self.bind()
+        self.load()
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+
+        for _ in range(self.n_workers):
+            self.spawn()
+        print(f"Serving on http://{self.host}:{self.port} with {self.n_workers} workers (parent {os.getpid()})")
+
+        last_check = time.monotonic()
+        while not self._stopping:
+            time.sleep(0.2)
+            self._reap()
+
+            reload = self._reload_requested
+            if time.monotonic() - last_check >= self.check_interval:
+                last_check = time.monotonic()
+                reload = True
+            if reload:
+                self._reload_requested = False
+                # refresh() only swaps the model in if the files changed, and keeps the current one if they can't be loaded.
+                if registry.refresh():
+                    self.load()
+                    print(f"Replacing the workers with model {registry.get().version}")
+                    self.rolling_restart()
+
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Multi-process server sharing the model between workers.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--max-requests', type=int, default=None, help="Requests served by a worker before it's replaced.")
+    parser.add_argument('--max-requests-jitter', type=int, default=0)
+    parser.add_argument('--check-interval', type=float, default=RELOAD_CHECK_INTERVAL, help="Seconds between checks of the model files.")
+    parser.add_argument('--graceful-timeout', type=float, default=GRACEFUL_TIMEOUT)
+    parser.add_argument('--log-level', default='info')
+    args = parser.parse_args()
+
+    PreforkServer(
+        args.host, args.port, args.workers,
+        max_requests=args.max_requests,
+        max_requests_jitter=args.max_requests_jitter,
+        check_interval=args.check_interval,
+        graceful_timeout=args.graceful_timeout,
+        log_level=args.log_level,
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import sys
+from pathlib import Path
+import pytest
+
+APP_DIR = Path(__file__).parent.parent
+# The 'latam' package is deployed as a Lambda Layer, locally it lives in latam-layer (see serve.py).
+for path in (APP_DIR, APP_DIR / 'latam-layer'):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+FLIGHTS_FILE = Path(__file__).parent / 'data' / 'flights.csv'
+
+
+@pytest.fixture(autouse=True)
+def no_dataset_cache(monkeypatch):
+    # Datasets are parsed from the fixture every time, whatever the environment of the test run.
+    monkeypatch.delenv('LATAM_DATASET_CACHE', raising=False)
+
+
+@pytest.fixture(scope='session')
+def flights_file() -> str:
+    """
+    A few hundred flights of the dataset, with the raw columns, one of them with a missing value.
+    """
+    return str(FLIGHTS_FILE)
+
+
+@pytest.fixture(scope='session')
+def cat_encoding_map() -> dict:
+    from latam.artifact import load_encodings
+    from latam.registry import CATEGORICAL_ENCODER_FILE
+    return load_encodings(CATEGORICAL_ENCODER_FILE)
+
+
+@pytest.fixture(scope='session')
+def encoded_flights(flights_file, cat_encoding_map):
+    """
+    The flights cleaned and encoded as for training, split into features and target (see Dataset.split_target).
+    """
+    from latam.dataset import Dataset
+    ds = Dataset(dataset_file=flights_file)
+    ds.clean()
+    ds.encode(cat_encoding_map=cat_encoding_map)
+    return ds.split_target(for_regression=False)
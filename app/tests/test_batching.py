@@ -0,0 +1,87 @@
+import asyncio
+import time
+import pytest
+from latam.batching import MicroBatcher
+from latam.metrics import metrics
+
+
+class RecordingScore:
+    """
+    Doubles the items, timing a stage as main.score_flights does, and records the batches it was given.
+    """
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.batches = []
+
+    def __call__(self, items: list) -> list:
+        with metrics.stage("serving.predict"):
+            time.sleep(self.delay)
+            self.batches.append(list(items))
+        return [item * 2 for item in items]
+
+
+@pytest.fixture
+def enabled_metrics():
+    metrics.enable()
+    yield metrics
+    metrics.disable()
+    metrics.reset()
+
+
+def test_stages_are_recorded_in_the_request(enabled_metrics):
+    batcher = MicroBatcher(RecordingScore())
+
+    async def request():
+        with metrics.request("/predict") as current:
+            results = await batcher.submit_many([1, 2])
+            return results, dict(current["stages"])
+
+    results, stages = asyncio.run(request())
+    batcher.stop()
+    assert results == [2, 4]
+    assert stages["serving.predict"] > 0
+
+
+def test_large_requests_are_split(enabled_metrics):
+    score = RecordingScore()
+    batcher = MicroBatcher(score, max_batch_size=2)
+    results = asyncio.run(batcher.submit_many(list(range(5))))
+    batcher.stop()
+    assert results == [item * 2 for item in range(5)]
+    assert score.batches == [[0, 1], [2, 3], [4]]
+
+
+def test_other_requests_are_scored_between_chunks():
+    score = RecordingScore(delay=0.02)
+    batcher = MicroBatcher(score, max_batch_size=2)
+
+    async def requests():
+        large = asyncio.ensure_future(batcher.submit_many(list(range(10))))
+        await asyncio.sleep(0.005)
+        small = await batcher.submit_many([100])
+        return small, await large
+
+    small, large = asyncio.run(requests())
+    batcher.stop()
+    assert small == [200] and large == [item * 2 for item in range(10)]
+    position = next(position for position, batch in enumerate(score.batches) if 100 in batch)
+    # The single flight doesn't wait for the 5 chunks of the large request.
+    assert position < len(score.batches) - 1
+
+
+def test_batches_never_exceed_max_batch_size():
+    score = RecordingScore(delay=0.05)
+    batcher = MicroBatcher(score, max_batch_size=3)
+
+    async def requests():
+        first = asyncio.ensure_future(batcher.submit_many([0]))
+        await asyncio.sleep(0.01)
+        # Queued while the first batch is scored: the second request doesn't fit with the first one.
+        results = await asyncio.gather(batcher.submit_many([1, 2]), batcher.submit_many([3, 4]), batcher.submit_many([5]))
+        return [await first] + list(results)
+
+    results = asyncio.run(requests())
+    batcher.stop()
+    assert results == [[0], [2, 4], [6, 8], [10]]
+    assert score.batches == [[0], [1, 2], [3, 4, 5]]
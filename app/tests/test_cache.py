@@ -0,0 +1,29 @@
+import time
+from latam.cache import SQLiteCacheBackend
+
+
+def test_prune_keeps_other_versions(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    previous = SQLiteCacheBackend(path, 'previous')
+    current = SQLiteCacheBackend(path, 'current')
+    previous.put_many([b'a', b'b'], [0.25, 0.5])
+    current.put_many([b'a'], [0.75])
+
+    current.prune()
+    assert previous.get_many([b'a', b'b']) == {b'a': 0.25, b'b': 0.5}
+    assert current.get_many([b'a']) == {b'a': 0.75}
+
+
+def test_prune_deletes_expired_and_excess_entries(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    expired = SQLiteCacheBackend(path, 'previous', ttl=-1.0)
+    expired.put_many([b'a'], [0.25])
+    backend = SQLiteCacheBackend(path, 'current', max_entries=2)
+    backend.put_many([b'a', b'b'], [0.5, 0.75])
+    time.sleep(0.01)
+    backend.put_many([b'c'], [1.0])
+
+    backend.prune()
+    rows = backend._connection().execute("SELECT version, key FROM predictions ORDER BY key").fetchall()
+    # The expired entry goes first, then the entry expiring first of those over max_entries.
+    assert len(rows) == 2 and ('previous', b'a') not in rows and ('current', b'c') in rows
@@ -0,0 +1,88 @@
+from collections import Counter
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from latam.dataset import Dataset, date_encoding, target_encoding, apply_target_encoding
+from latam.features import UNSEEN_CATEGORY_VALUE
+
+TWO_PI = 2*np.pi
+
+
+def reference_date_encoding(date_values: pd.Series) -> pd.DataFrame:
+    # The row by row implementation the vectorized one replaced: a one-row frame per date, concatenated.
+    def split_date(date_value: datetime) -> pd.DataFrame:
+        return pd.DataFrame({'year': [date_value.year], 'month': [date_value.month], 'day': [date_value.day], 'hour': [date_value.hour]})
+
+    date_df = pd.concat(list(date_values.apply(split_date)))
+    return pd.DataFrame({
+        'year': date_df['year'],
+        'month': date_df['month'].apply(lambda X: np.cos(TWO_PI * X / 12)).apply(lambda x: np.round(x, 3)),
+        'day': date_df['day'].apply(lambda X: np.cos(TWO_PI * X / 31)).apply(lambda x: np.round(x, 3)),
+        'hour': date_df['hour'].apply(lambda X: np.cos(TWO_PI * X / 24)).apply(lambda x: np.round(x, 3)),
+    })
+
+
+def reference_target_encoding(cat_values: pd.Series, target_values: pd.Series) -> dict:
+    # The implementation the groupby replaced: the frame is filtered once per category.
+    df = pd.DataFrame({'cat': cat_values, 'target': target_values})
+    return {
+        cat_value: np.round(df[df['cat'] == cat_value]['target'].mean(), 3)
+        for cat_value in Counter(cat_values).keys()
+    }
+
+
+@pytest.fixture(scope='module')
+def clean_flights(flights_file) -> Dataset:
+    ds = Dataset(dataset_file=flights_file)
+    ds.clean()
+    return ds
+
+
+def test_date_encoding_matches_row_by_row_implementation(clean_flights):
+    dates = clean_flights.dataset['Fecha-I']
+    # Every month, day and hour, besides the flights of the fixture.
+    dates = pd.concat([dates, pd.Series(pd.date_range('2016-01-01', '2017-12-31 23:00', freq='7h'))], ignore_index=True)
+    dates.index = dates.index + 1000
+
+    encoded = date_encoding(dates)
+    expected = reference_date_encoding(dates)
+    assert list(encoded.columns) == list(expected.columns)
+    assert encoded.index.equals(dates.index)
+    for column in expected:
+        np.testing.assert_array_equal(encoded[column].to_numpy(), expected[column].to_numpy())
+
+
+def test_encode_keeps_the_index(clean_flights, cat_encoding_map):
+    # Encoding doesn't reset (nor concatenate) the index of the dataset.
+    dataset = clean_flights.dataset.copy()
+    dataset.index = dataset.index + 1000
+    ds = Dataset(dataset=dataset)
+    ds.is_data_clean = True
+    ds.encode(cat_encoding_map=cat_encoding_map)
+    assert ds.encoded_dataset.index.equals(ds.dataset.index)
+    assert list(ds.encoded_dataset.columns[:4]) == ['year', 'month', 'day', 'hour']
+
+
+def test_target_encoding_matches_per_category_implementation(clean_flights):
+    target_values = clean_flights.dataset['Diferencia en minutos']
+    for column, cat_values in clean_flights.dataset.select_dtypes('category').items():
+        assert target_encoding(cat_values, target_values) == reference_target_encoding(cat_values, target_values), column
+
+
+def test_target_encoding_smoothing(clean_flights):
+    cat_values, target_values = clean_flights.dataset['OPERA'], clean_flights.dataset['Diferencia en minutos']
+    prior = target_values.mean()
+    encoding = target_encoding(cat_values, target_values, smoothing=10)
+    for cat_value, encoded in encoding.items():
+        targets = target_values[cat_values == cat_value]
+        assert encoded == np.round((targets.sum() + 10 * prior) / (len(targets) + 10), 3)
+
+
+def test_apply_target_encoding(clean_flights):
+    cat_values, target_values = clean_flights.dataset['Des-I'], clean_flights.dataset['Diferencia en minutos']
+    encoding = target_encoding(cat_values, target_values)
+    # Unseen categories and missing values get the fallback instead of raising a KeyError.
+    cat_values = pd.concat([cat_values.astype(str), pd.Series(['XXXX', None])], ignore_index=True).astype('category')
+    expected = [encoding.get(cat_value, UNSEEN_CATEGORY_VALUE) if isinstance(cat_value, str) else UNSEEN_CATEGORY_VALUE for cat_value in cat_values]
+    np.testing.assert_array_equal(apply_target_encoding(cat_values, encoding), expected)
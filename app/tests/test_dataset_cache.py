@@ -0,0 +1,69 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import latam.dataset_cache
+from latam.dataset import Dataset
+from latam.dataset_cache import DatasetCache
+
+
+@pytest.fixture
+def cache(tmp_path) -> DatasetCache:
+    return DatasetCache(str(tmp_path / 'cache'))
+
+
+def clean(flights_file: str, cache: DatasetCache) -> Dataset:
+    ds = Dataset(dataset_file=flights_file, cache=cache)
+    ds.clean()
+    return ds
+
+
+def test_hit(flights_file, cache, cat_encoding_map):
+    computed = clean(flights_file, cache)
+    assert (cache.hits, cache.misses) == (0, 1)
+    computed.encode(cat_encoding_map=cat_encoding_map)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+    cached = clean(flights_file, cache)
+    assert (cache.hits, cache.misses) == (1, 2)
+    pd.testing.assert_frame_equal(cached.dataset, computed.dataset)
+    np.testing.assert_array_equal(cached.kept_rows, computed.kept_rows)
+
+    cached.encode(cat_encoding_map=cat_encoding_map)
+    assert cache.hits == 2
+    pd.testing.assert_frame_equal(cached.encoded_dataset, computed.encoded_dataset)
+
+
+def test_miss_after_pipeline_change(tmp_path, monkeypatch, flights_file, cache):
+    # A module of the pipeline, whose code changes between two runs.
+    module = tmp_path / 'pipeline_module.py'
+    module.write_text("STAGES = 1\n")
+    monkeypatch.setattr(latam.dataset_cache, 'PIPELINE_MODULES', latam.dataset_cache.PIPELINE_MODULES + [str(module)])
+    monkeypatch.setattr(latam.dataset_cache, '_pipeline_hash', None)
+    clean(flights_file, cache)
+    clean(flights_file, cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    module.write_text("STAGES = 2\n")
+    monkeypatch.setattr(latam.dataset_cache, '_pipeline_hash', None)
+    clean(flights_file, cache)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_least_recently_used_are_evicted(cache):
+    frames = {name: pd.DataFrame({'value': np.arange(1000, dtype=np.int64) + number}) for number, name in enumerate('abc')}
+    cache.put('a', frames['a'])
+    size = os.path.getsize(cache._path('a'))
+    cache.max_bytes = int(2.5 * size)
+    cache.put('b', frames['b'])
+    # File times are set explicitly, as writes within a few milliseconds can get the same one.
+    os.utime(cache._path('a'), ns=(1_000_000_000, 1_000_000_000))
+    os.utime(cache._path('b'), ns=(2_000_000_000, 2_000_000_000))
+
+    # A hit makes 'a' the most recently used, so 'b' goes when 'c' doesn't fit.
+    assert cache.get('a') is not None
+    cache.put('c', frames['c'])
+    assert cache.evictions == 1
+    assert cache.get('b') is None
+    pd.testing.assert_frame_equal(cache.get('a')[0], frames['a'])
+    pd.testing.assert_frame_equal(cache.get('c')[0], frames['c'])
@@ -0,0 +1,75 @@
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+from interfaces import Flight
+from latam.features import FEATURE_COLUMNS
+from main import app, MAX_EXACT_EXPLAIN_FLIGHTS
+
+FLIGHT_FIELDS = [field.alias or name for name, field in Flight.model_fields.items()]
+PROBABILITY = "Probabilidad atraso menor (%)"
+
+
+@pytest.fixture(scope='module')
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(scope='module')
+def flights(flights_file) -> list:
+    """
+    The flights of the fixture with every field, as requests send them.
+    """
+    df = pd.read_csv(flights_file, dtype=str)[FLIGHT_FIELDS].dropna()
+    return df.to_dict(orient='records')
+
+
+def assert_adds_up(result: dict) -> None:
+    # Contributions are rounded to hundredths of a point, as the probability.
+    contributions = result["Contribuciones (%)"]
+    assert list(contributions) == sorted(contributions, key=lambda feature: -abs(contributions[feature]))
+    assert set(contributions) == set(FEATURE_COLUMNS)
+    assert result["Base (%)"] + sum(contributions.values()) == pytest.approx(result[PROBABILITY], abs=0.01 * len(FEATURE_COLUMNS))
+
+
+def test_explain(client, flights):
+    response = client.post("/explain", json=flights[0])
+    assert response.status_code == 200
+    result = response.json()
+    assert result[PROBABILITY] == client.post("/predict", json=flights[0]).json()[PROBABILITY]
+    assert_adds_up(result)
+
+
+@pytest.mark.parametrize("approximate", [False, True])
+def test_explain_batch(client, flights, approximate):
+    batch = flights[:20]
+    response = client.post("/explain/batch", params={"approximate": approximate}, json=batch)
+    assert response.status_code == 200
+    results = response.json()
+    predictions = client.post("/predict/batch", json=batch).json()
+    assert [result[PROBABILITY] for result in results] == [prediction[PROBABILITY] for prediction in predictions]
+    for result in results:
+        assert_adds_up(result)
+
+
+def test_exact_explanations_are_capped(client, flights):
+    batch = (flights * 2)[:MAX_EXACT_EXPLAIN_FLIGHTS + 1]
+    response = client.post("/explain/batch", json=batch)
+    assert response.status_code == 413
+    assert "approximate=true" in response.json()["detail"]
+
+    response = client.post("/explain/batch", params={"approximate": True}, json=batch)
+    assert response.status_code == 200
+    assert len(response.json()) == len(batch)
+
+
+def test_explain_global(client, flights):
+    response = client.get("/explain/global")
+    assert response.status_code == 200
+    result = response.json()
+    assert set(result["Importancia"]) == set(FEATURE_COLUMNS)
+    importances = list(result["Importancia"].values())
+    assert importances == sorted(importances, reverse=True)
+    # The base of every explanation is the expected probability of the model.
+    assert result["Base (%)"] == client.post("/explain", json=flights[0]).json()["Base (%)"]
+    assert result["version"] == client.get("/status").json()["model"]["version"]
@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+from latam.artifact import export_frame, read_frame
+from latam.dataset import Dataset
+from latam.synthetic_features import SyntheticFeatures
+
+
+@pytest.fixture(scope='module')
+def encoded_dataset(flights_file, cat_encoding_map) -> Dataset:
+    ds = Dataset(dataset_file=flights_file)
+    ds.clean()
+    ds.encode(cat_encoding_map=cat_encoding_map)
+    return ds
+
+
+def test_export_csv(tmp_path, encoded_dataset):
+    path = str(tmp_path / 'encoded.csv')
+    encoded_dataset.export(path)
+    pd.testing.assert_frame_equal(read_frame(path), encoded_dataset.encoded_dataset, check_dtype=False)
+
+
+@pytest.mark.parametrize("suffix", ['.parquet', '.arrow'])
+def test_export_keeps_types(tmp_path, encoded_dataset, suffix):
+    pytest.importorskip('pyarrow', exc_type=ImportError)
+    path = str(tmp_path / f'encoded{suffix}')
+    encoded_dataset.export(path)
+    pd.testing.assert_frame_equal(read_frame(path), encoded_dataset.encoded_dataset)
+
+    # The clean dataset (categories and dates) is read back as such by Dataset.
+    path = str(tmp_path / f'clean{suffix}')
+    encoded_dataset.export(path, encoded=False)
+    ds = Dataset(dataset_file=path)
+    pd.testing.assert_frame_equal(ds.dataset, encoded_dataset.dataset.reset_index(drop=True))
+
+
+@pytest.mark.parametrize("suffix", ['.parquet', '.arrow'])
+def test_export_synthetic_features(tmp_path, flights_file, suffix):
+    pytest.importorskip('pyarrow', exc_type=ImportError)
+    features = SyntheticFeatures(pd.read_csv(flights_file)).compute()
+    path = str(tmp_path / f'synthetic_features{suffix}')
+    export_frame(features, path)
+    pd.testing.assert_frame_equal(read_frame(path), features)
+
+
+def test_export_needs_encoded_data(flights_file, tmp_path):
+    with pytest.raises(Exception, match="encoded"):
+        Dataset(dataset_file=flights_file).export(str(tmp_path / 'encoded.parquet'))
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from latam.booster import Booster, FastPredictor
+from latam.model import Model
+from latam.registry import DATA_DIR
+
+
+@pytest.fixture(scope='module')
+def model() -> Model:
+    model = Model()
+    model.load(str(DATA_DIR / 'model.bin'))
+    return model
+
+
+@pytest.fixture(scope='module')
+def booster() -> Booster:
+    return Booster((DATA_DIR / 'model.bin').read_bytes())
+
+
+def test_predict_frame_matches_model_predict(model, booster, encoded_flights):
+    X, _ = encoded_flights
+    predictor = FastPredictor(booster)
+    assert np.array_equal(predictor.predict_frame(X), Model.predict(model.model, X))
+
+
+def test_predict_single_rows_matches_model_predict(model, booster, encoded_flights):
+    X, _ = encoded_flights
+    predictor = FastPredictor(booster)
+    expected = Model.predict(model.model, X)
+    rows = X.to_numpy(dtype=np.float32)
+    predictions = [predictor.predict(rows[position:position + 1])[0] for position in range(len(rows))]
+    assert np.array_equal(np.array(predictions), expected)
+
+
+def test_predict_casts_other_dtypes(model, booster, encoded_flights):
+    X, _ = encoded_flights
+    predictor = FastPredictor(booster)
+    rows = X.to_numpy(dtype=np.float64)
+    rows[::7, 3] = np.nan
+    expected = Model.predict(model.model, X.astype(np.float64).mask(np.isnan(rows)))
+    assert np.array_equal(predictor.predict(rows), expected)
+
+
+def test_buffer_is_reused(booster):
+    predictor = FastPredictor(booster, max_rows=4)
+    buffer = predictor.buffer(2)
+    assert buffer.shape == (2, predictor.n_features) and buffer.dtype == np.float32
+    assert np.shares_memory(buffer, predictor.buffer(4))
+
+
+@pytest.mark.parametrize("approximate", [False, True])
+def test_contributions_match_xgboost(model, booster, encoded_flights, approximate):
+    import xgboost as xgb
+    X, _ = encoded_flights
+    rows = X.to_numpy(dtype=np.float32)
+    expected = model.model.get_booster().predict(xgb.DMatrix(rows, missing=np.nan), pred_contribs=True, approx_contribs=approximate)
+    np.testing.assert_allclose(booster.contributions(rows, approximate), expected, rtol=1e-6, atol=1e-7)
+
+
+def test_feature_importances_match_xgboost(model, booster):
+    assert np.array_equal(booster.feature_importances(), model.model.feature_importances_)
@@ -0,0 +1,68 @@
+import os
+from datetime import datetime
+import numpy as np
+import pytest
+from latam.dataset import Dataset
+from latam.features import FEATURE_COLUMNS, UNSEEN_CATEGORY_VALUE
+from latam.featurizer import OnlineFeaturizer
+from latam.schedule import read_schedule
+
+# Path of the full dataset (data/dataset.csv), to also check the featurizer on every flight of it.
+FULL_DATASET_ENV = 'LATAM_TEST_DATASET'
+
+
+@pytest.fixture(scope='module')
+def flights(flights_file) -> list:
+    # Read with the standard library, as the API gets them: strings, and integers for the numeric columns.
+    return read_schedule(flights_file)
+
+
+def assert_matches_dataset_pipeline(dataset_file: str, flights: list, cat_encoding_map: dict):
+    ds = Dataset(dataset_file=dataset_file)
+    ds.clean()
+    ds.encode(cat_encoding_map=cat_encoding_map)
+    X, _ = ds.split_target()
+    assert list(X.columns) == FEATURE_COLUMNS
+
+    # Flights dropped by clean (e.g., with a missing value) can't be compared.
+    actual = OnlineFeaturizer(cat_encoding_map).transform_many(flights)[ds.kept_rows]
+    np.testing.assert_array_equal(actual, X.to_numpy(dtype=np.float32))
+    return ds
+
+
+def test_transform_many_matches_dataset_pipeline(flights_file, flights, cat_encoding_map):
+    ds = assert_matches_dataset_pipeline(flights_file, flights, cat_encoding_map)
+    assert len(ds.kept_rows) == len(flights) - 1
+
+
+@pytest.mark.skipif(not os.environ.get(FULL_DATASET_ENV), reason=f"{FULL_DATASET_ENV} is unset")
+def test_transform_many_matches_dataset_pipeline_on_full_dataset(cat_encoding_map):
+    # Opt-in, as it takes a while: every flight of the dataset the model was trained on.
+    dataset_file = os.environ[FULL_DATASET_ENV]
+    flights = read_schedule(dataset_file)
+    ds = assert_matches_dataset_pipeline(dataset_file, flights, cat_encoding_map)
+    assert len(ds.kept_rows) > 0.99 * len(flights)
+
+
+def test_transform_writes_into_out(flights, cat_encoding_map):
+    featurizer = OnlineFeaturizer(cat_encoding_map)
+    out = np.full((2, featurizer.n_features), np.nan, dtype=np.float32)
+    result = featurizer.transform_many(flights[:2], out=out)
+    assert result is out
+    np.testing.assert_array_equal(out, featurizer.transform_many(flights[:2]))
+
+
+def test_dates_can_be_given_as_datetimes(flights, cat_encoding_map):
+    featurizer = OnlineFeaturizer(cat_encoding_map)
+    flight = dict(flights[0], **{"Fecha-I": datetime.strptime(flights[0]["Fecha-I"], "%Y-%m-%d %H:%M:%S")})
+    np.testing.assert_array_equal(featurizer.transform(flight), featurizer.transform(flights[0]))
+
+
+def test_unknown_categories_and_day_periods(flights, cat_encoding_map):
+    featurizer = OnlineFeaturizer(cat_encoding_map)
+    # 11:59:30 falls between the morning and afternoon periods.
+    flight = dict(flights[0], **{"OPERA": "Unknown Airline", "Fecha-I": "2017-01-01 11:59:30"})
+    features = featurizer.transform(flight)
+    unseen = np.full(2, UNSEEN_CATEGORY_VALUE, dtype=np.float32)
+    positions = [FEATURE_COLUMNS.index("OPERA"), FEATURE_COLUMNS.index("Periodo día")]
+    np.testing.assert_array_equal(features[positions], unseen)
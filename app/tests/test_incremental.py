@@ -0,0 +1,65 @@
+import pickle
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from latam.artifact import load_encodings
+from latam.dataset import Dataset
+from latam.incremental import IncrementalTrainer, STATE_VERSION
+from latam.model import Model
+from latam.registry import DATA_DIR
+
+
+@pytest.fixture
+def update_files(tmp_path, flights_file):
+    """
+    A copy of the model, and the flights split in two files: the history and a new day.
+    """
+    model_file, encoding_file = tmp_path / 'model.bin', tmp_path / 'categorical_encoder.pickle'
+    shutil.copy(DATA_DIR / 'model.bin', model_file)
+    flights = pd.read_csv(flights_file)
+    history_file, new_file = tmp_path / 'history.csv', tmp_path / 'new.csv'
+    flights.iloc[:200].to_csv(history_file, index=False)
+    flights.iloc[200:].to_csv(new_file, index=False)
+    return model_file, encoding_file, history_file, new_file
+
+
+def test_update_learns_the_delay_indicator(update_files):
+    model_file, encoding_file, history_file, new_file = update_files
+    base = Model()
+    base.load(str(model_file))
+    trainer = IncrementalTrainer()
+    trainer.fold([str(history_file)])
+    model = trainer.update([str(new_file)], str(model_file), str(encoding_file), rounds=20)
+
+    # The new trees fit the new flights' delay indicator, as the model was trained with: an update that ignored them
+    # would leave the error as is, and one boosted on the delay in minutes would move predictions far from [0, 1].
+    ds = Dataset(dataset_file=str(new_file))
+    ds.clean()
+    ds.encode(cat_encoding_map=trainer.cat_encoding_map)
+    X_new, Y_new = ds.split_target(for_regression=False)
+    predictions = model.model.predict(X_new)
+    assert np.mean((predictions - Y_new) ** 2) < np.mean((base.model.predict(X_new) - Y_new) ** 2) / 2
+    assert predictions.min() > -0.25 and predictions.max() < 1.25
+    assert model.model.get_booster().num_boosted_rounds() == base.model.get_booster().num_boosted_rounds() + 20
+
+    # The encodings saved along with the model are fitted on both files.
+    assert load_encodings(str(encoding_file)).keys() == trainer.cat_encoding_map.keys()
+    saved = Model()
+    saved.load(str(model_file))
+    np.testing.assert_allclose(saved.model.predict(X_new), predictions)
+
+
+def test_state_round_trip(tmp_path, update_files):
+    _, _, history_file, _ = update_files
+    trainer = IncrementalTrainer(threshold=4)
+    trainer.fold([str(history_file)])
+    trainer.save(str(tmp_path / 'state.pickle'))
+
+    with open(tmp_path / 'state.pickle', 'rb') as file:
+        assert pickle.load(file)['state_version'] == STATE_VERSION
+    loaded = IncrementalTrainer.load(str(tmp_path / 'state.pickle'))
+    assert loaded.state().keys() == trainer.state().keys()
+    assert loaded.files == trainer.files and loaded.target_count == trainer.target_count
+    assert loaded.delay_statistics.median() == trainer.delay_statistics.median()
+    assert loaded.cat_encoding_map.keys() == trainer.cat_encoding_map.keys()
@@ -0,0 +1,21 @@
+import tracemalloc
+from latam.dataset import Dataset
+
+
+def test_tracing_stops_after_the_report(flights_file):
+    ds = Dataset(dataset_file=flights_file, track_memory=True)
+    ds.clean()
+    assert [stage['stage'] for stage in ds.memory_tracker.stages][:2] == ['read_csv', 'synthetic_features']
+    assert ds.memory_tracker.report()
+    # Tracing slows everything down, it's only on while stages run.
+    assert not tracemalloc.is_tracing()
+
+
+def test_tracing_of_the_caller_is_left_on(flights_file):
+    tracemalloc.start()
+    try:
+        ds = Dataset(dataset_file=flights_file, track_memory=True)
+        ds.clean()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
@@ -0,0 +1,18 @@
+from latam.metrics import Metrics
+
+
+def test_render_escapes_label_values():
+    metrics = Metrics(enabled=True)
+    metrics.increment('requests_total', path='/a"b\\c\nd')
+    metrics.observe('request_duration_seconds', 0.002, buckets=[0.001, 0.01], path='x"y')
+
+    lines = metrics.render().splitlines()
+    assert 'latam_requests_total{path="/a\\"b\\\\c\\nd"} 1' in lines
+    assert 'latam_request_duration_seconds_bucket{path="x\\"y",le="0.01"} 1' in lines
+    assert 'latam_request_duration_seconds_count{path="x\\"y"} 1' in lines
+
+
+def test_render_without_labels():
+    metrics = Metrics(enabled=True)
+    metrics.increment('model_loads_total')
+    assert metrics.render() == '# TYPE latam_model_loads_total counter\nlatam_model_loads_total 1\n'
@@ -0,0 +1,67 @@
+import os
+import shutil
+import pytest
+from latam.artifact import Artifact, load_encodings, save_encodings
+from latam.registry import ModelRegistry, DATA_DIR
+
+
+@pytest.fixture
+def files(tmp_path):
+    """
+    Copies of the model and encoding files, and an artifact built from them, newer than both.
+    """
+    model_file, encoding_file = tmp_path / 'model.bin', tmp_path / 'categorical_encoder.pickle'
+    shutil.copy(DATA_DIR / 'model.bin', model_file)
+    shutil.copy(DATA_DIR / 'categorical_encoder.pickle', encoding_file)
+    artifact_file = tmp_path / 'model.artifact'
+    Artifact.build(load_encodings(str(encoding_file)), model_file.read_bytes()).save(str(artifact_file))
+    os.utime(model_file, ns=(1_000_000_000, 1_000_000_000))
+    os.utime(encoding_file, ns=(1_000_000_000, 1_000_000_000))
+    return model_file, encoding_file, artifact_file
+
+
+def registry(files) -> ModelRegistry:
+    model_file, encoding_file, artifact_file = files
+    return ModelRegistry(str(model_file), str(encoding_file), check_interval=float('inf'), artifact_file=str(artifact_file))
+
+
+def test_newer_artifact_is_loaded(files):
+    loaded = registry(files).get()
+    assert loaded.version == Artifact.load(str(files[2])).version
+
+
+def test_stale_artifact_is_ignored(files):
+    _, encoding_file, artifact_file = files
+    models = registry(files)
+    artifact_version = models.get().version
+
+    # The encodings are replaced after the artifact was built, e.g., by retraining.
+    cat_encoding_map = load_encodings(str(encoding_file))
+    column = next(iter(cat_encoding_map))
+    category = next(iter(cat_encoding_map[column]))
+    cat_encoding_map[column][category] += 0.5
+    save_encodings(cat_encoding_map, str(encoding_file))
+    os.utime(encoding_file, ns=(artifact_file.stat().st_mtime_ns + 1, artifact_file.stat().st_mtime_ns + 1))
+    assert models.refresh()
+    assert models.get().version != artifact_version
+
+
+def test_artifact_given_alone_is_always_used(files):
+    _, _, artifact_file = files
+    os.utime(artifact_file, ns=(1, 1))
+    loaded = ModelRegistry(artifact_file=str(artifact_file), check_interval=float('inf')).get()
+    assert loaded.version == Artifact.load(str(artifact_file)).version
+
+
+def test_artifact_without_model_fails_clearly(files):
+    _, encoding_file, artifact_file = files
+    Artifact.build(load_encodings(str(encoding_file))).save(str(artifact_file))
+    with pytest.raises(Exception, match="has no model"):
+        registry(files).get()
+
+
+def test_version_is_the_same_from_files_and_artifact(files):
+    model_file, encoding_file, artifact_file = files
+    loaded = ModelRegistry(str(model_file), str(encoding_file), check_interval=float('inf')).get()
+    # Cached predictions and the schedule table are keyed by the version, whichever way the model is loaded.
+    assert loaded.version == Artifact.load(str(artifact_file)).version
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+from interfaces import Flight
+from latam.registry import ModelRegistry, DATA_DIR
+from latam.schedule import ScheduleTable, KEPT_VERSIONS, read_schedule, schedule_key
+
+FLIGHT_FIELDS = [field.alias or name for name, field in Flight.model_fields.items()]
+
+
+@pytest.fixture(scope='module')
+def loaded():
+    models = ModelRegistry(str(DATA_DIR / 'model.bin'), str(DATA_DIR / 'categorical_encoder.pickle'), check_interval=float('inf'))
+    return models.get()
+
+
+@pytest.fixture
+def flights(tmp_path, flights_file) -> list:
+    """
+    The complete flights of the fixture, as a published schedule.
+    """
+    schedule = pd.read_csv(flights_file, dtype=str)[FLIGHT_FIELDS].dropna().drop_duplicates(['Vlo-I', 'Fecha-I'])
+    path = str(tmp_path / 'schedule.csv')
+    schedule.to_csv(path, index=False)
+    return read_schedule(path)
+
+
+def lookup(table: ScheduleTable, flights: list, loaded) -> list:
+    # As the API does: the flights are featurized, and looked up with their features.
+    features = loaded.featurizer.transform_many(flights, out=np.empty((len(flights), loaded.predictor.n_features), dtype=np.float32))
+    return table.get_many([schedule_key(flight) for flight in flights], features)
+
+
+def test_update_and_lookup(tmp_path, flights, loaded):
+    table = ScheduleTable(str(tmp_path / 'schedule.sqlite'), loaded.version)
+    assert table.update(flights, loaded) == {"scored": len(flights), "unchanged": 0, "removed": 0}
+
+    features = loaded.featurizer.transform_many(flights, out=np.empty((len(flights), loaded.predictor.n_features), dtype=np.float32))
+    expected = loaded.predictor.predict(features)
+    np.testing.assert_array_equal(np.array(lookup(table, flights, loaded), dtype=np.float32), expected)
+    assert table.hits == len(flights) and table.misses == 0
+
+    # Only the new or changed flights are scored again.
+    changed = dict(flights[0], **{"Des-I": flights[1]["Des-I"] if flights[1]["Des-I"] != flights[0]["Des-I"] else "SCEL"})
+    assert table.update([changed] + flights[1:-1], loaded) == {"scored": 1, "unchanged": len(flights) - 2, "removed": 1}
+    assert lookup(table, [flights[-1]], loaded) == [None]
+
+
+def test_stale_features_are_misses(tmp_path, flights, loaded):
+    table = ScheduleTable(str(tmp_path / 'schedule.sqlite'), loaded.version)
+    table.update(flights, loaded)
+
+    # Same flight number and time as published, another destination: the stored prediction isn't the model's answer.
+    requested = dict(flights[0], **{"Des-I": "SCEL" if flights[0]["Des-I"] != "SCEL" else "SAEZ"})
+    assert lookup(table, [requested], loaded) == [None]
+    assert lookup(table, [flights[0]], loaded)[0] is not None
+    assert table.hits == 1 and table.misses == 1
+
+
+def test_previous_version_is_kept(tmp_path, flights, loaded):
+    path = str(tmp_path / 'schedule.sqlite')
+    versions = [f"version-{number}" for number in range(KEPT_VERSIONS + 1)]
+    tables = [ScheduleTable(path, version) for version in versions]
+
+    # During a rolling restart, workers serving the previous model keep finding its predictions.
+    tables[0].update(flights, loaded)
+    tables[1].update(flights, loaded)
+    assert None not in lookup(tables[0], flights, loaded)
+    assert None not in lookup(tables[1], flights, loaded)
+
+    # Older versions are removed once newer ones were updated.
+    for table in tables[2:]:
+        table.update(flights, loaded)
+    assert lookup(tables[0], flights, loaded) == [None] * len(flights)
+    for table in tables[1:]:
+        assert None not in lookup(table, flights, loaded)
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+from interfaces import Flight
+from main import predict_flights
+from latam.registry import ModelRegistry, DATA_DIR
+from latam.scoring import score_file, PREDICTION_COLUMN, PROBABILITY_COLUMN
+
+FLIGHT_FIELDS = [field.alias or name for name, field in Flight.model_fields.items()]
+
+
+@pytest.fixture
+def flights_file(tmp_path, flights_file) -> str:
+    """
+    The flights of the fixture, one of them at a time outside every day period (see OnlineFeaturizer),
+    which /predict scores and Dataset.clean would drop.
+    """
+    flights = pd.read_csv(flights_file, dtype=str)
+    flights.loc[0, 'Fecha-I'] = '2017-01-01 11:59:30'
+    path = str(tmp_path / 'flights.csv')
+    flights.to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture(scope='module')
+def loaded():
+    models = ModelRegistry(str(DATA_DIR / 'model.bin'), str(DATA_DIR / 'categorical_encoder.pickle'), check_interval=float('inf'))
+    return models.get()
+
+
+def assert_matches_api(scored: pd.DataFrame, flights_file: str, loaded) -> None:
+    raw = pd.read_csv(flights_file, dtype=str)[FLIGHT_FIELDS]
+    assert len(scored) == len(raw)
+    complete = raw.notna().all(axis=1).to_numpy()
+    # The flight with a missing value is left unscored, as /predict would reject it.
+    assert not complete.all()
+    assert scored.loc[~complete, PROBABILITY_COLUMN].isna().all()
+
+    flights = [Flight.model_validate(row) for row in raw[complete].to_dict(orient='records')]
+    _, predictions = predict_flights(loaded, flights)
+    probabilities = np.round(predictions.astype(np.float64) * 100, 2)
+    np.testing.assert_array_equal(scored.loc[complete, PROBABILITY_COLUMN].to_numpy(), probabilities)
+    np.testing.assert_array_equal(scored.loc[complete, PREDICTION_COLUMN].to_numpy(dtype=bool), predictions > 0.5)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_scoring_matches_api(tmp_path, flights_file, loaded, workers):
+    output_file = str(tmp_path / 'predictions.csv')
+    summary = score_file(flights_file, output_file, chunksize=64, workers=workers, progress=False)
+    assert summary['rows'] == 300 and summary['unscored_rows'] == 1
+    assert_matches_api(pd.read_csv(output_file), flights_file, loaded)
+
+
+def test_scoring_parquet(tmp_path, flights_file, loaded):
+    pytest.importorskip('pyarrow', exc_type=ImportError)
+    input_file, output_file = str(tmp_path / 'flights.parquet'), str(tmp_path / 'predictions.parquet')
+    pd.read_csv(flights_file, dtype=str, parse_dates=['Fecha-I']).astype({'DIA': 'Int64', 'MES': 'Int64', 'AÑO': 'Int64'}).to_parquet(input_file)
+    score_file(input_file, output_file, chunksize=64, workers=1, progress=False)
+    assert_matches_api(pd.read_parquet(output_file), flights_file, loaded)
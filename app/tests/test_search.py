@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+from latam.dataset import Dataset
+from latam.search import encoded_folds, fold_assignment
+
+
+def test_folds_are_encoded_on_the_delay_indicator(flights_file, cat_encoding_map):
+    ds = Dataset(dataset_file=flights_file)
+    ds.clean()
+    fold_ids = fold_assignment(len(ds.dataset), nfold=3)
+    folds = encoded_folds(ds.dataset, fold_ids)
+
+    # Positions of the target encoded columns among the features.
+    encoded = Dataset(dataset=ds.dataset)
+    encoded.is_data_clean = True
+    encoded.encode(cat_encoding_map=cat_encoding_map)
+    features, _ = encoded.split_target(for_regression=False)
+    categorical = [features.columns.get_loc(column) for column, values in ds.dataset.items() if isinstance(values.dtype, pd.CategoricalDtype)]
+    assert len(folds) == 3 and categorical
+
+    for fold, (X_train, Y_train, X_valid, Y_valid) in enumerate(folds):
+        assert len(X_train) == len(Y_train) == np.count_nonzero(fold_ids != fold)
+        assert len(X_valid) == len(Y_valid) == np.count_nonzero(fold_ids == fold)
+        # The target of the served model, whose encodings are delay rates.
+        assert set(np.unique(np.concatenate([Y_train, Y_valid]))) <= {0, 1}
+        encodings = X_train[:, categorical]
+        assert np.nanmin(encodings) >= 0 and np.nanmax(encodings) <= 1
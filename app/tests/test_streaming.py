@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+from latam.dataset import Dataset
+from latam.streaming import StreamingDataset, FlightDataIter
+
+
+@pytest.fixture(scope='module')
+def in_memory(tmp_path_factory, flights_file):
+    """
+    The flights pre-processed in memory, without anomalies, with the target encodings fitted on them.
+    """
+    ds = Dataset(dataset_file=flights_file)
+    ds.clean()
+    ds.remove_anomalies(threshold=4)
+    ds.encode(encoding_file=str(tmp_path_factory.mktemp('encodings') / 'categorical_encoder.pickle'))
+    return ds
+
+
+@pytest.fixture
+def streaming(flights_file) -> StreamingDataset:
+    # Chunks much smaller than the file, which don't divide it evenly.
+    sds = StreamingDataset(flights_file, chunksize=64, threshold=4)
+    sds.fit_statistics()
+    return sds
+
+
+def test_encodings_match_dataset(in_memory, streaming):
+    assert streaming.cat_encoding_map.keys() == in_memory.cat_encoding_map.keys()
+    for column, target_encoder in in_memory.cat_encoding_map.items():
+        assert streaming.cat_encoding_map[column] == target_encoder, column
+
+
+def test_encoded_chunks_match_dataset(in_memory, streaming):
+    chunks = list(streaming.encoded_chunks(for_regression=False))
+    assert len(chunks) > 1
+    X = pd.concat([X for X, _ in chunks], ignore_index=True)
+    Y = pd.concat([Y for _, Y in chunks], ignore_index=True)
+    expected_X, expected_Y = in_memory.split_target(for_regression=False)
+    assert list(X.columns) == list(expected_X.columns)
+    np.testing.assert_allclose(X.to_numpy(dtype=np.float64), expected_X.to_numpy(dtype=np.float64))
+    np.testing.assert_array_equal(Y.to_numpy(), expected_Y.to_numpy())
+
+
+def test_data_iter_feeds_every_chunk(streaming):
+    batches = []
+    data_iter = FlightDataIter(streaming, for_regression=False)
+    while data_iter.next(lambda data, label: batches.append((data, label))):
+        pass
+    assert sum(len(data) for data, _ in batches) == sum(len(X) for X, _ in streaming.encoded_chunks(for_regression=False))
+    data_iter.reset()
+    assert data_iter.next(lambda data, label: None) == 1
@@ -0,0 +1,63 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from latam.features import HIGH_SEASONS, DAY_PERIODS
+from latam.synthetic_features import SyntheticFeatures
+
+# Dates on the edges of the high seasons and the day periods, as the columnar implementation handles them
+# with integer and time of day comparisons.
+EDGE_DATES = [
+    '2017-12-14 23:59:59', '2017-12-15 00:00:00', '2017-03-03 00:00:00', '2017-03-03 00:00:01', '2017-01-01 00:00:00',
+    '2017-07-14 12:00:00', '2017-07-15 00:00:00', '2017-07-31 00:00:00', '2017-07-31 08:00:00', '2017-08-01 00:00:00',
+    '2017-09-11 05:00:00', '2017-09-30 00:00:00', '2017-09-30 00:00:30', '2016-02-29 11:59:00', '2017-06-15 11:59:30',
+    '2017-06-15 12:00:00', '2017-06-15 18:59:00', '2017-06-15 18:59:59', '2017-06-15 19:00:00', '2017-06-15 04:59:00',
+    '2017-06-15 04:59:30', '2017-06-15 05:00:00',
+]
+
+
+def reference_high_season(date: datetime) -> bool:
+    # The row by row implementation the columnar one replaced.
+    for highSeason in HIGH_SEASONS:
+        start = datetime(date.year, highSeason[0][0], highSeason[0][1])
+        end = datetime(date.year, highSeason[1][0], highSeason[1][1])
+        if start <= date <= end:
+            return True
+        is_cross_year_period = highSeason[0][0] > highSeason[1][0]
+        if is_cross_year_period and (date >= start or date <= end):
+            return True
+    return False
+
+
+def reference_day_period(date: datetime):
+    for dayPeriodLabel, dayPeriod in DAY_PERIODS.items():
+        start = datetime(date.year, date.month, date.day, dayPeriod[0][0], dayPeriod[0][1])
+        end = datetime(date.year, date.month, date.day, dayPeriod[1][0], dayPeriod[1][1])
+        if start <= date <= end:
+            return dayPeriodLabel
+        is_cross_day_period = dayPeriod[0][0] > dayPeriod[1][0]
+        if is_cross_day_period and (date >= start or date <= end):
+            return dayPeriodLabel
+
+
+@pytest.fixture(scope='module')
+def flights(flights_file) -> pd.DataFrame:
+    flights = pd.read_csv(flights_file)
+    edges = pd.DataFrame({'Fecha-I': EDGE_DATES, 'Fecha-O': EDGE_DATES})
+    return pd.concat([flights, edges], ignore_index=True)
+
+
+def test_matches_row_by_row_implementation(flights):
+    sf_df = SyntheticFeatures(flights).compute()
+    dates = flights['Fecha-I'].apply(pd.to_datetime)
+
+    assert sf_df['Temporada alta'].tolist() == dates.apply(reference_high_season).tolist()
+    assert sf_df['Periodo día'].tolist() == dates.apply(reference_day_period).tolist()
+    minutes = (pd.to_datetime(flights['Fecha-O']) - pd.to_datetime(flights['Fecha-I'])).dt.total_seconds() / 60
+    np.testing.assert_array_equal(sf_df['Diferencia en minutos'], minutes)
+    assert sf_df['Atraso menor'].tolist() == minutes.apply(lambda x: x <= 15).tolist()
+
+
+def test_dates_outside_every_period():
+    day_periods = SyntheticFeatures.flightDayPeriod(pd.Series(pd.to_datetime(['2017-06-15 11:59:30', '2017-06-15 18:59:59'])))
+    assert day_periods.tolist() == [None, None]